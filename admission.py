@@ -0,0 +1,221 @@
+"""
+Agent 运行准入控制
+
+每次 Agent 运行都会占用一段时间的 LLM 配额。突发请求同时开始执行时，所有请求
+一起变慢并超过客户端超时。这里在聊天接口前：
+1. 限制同时执行的运行数，其余请求进入有上限的等待队列
+2. 排队超过期限或队列已满时立即拒绝（429 + Retry-After），让客户端稍后重试
+3. 等待队列按 API Key 轮转出队；队列已满时优先挤掉排队最多的 Key 的最新请求，
+   单个调用方的突发不会饿死其他调用方
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Any, Optional, Tuple
+
+# 运行时长滑动平均的权重，用于估算 Retry-After
+_RUN_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """请求未获准入"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """并发上限 + 有界等待队列 + 按 Key 轮转"""
+
+    def __init__(self, max_running: int, max_queue: int, queue_timeout: float, per_key_limit: int = 0):
+        """
+        Args:
+            max_running: 同时执行的运行数上限
+            max_queue: 等待队列长度上限，超出时立即拒绝
+            queue_timeout: 最长排队秒数，超时拒绝
+            per_key_limit: 单个 Key 同时执行的运行数上限，0 表示不限
+        """
+        self.max_running = max_running
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.per_key_limit = per_key_limit
+
+        self._running = 0
+        self._running_by_key: Dict[str, int] = {}
+        # Key -> [(等待者, 入队时间)]；出队时从头部的 Key 开始，服务过的 Key 移到末尾
+        self._queues: "OrderedDict[str, Deque[Tuple[asyncio.Future, float]]]" = OrderedDict()
+        self._queued = 0
+        self._evicted = 0
+        self._run_avg = 0.0
+
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.wait_seconds = 0.0
+        self.wait_max = 0.0
+
+    def _can_run(self, key: str) -> bool:
+        if self._running >= self.max_running:
+            return False
+        return not self.per_key_limit or self._running_by_key.get(key, 0) < self.per_key_limit
+
+    def _start(self, key: str):
+        self._running += 1
+        self._running_by_key[key] = self._running_by_key.get(key, 0) + 1
+        self.admitted += 1
+
+    def _retry_after(self) -> int:
+        """按平均运行时长和排队长度估算多久后可能有空位"""
+        average = self._run_avg or 1.0
+        return max(1, math.ceil(average * (self._queued + 1) / self.max_running))
+
+    def _dequeue(self, key: str, waiter: Tuple[asyncio.Future, float]):
+        queue = self._queues.get(key)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            if not queue:
+                del self._queues[key]
+
+    def _evict_for(self, key: str) -> bool:
+        """队列已满时，若排队最多的 Key 比当前 Key 排得更多，拒绝其最新的请求腾出位置"""
+        if not self._queues:
+            return False
+        longest = max(self._queues, key=lambda k: len(self._queues[k]))
+        mine = len(self._queues.get(key, ()))
+        if len(self._queues[longest]) <= mine + 1:
+            return False
+        waiter = self._queues[longest][-1]
+        self._dequeue(longest, waiter)
+        waiter[0].set_exception(AdmissionRejected("等待队列已满", self._retry_after()))
+        self.rejected_full += 1
+        self._evicted += 1
+        return True
+
+    def _grant(self):
+        """有空位时按 Key 轮转唤醒排队的请求"""
+        while self._queues and self._running < self.max_running:
+            for key, queue in self._queues.items():
+                if self._can_run(key):
+                    break
+            else:
+                # 排队的 Key 都已达到单 Key 上限
+                return
+            future, enqueued_at = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            waited = time.monotonic() - enqueued_at
+            self.wait_seconds += waited
+            self.wait_max = max(self.wait_max, waited)
+            self._start(key)
+            future.set_result(None)
+
+    async def acquire(self, key: str):
+        """等待运行许可
+
+        Raises:
+            AdmissionRejected: 队列已满或排队超时
+        """
+        # 其他 Key 排队只说明它们受单 Key 上限阻塞，不应让本 Key 等待空闲的全局许可
+        if key not in self._queues and self._can_run(key):
+            self._start(key)
+            return
+        if self._queued >= self.max_queue and not self._evict_for(key):
+            self.rejected_full += 1
+            raise AdmissionRejected("等待队列已满", self._retry_after())
+
+        waiter = (asyncio.get_running_loop().create_future(), time.monotonic())
+        self._queues.setdefault(key, deque()).append(waiter)
+        self._queued += 1
+        self.queued_total += 1
+        self._grant()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[0]), self.queue_timeout)
+        except AdmissionRejected:
+            # 被其他 Key 的请求挤出队列
+            raise
+        except asyncio.TimeoutError:
+            if waiter[0].done():
+                # 超时的同时恰好获得许可或被挤出队列
+                if waiter[0].exception() is not None:
+                    raise waiter[0].exception()
+                return
+            self._dequeue(key, waiter)
+            waiter[0].cancel()
+            self.rejected_timeout += 1
+            raise AdmissionRejected("排队超时", self._retry_after())
+        except asyncio.CancelledError:
+            # 客户端断开：已获得的许可要归还，仍在排队的移出队列
+            if waiter[0].done():
+                # 被挤出队列时没有获得许可，无需归还
+                if not waiter[0].cancelled() and waiter[0].exception() is None:
+                    self.release(key)
+            else:
+                self._dequeue(key, waiter)
+                waiter[0].cancel()
+            raise
+
+    def release(self, key: str, elapsed: Optional[float] = None):
+        """归还许可
+
+        Args:
+            elapsed: 本次运行时长，用于估算 Retry-After
+        """
+        self._running -= 1
+        count = self._running_by_key.get(key, 0) - 1
+        if count > 0:
+            self._running_by_key[key] = count
+        else:
+            self._running_by_key.pop(key, None)
+        if elapsed is not None:
+            self._run_avg = elapsed if not self._run_avg else (
+                _RUN_EWMA_ALPHA * elapsed + (1 - _RUN_EWMA_ALPHA) * self._run_avg
+            )
+        self._grant()
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        """在准入许可内执行一次运行"""
+        await self.acquire(key)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(key, time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        """准入统计"""
+        granted_from_queue = self.queued_total - self.rejected_timeout - self._evicted - self._queued
+        return {
+            "running": self._running,
+            "max_running": self.max_running,
+            "queue_depth": self._queued,
+            "queued_keys": len(self._queues),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "queued": self.queued_total,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_seconds_avg": round(self.wait_seconds / granted_from_queue, 3) if granted_from_queue > 0 else 0.0,
+            "wait_seconds_max": round(self.wait_max, 3),
+            "run_seconds_avg": round(self._run_avg, 3),
+        }
+
+
+def create_admission(settings) -> AdmissionController:
+    """按配置创建准入控制器；多进程部署时并发与队列上限按进程数均分"""
+    workers = max(1, settings.workers)
+    return AdmissionController(
+        max_running=max(1, settings.max_concurrent_runs // workers),
+        max_queue=max(0, settings.run_queue_size // workers),
+        queue_timeout=settings.run_queue_timeout,
+        per_key_limit=settings.per_key_max_runs
+    )
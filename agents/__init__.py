@@ -2,7 +2,7 @@
 Agent 模块
 """
 from .base_agent import BaseAgent
-from .repo_agent import RepoAgent
+from .repo_agent import RepoAgent, RepoContext, answer_batch
 from .search_agent import SearchAgent
 
-__all__ = ['BaseAgent', 'RepoAgent', 'SearchAgent']
+__all__ = ['BaseAgent', 'RepoAgent', 'RepoContext', 'SearchAgent', 'answer_batch']
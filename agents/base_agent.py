@@ -1,20 +1,36 @@
 """
 Agent 基类
 """
+import asyncio
 import json
-from typing import List, Dict, Any, Optional
-from llm_client import LLMClient
+import time
+from typing import List, Dict, Any, Optional, Callable, Awaitable
 from tools import GiteeTools
 from config import get_settings
+from client_pool import ClientPool, get_client_pool
+from context_budget import ContextBudget
+import metrics
+import tracing
+
+# 进度事件回调：接收 {"type": ..., ...} 形式的事件
+EventCallback = Callable[[Dict[str, Any]], Awaitable[None]]
 
 
 class BaseAgent:
     """Agent 基类，提供通用的 Agent 功能"""
     
-    def __init__(self):
-        self.llm = LLMClient()
-        self.tools = GiteeTools()
+    def __init__(self, pool: Optional[ClientPool] = None):
+        """
+        Args:
+            pool: 共享客户端池，默认使用进程级单例
+        """
+        pool = pool or get_client_pool()
+        self.llm = pool.llm
+        self.tools = GiteeTools(client=pool.gitee, snapshots=pool.snapshots,
+                                decoded_files=pool.decoded_files)
+        self.tool_limiter = pool.tool_limiter
         self.settings = get_settings()
+        self.stream = self.settings.llm_stream
         self.conversation_history: List[Dict[str, str]] = []
         self.tool_calls_log: List[Dict[str, Any]] = []
     
@@ -30,16 +46,168 @@ class BaseAgent:
         self.conversation_history = []
         self.tool_calls_log = []
     
-    def run(self, user_input: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+    async def _execute_tool(self, call_id: str, function_name: str, function_args: Dict[str, Any],
+                            emit: Optional[EventCallback] = None) -> Dict[str, Any]:
+        """在并发限制内执行单个工具，提供 emit 时上报开始和结束事件；工具抛出的异常转为错误结果"""
+        async with self.tool_limiter.slot(function_name):
+            if emit:
+                await emit({"type": "tool_start", "id": call_id, "name": function_name,
+                            "arguments": function_args})
+            start = time.perf_counter()
+            try:
+                result = await self.tools.execute_tool(function_name, function_args)
+            except Exception as e:
+                # 单个工具异常不影响同一轮的其他调用，作为工具错误返回给模型
+                result = {"error": f"工具执行失败: {type(e).__name__}: {e}"}
+            if emit:
+                event = {"type": "tool_end", "id": call_id, "name": function_name,
+                         "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)}
+                if isinstance(result, dict) and result.get("error"):
+                    event["error"] = result["error"]
+                await emit(event)
+            return result
+    
+    @staticmethod
+    def _argument_error(error: ValueError) -> asyncio.Future:
+        """参数 JSON 无法解析时，直接以工具错误作为该调用的结果"""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result({"error": f"工具参数不是合法的 JSON: {error}"})
+        return future
+    
+    async def _stream_turn(self, messages: List[Dict[str, Any]],
+                           emit: Optional[EventCallback] = None) -> Dict[str, Any]:
+        """以流式方式完成一轮 LLM 调用
+        
+        工具调用的参数 JSON 一旦完整就立即开始执行，与模型继续生成后续
+        工具调用重叠；提供 emit 时文本增量通过 token 事件上报。
+        
+        Returns:
+            {"content": 文本, "tool_calls": 按 index 合并后的工具调用,
+             "arguments": 解析后的参数, "results": 执行中的工具任务}，失败时为 {"error": ...}
+        """
+        content_parts: List[str] = []
+        reported_usage: Optional[Dict[str, Any]] = None
+        calls: Dict[int, Dict[str, Any]] = {}
+        arguments: Dict[int, Dict[str, Any]] = {}
+        results: Dict[int, asyncio.Future] = {}
+        
+        def dispatch(index: int, final: bool = False):
+            """参数完整时开始执行；final 表示该调用不会再有增量"""
+            if index in results:
+                return
+            call = calls[index]
+            raw = call["function"]["arguments"]
+            if not final and not raw.rstrip().endswith("}"):
+                return
+            try:
+                arguments[index] = json.loads(raw or "{}")
+            except ValueError as e:
+                if not final:
+                    return
+                arguments[index] = {}
+                results[index] = self._argument_error(e)
+                return
+            results[index] = asyncio.ensure_future(self._execute_tool(
+                call["id"], call["function"]["name"], arguments[index], emit
+            ))
+        
+        try:
+            async for chunk in self.llm.stream_chat(
+                messages=messages,
+                tools=self.tools.get_tools_definition(),
+                tool_choice="auto"
+            ):
+                if isinstance(chunk, dict):
+                    for future in results.values():
+                        future.cancel()
+                    return {"error": chunk.get("error")}
+                # 部分服务在最后一块中附带 usage
+                usage = getattr(chunk, "usage", None)
+                if usage:
+                    reported_usage = usage if isinstance(usage, dict) else usage.model_dump()
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    if emit:
+                        await emit({"type": "token", "content": delta.content})
+                for tc in delta.tool_calls or []:
+                    if tc.index not in calls:
+                        # 新调用开始，之前的调用参数均已生成完毕
+                        for index in calls:
+                            dispatch(index, final=True)
+                        calls[tc.index] = {
+                            "id": "", "type": "function", "function": {"name": "", "arguments": ""}
+                        }
+                    call = calls[tc.index]
+                    if tc.id:
+                        call["id"] = tc.id
+                    if tc.function and tc.function.name:
+                        call["function"]["name"] += tc.function.name
+                    if tc.function and tc.function.arguments:
+                        call["function"]["arguments"] += tc.function.arguments
+                        dispatch(tc.index)
+        except BaseException:
+            for future in results.values():
+                future.cancel()
+            raise
+        
+        for index in calls:
+            dispatch(index, final=True)
+        order = sorted(calls)
+        return {
+            "content": "".join(content_parts),
+            "tool_calls": [calls[i] for i in order],
+            "arguments": [arguments[i] for i in order],
+            "results": [results[i] for i in order],
+            "usage": reported_usage
+        }
+    
+    @staticmethod
+    def _record_tokens(usage: Dict[str, Any], reported: Optional[Dict[str, Any]], budget: ContextBudget,
+                       content: str, tool_calls: List[Dict[str, Any]]):
+        """记录本轮 token 用量：优先使用服务端返回的 usage，否则按本地计数估算"""
+        if reported and reported.get("prompt_tokens") is not None:
+            metrics.llm_tokens.inc("prompt", "reported", amount=reported["prompt_tokens"])
+            metrics.llm_tokens.inc("completion", "reported", amount=reported.get("completion_tokens") or 0)
+            usage["completion_tokens"] = reported.get("completion_tokens")
+            return
+        completion = budget.counter.count(content) + sum(
+            budget.counter.count(call["function"]["arguments"]) for call in tool_calls
+        )
+        metrics.llm_tokens.inc("prompt", "estimated", amount=usage["prompt_tokens"])
+        metrics.llm_tokens.inc("completion", "estimated", amount=completion)
+        usage["completion_tokens"] = completion
+    
+    def _finish(self, iterations: int, outcome: str):
+        """记录一次 Agent 运行的迭代次数"""
+        metrics.agent_iterations.observe(iterations, type(self).__name__, outcome)
+    
+    async def run(self, user_input: str, system_prompt: Optional[str] = None,
+                  emit: Optional[EventCallback] = None) -> Dict[str, Any]:
         """运行 Agent
         
         Args:
             user_input: 用户输入
             system_prompt: 系统提示词
+            emit: 进度事件回调，上报工具调用的开始 / 结束以及回答文本的增量
+                （提供时总是使用流式补全）
             
         Returns:
             Agent 响应结果
         """
+        with tracing.span("agent.run", agent=type(self).__name__) as span:
+            result = await self._run(user_input, system_prompt, emit)
+            span.set(iterations=result.get("iterations"), success=result["success"],
+                     tool_calls=len(self.tool_calls_log))
+            if not result["success"]:
+                span.fail(result.get("error") or "")
+            return result
+    
+    async def _run(self, user_input: str, system_prompt: Optional[str],
+                   emit: Optional[EventCallback]) -> Dict[str, Any]:
+        """Agent 循环，每轮迭代记录一个 span"""
         # 构建消息列表
         messages = []
         
@@ -61,33 +229,50 @@ class BaseAgent:
         # 运行 Agent 循环
         iterations = 0
         max_iterations = self.settings.max_iterations
+        budget = ContextBudget.for_model(self.llm.model, self.settings)
+        token_usage: List[Dict[str, Any]] = []
         
         while iterations < max_iterations:
             iterations += 1
-            
-            # 调用 LLM
-            response = self.llm.chat(
-                messages=messages,
-                tools=self.tools.get_tools_definition(),
-                tool_choice="auto"
-            )
-            
-            if not response.get("success"):
-                return {
-                    "success": False,
-                    "error": response.get("error"),
-                    "tool_calls": self.tool_calls_log
-                }
-            
-            assistant_message = response["response"].choices[0].message
-            
-            # 检查是否需要调用工具
-            if assistant_message.tool_calls:
-                # 添加助手消息
-                messages.append({
-                    "role": "assistant",
-                    "content": assistant_message.content or "",
-                    "tool_calls": [
+            with tracing.span("agent.iteration", iteration=iterations) as iteration_span:
+                # 按模型预算压缩上下文，并记录本轮 token 数
+                usage = budget.fit(messages)
+                token_usage.append({"iteration": iterations, **usage})
+                iteration_span.set(prompt_tokens=usage["prompt_tokens"], trimmed_tokens=usage.get("trimmed_tokens"))
+                
+                # 调用 LLM
+                if self.stream or emit:
+                    turn = await self._stream_turn(messages, emit)
+                    if turn.get("error"):
+                        self._finish(iterations, "error")
+                        return {
+                            "success": False,
+                            "error": turn["error"],
+                            "tool_calls": self.tool_calls_log,
+                            "token_usage": token_usage
+                        }
+                    content = turn["content"]
+                    tool_calls = turn["tool_calls"]
+                    self._record_tokens(usage, turn["usage"], budget, content, tool_calls)
+                else:
+                    response = await self.llm.chat(
+                        messages=messages,
+                        tools=self.tools.get_tools_definition(),
+                        tool_choice="auto"
+                    )
+                
+                    if not response.get("success"):
+                        self._finish(iterations, "error")
+                        return {
+                            "success": False,
+                            "error": response.get("error"),
+                            "tool_calls": self.tool_calls_log,
+                            "token_usage": token_usage
+                        }
+                
+                    assistant_message = response["response"].choices[0].message
+                    content = assistant_message.content or ""
+                    tool_calls = [
                         {
                             "id": tc.id,
                             "type": tc.type,
@@ -96,51 +281,86 @@ class BaseAgent:
                                 "arguments": tc.function.arguments
                             }
                         }
-                        for tc in assistant_message.tool_calls
+                        for tc in assistant_message.tool_calls or []
                     ]
-                })
+                    self._record_tokens(usage, response["usage"], budget, content, tool_calls)
+                    turn = None
+                iteration_span.set(completion_tokens=usage["completion_tokens"], tool_calls=len(tool_calls))
                 
-                # 执行工具调用
-                for tool_call in assistant_message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    
-                    # 记录工具调用
-                    self.tool_calls_log.append({
-                        "function": function_name,
-                        "arguments": function_args
-                    })
-                    
-                    # 执行工具
-                    tool_response = self.tools.execute_tool(function_name, function_args)
-                    
-                    # 添加工具响应
+                # 检查是否需要调用工具
+                if tool_calls:
+                    # 添加助手消息
                     messages.append({
-                        "role": "tool",
-                        "content": json.dumps(tool_response, ensure_ascii=False),
-                        "tool_call_id": tool_call.id
+                        "role": "assistant",
+                        "content": content,
+                        "tool_calls": tool_calls
                     })
                 
-                # 继续下一轮迭代
-                continue
-            else:
-                # 没有工具调用，返回最终答案
-                final_answer = assistant_message.content or ""
+                    if turn is not None:
+                        # 流式补全时工具已在生成过程中陆续开始执行
+                        function_args_list = turn["arguments"]
+                        pending = turn["results"]
+                    else:
+                        # 执行工具调用：同一轮的多个调用并发执行
+                        function_args_list = []
+                        pending = []
+                        for tool_call in tool_calls:
+                            try:
+                                function_args = json.loads(tool_call["function"]["arguments"] or "{}")
+                            except ValueError as e:
+                                function_args_list.append({})
+                                pending.append(self._argument_error(e))
+                                continue
+                            function_args_list.append(function_args)
+                            pending.append(self._execute_tool(
+                                tool_call["id"], tool_call["function"]["name"], function_args, emit
+                            ))
+                
+                    # 记录工具调用
+                    for tool_call, function_args in zip(tool_calls, function_args_list):
+                        self.tool_calls_log.append({
+                            "function": tool_call["function"]["name"],
+                            "arguments": function_args
+                        })
+                
+                    tool_responses = await asyncio.gather(*pending)
+                
+                    # 按原始 tool_call_id 顺序添加工具响应
+                    for tool_call, tool_response in zip(tool_calls, tool_responses):
+                        with tracing.span("tool.output", tool=tool_call["function"]["name"]) as output_span:
+                            serialized = json.dumps(tool_response, ensure_ascii=False)
+                            clipped = budget.clip_tool_output(serialized)
+                            output_span.set(result_chars=len(serialized), clipped_chars=len(serialized) - len(clipped))
+                        messages.append({
+                            "role": "tool",
+                            "content": clipped,
+                            "tool_call_id": tool_call["id"]
+                        })
+                
+                    # 继续下一轮迭代
+                    continue
+                else:
+                    # 没有工具调用，返回最终答案
+                    final_answer = content
                 
-                # 保存对话历史
-                self.add_message("user", user_input)
-                self.add_message("assistant", final_answer)
+                    # 保存对话历史
+                    self.add_message("user", user_input)
+                    self.add_message("assistant", final_answer)
+                    self._finish(iterations, "ok")
                 
-                return {
-                    "success": True,
-                    "answer": final_answer,
-                    "tool_calls": self.tool_calls_log,
-                    "iterations": iterations
-                }
+                    return {
+                        "success": True,
+                        "answer": final_answer,
+                        "tool_calls": self.tool_calls_log,
+                        "iterations": iterations,
+                        "token_usage": token_usage
+                    }
         
         # 达到最大迭代次数
+        self._finish(iterations, "max_iterations")
         return {
             "success": False,
             "error": f"达到最大迭代次数 {max_iterations}",
-            "tool_calls": self.tool_calls_log
+            "tool_calls": self.tool_calls_log,
+            "token_usage": token_usage
         }
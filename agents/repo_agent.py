@@ -1,28 +1,117 @@
 """
 仓库问答 Agent
 """
-from typing import Dict, Any
-from .base_agent import BaseAgent
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncContextManager, AsyncIterator, Callable, Dict, Any, List, Optional
+from .base_agent import BaseAgent, EventCallback
+from client_pool import ClientPool
+from context_budget import TokenCounter
+
+
+@dataclass
+class RepoContext:
+    """预先读取的仓库上下文，批量问答时所有问题共用"""
+    owner: str
+    repo: str
+    branch: str
+    # 解析后的提交 SHA，所有问题读取同一版本，工具结果可以无限期缓存
+    ref: str
+    description: Optional[str] = None
+    readme: Optional[str] = None
+    outline: Optional[str] = None
+    file_count: int = 0
+    # 仓库信息读取失败的原因（如仓库不存在）
+    error: Optional[str] = None
+
+    def prompt_section(self) -> str:
+        """写入系统提示词的上下文段落"""
+        parts = []
+        if self.description:
+            parts.append(f"仓库简介：{self.description}")
+        if self.readme:
+            parts.append(f"README：\n{self.readme}")
+        if self.outline:
+            parts.append(f"目录概览（共 {self.file_count} 个文件）：\n{self.outline}")
+        return "\n\n".join(parts)
 
 
 class RepoAgent(BaseAgent):
     """仓库问答 Agent，专门用于回答关于 Gitee 仓库的问题"""
     
-    def __init__(self):
-        super().__init__()
+    def __init__(self, pool: Optional[ClientPool] = None, snapshot: bool = False):
+        """
+        Args:
+            pool: 共享客户端池
+            snapshot: 是否启用快照模式（整仓下载一次，文件工具在本地完成）
+        """
+        super().__init__(pool)
+        self.snapshot = snapshot
+    
+    async def prepare_context(self, repo_owner: str, repo_name: str, ref: Optional[str] = None,
+                              max_tokens: int = 1500) -> RepoContext:
+        """读取仓库简介、README 和目录概览，供多个问题共用
+        
+        Args:
+            repo_owner: 仓库所有者
+            repo_name: 仓库名称
+            ref: 分支名称，默认为仓库默认分支
+            max_tokens: README 和目录概览各自的 token 上限
+        """
+        if self.snapshot:
+            self.tools.enable_snapshot(repo_owner, repo_name)
+        client = self.tools.client
+        branch = ref or await client.get_default_branch(repo_owner, repo_name)
+        sha = await client.resolve_ref(repo_owner, repo_name, branch)
+        info, readme, outline = await asyncio.gather(
+            self.tools.get_repo_info(repo_owner, repo_name),
+            self.tools.get_readme(repo_owner, repo_name, sha),
+            self.tools.get_repo_outline(repo_owner, repo_name, sha)
+        )
+        counter = TokenCounter(self.llm.model)
+        return RepoContext(
+            owner=repo_owner,
+            repo=repo_name,
+            branch=branch,
+            ref=sha,
+            description=info.get("description"),
+            readme=counter.window(readme["content"], max_tokens) if readme.get("content") else None,
+            outline=counter.window(outline["outline"], max_tokens) if outline.get("outline") else None,
+            file_count=outline.get("file_count", 0),
+            error=info.get("error")
+        )
     
-    def chat(self, repo_owner: str, repo_name: str, question: str, ref: str = "master") -> Dict[str, Any]:
+    async def chat(self, repo_owner: str, repo_name: str, question: str, ref: Optional[str] = None,
+                   emit: Optional[EventCallback] = None, context: Optional[RepoContext] = None) -> Dict[str, Any]:
         """与仓库对话
         
         Args:
             repo_owner: 仓库所有者
             repo_name: 仓库名称
             question: 用户问题
-            ref: 分支名称
+            ref: 分支名称，默认为仓库默认分支
+            emit: 进度事件回调，用于流式接口
+            context: 预先读取的仓库上下文，提供时写入系统提示词，Agent 无需再读取 README 和目录概览
             
         Returns:
             Agent 响应
         """
+        if context is not None:
+            ref = context.ref
+        # 未指定分支时使用仓库的默认分支，避免 Agent 在 master / main 之间反复试错
+        if not ref:
+            ref = await self.tools.client.get_default_branch(repo_owner, repo_name)
+        
+        if self.snapshot:
+            self.tools.enable_snapshot(repo_owner, repo_name)
+        
+        # 预读的上下文放在问题之前，同一批问题的系统提示词前缀相同
+        known = ""
+        if context is not None:
+            known = ("\n以下仓库信息已预先读取，不需要再调用 get_readme / get_repo_outline：\n\n"
+                     f"{context.prompt_section()}\n")
+        
         # 构建系统提示词
         system_prompt = f"""你是一个专业的代码分析助手，专门帮助用户理解和分析 Gitee 上的开源仓库。
 
@@ -32,10 +121,12 @@ class RepoAgent(BaseAgent):
 你可以使用以下工具来获取仓库信息：
 1. get_repo_info - 获取仓库基本信息
 2. get_readme - 读取 README 文件
-3. list_directory - 列出目录结构
-4. get_file_content - 读取文件内容
-5. search_code - 在仓库中搜索代码
-6. get_commits - 查看提交历史
+3. get_repo_outline - 一次获取整个仓库的目录概览
+4. list_directory - 列出目录结构
+5. find_files - 按 glob 模式查找文件
+6. get_file_content - 读取文件内容
+7. search_code - 在仓库中搜索代码
+8. get_commits - 查看提交历史
 
 工作流程：
 1. 首先理解用户的问题
@@ -44,29 +135,115 @@ class RepoAgent(BaseAgent):
 4. 综合分析后给出详细、准确的回答
 
 注意事项：
-- 如果问题涉及整体结构，先查看 README 和目录结构
-- 如果问题涉及具体代码实现，使用 get_file_content 读取相关文件
+- 调用工具时使用上面的分支作为 ref
+- 如果问题涉及整体结构，先查看 README 和 get_repo_outline，不要逐级调用 list_directory
+- 如果问题涉及具体代码实现，使用 get_file_content 读取相关文件；大文件优先用 around 或 start_line / end_line 只读取相关片段
 - 如果需要查找特定功能，使用 search_code
 - 回答要基于实际的仓库内容，不要臆测
 - 提供具体的代码路径和文件名作为引用
 - 用中文回答，保持专业和友好的语气
-
+{known}
 用户的问题是：{question}
 
 请开始分析并回答。"""
         
         # 运行 Agent
-        result = self.run(user_input=question, system_prompt=system_prompt)
+        result = await self.run(user_input=question, system_prompt=system_prompt, emit=emit)
         
         if result.get("success"):
             return {
                 "answer": result["answer"],
                 "tool_calls": result["tool_calls"],
-                "iterations": result["iterations"]
+                "iterations": result["iterations"],
+                "token_usage": result["token_usage"]
             }
         else:
             return {
                 "answer": f"抱歉，处理您的问题时遇到错误：{result.get('error')}",
                 "tool_calls": result.get("tool_calls", []),
+                "token_usage": result.get("token_usage", []),
                 "error": result.get("error")
             }
+
+
+async def answer_batch(repo_owner: str, repo_name: str, questions: List[str], ref: Optional[str] = None,
+                       concurrency: int = 4, snapshot: bool = False, context_tokens: int = 1500,
+                       pool: Optional[ClientPool] = None,
+                       slot: Optional[Callable[[], AsyncContextManager]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """批量回答同一仓库的多个问题
+    
+    先读取一次仓库上下文（README、目录概览，ref 解析为提交 SHA），所有问题共用；
+    问题在并发上限内各自由独立的 Agent 回答，按完成顺序产出事件：
+    context（上下文就绪）、answer（每个问题一条）、done（全部完成）；上下文读取失败时产出 error 后结束。
+    
+    Args:
+        repo_owner: 仓库所有者
+        repo_name: 仓库名称
+        questions: 问题列表
+        ref: 分支名称，默认为仓库默认分支
+        concurrency: 同时回答的问题数
+        snapshot: 是否启用快照模式
+        context_tokens: 预读的 README 和目录概览各自的 token 上限
+        pool: 共享客户端池
+        slot: 每个问题运行前进入的上下文（如运行许可），获取失败时该问题返回 error
+    """
+    start = time.perf_counter()
+    context = await RepoAgent(pool, snapshot=snapshot).prepare_context(
+        repo_owner, repo_name, ref, max_tokens=context_tokens
+    )
+    if context.error:
+        yield {"type": "error", "message": f"无法读取仓库 {repo_owner}/{repo_name}: {context.error}"}
+        return
+    yield {
+        "type": "context",
+        "repo": f"{repo_owner}/{repo_name}",
+        "branch": context.branch,
+        "ref": context.ref,
+        "readme": context.readme is not None,
+        "file_count": context.file_count,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run(question: str) -> Dict[str, Any]:
+        agent = RepoAgent(pool, snapshot=snapshot)
+        if slot is None:
+            return await agent.chat(repo_owner, repo_name, question, context=context)
+        async with slot():
+            return await agent.chat(repo_owner, repo_name, question, context=context)
+    
+    async def answer(index: int, question: str) -> Dict[str, Any]:
+        async with semaphore:
+            began = time.perf_counter()
+            event: Dict[str, Any] = {"type": "answer", "index": index, "question": question}
+            try:
+                result = await run(question)
+            except Exception as e:
+                event["error"] = f"处理请求时出错: {str(e)}"
+            else:
+                event["answer"] = result["answer"]
+                event["tool_calls"] = [call["function"] for call in result.get("tool_calls", [])]
+                event["iterations"] = result.get("iterations")
+                if result.get("error"):
+                    event["error"] = result["error"]
+            event["elapsed_ms"] = round((time.perf_counter() - began) * 1000, 1)
+            return event
+    
+    tasks = [asyncio.create_task(answer(index, question)) for index, question in enumerate(questions)]
+    failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            event = await next_done
+            failed += 1 if event.get("error") else 0
+            yield event
+    finally:
+        # 调用方提前结束（客户端断开）时取消剩余的问题
+        for task in tasks:
+            task.cancel()
+    yield {
+        "type": "done",
+        "count": len(questions),
+        "failed": failed,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
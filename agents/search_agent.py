@@ -2,21 +2,24 @@
 技术搜索 Agent
 """
 from typing import Dict, Any, Optional
-from .base_agent import BaseAgent
+from .base_agent import BaseAgent, EventCallback
+from client_pool import ClientPool
 
 
 class SearchAgent(BaseAgent):
     """技术搜索 Agent，帮助用户找到技术问题的开源解决方案"""
     
-    def __init__(self):
-        super().__init__()
+    def __init__(self, pool: Optional[ClientPool] = None):
+        super().__init__(pool)
     
-    def search(self, question: str, language: Optional[str] = None) -> Dict[str, Any]:
+    async def search(self, question: str, language: Optional[str] = None,
+                     emit: Optional[EventCallback] = None) -> Dict[str, Any]:
         """搜索技术解决方案
         
         Args:
             question: 技术问题
             language: 编程语言过滤（可选）
+            emit: 进度事件回调，用于流式接口
             
         Returns:
             Agent 响应
@@ -55,17 +58,19 @@ class SearchAgent(BaseAgent):
 请开始搜索并提供建议。"""
         
         # 运行 Agent
-        result = self.run(user_input=question, system_prompt=system_prompt)
+        result = await self.run(user_input=question, system_prompt=system_prompt, emit=emit)
         
         if result.get("success"):
             return {
                 "answer": result["answer"],
                 "tool_calls": result["tool_calls"],
-                "iterations": result["iterations"]
+                "iterations": result["iterations"],
+                "token_usage": result["token_usage"]
             }
         else:
             return {
                 "answer": f"抱歉，搜索时遇到错误：{result.get('error')}",
                 "tool_calls": result.get("tool_calls", []),
+                "token_usage": result.get("token_usage", []),
                 "error": result.get("error")
             }
@@ -0,0 +1,690 @@
+#!/usr/bin/env python3
+"""
+Chat2Repo 性能基准
+
+基于 mock_upstream 中的本地替身服务运行，不需要真实的 Gitee / LLM 凭据。
+
+用法:
+    python bench.py load --requests 20 --concurrency 10
+    python bench.py pool --requests 50
+    python bench.py snapshot --rounds 20
+    python bench.py codesearch --files 100000
+    python bench.py herd --agents 20
+    python bench.py streaming --tool-calls 5 --chunk-interval 0.01
+    python bench.py rawread --size-mb 4
+    python bench.py sessions --sessions 100000
+    python bench.py sessionlist --sessions 1000000
+    python bench.py burst --requests 40 --max-runs 4 --queue 16
+    python bench.py batch --questions 50 --concurrency 4
+    python bench.py metrics --ops 1000000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import List
+
+
+def _setup_env(gitee_latency: float, llm_latency: float,
+               stream_interval: float = 0.0, tool_calls_per_turn: int = 1):
+    """启动替身服务并把配置指向它们（必须在导入应用模块之前调用）"""
+    from mock_upstream import start_mock_gitee, start_mock_llm
+
+    gitee_server, gitee_base = start_mock_gitee(latency=gitee_latency)
+    llm_server, llm_base = start_mock_llm(latency=llm_latency, stream_interval=stream_interval,
+                                 tool_calls_per_turn=tool_calls_per_turn)
+    os.environ["GITEE_API_BASE"] = gitee_base
+    os.environ["GITEE_ACCESS_TOKEN"] = "bench"
+    os.environ["OPENAI_API_BASE"] = llm_base
+    os.environ["OPENAI_API_KEY"] = "bench"
+    # 替身服务没有配额，默认不让令牌桶成为瓶颈
+    os.environ.setdefault("GITEE_RATE_LIMIT", "1000")
+    os.environ.setdefault("GITEE_RATE_BURST", "1000")
+    return gitee_server, llm_server
+
+
+def _summary(name: str, latencies: List[float], wall: float):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{name:<24} n={len(latencies):<4} wall={wall:7.3f}s  "
+          f"mean={statistics.mean(latencies) * 1000:9.3f}ms  p95={p95 * 1000:9.3f}ms  "
+          f"throughput={len(latencies) / wall:6.2f} req/s")
+
+
+async def _fire(client, total: int, concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/api/chat/repo", json={
+                "repo_owner": "mock", "repo_name": "demo", "question": f"问题 {i}",
+            })
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return latencies
+
+
+async def bench_load(args):
+    """并发压测 /api/chat/repo，对比串行与并发下的吞吐"""
+    import httpx
+    from main import app
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=300) as client:
+        for concurrency in (1, args.concurrency):
+            start = time.perf_counter()
+            latencies = await _fire(client, args.requests, concurrency)
+            _summary(f"concurrency={concurrency}", latencies, time.perf_counter() - start)
+
+
+async def bench_pool(args):
+    """对比每请求新建客户端栈与共享客户端池的单请求延迟"""
+    from agents import RepoAgent
+    from client_pool import ClientPool
+
+    async def run(pool):
+        agent = RepoAgent(pool=pool)
+        return await agent.chat("mock", "demo", "这个项目是做什么的？")
+
+    fresh: List[float] = []
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        t0 = time.perf_counter()
+        pool = ClientPool()
+        await run(pool)
+        await pool.aclose()
+        fresh.append(time.perf_counter() - t0)
+    _summary("per-request clients", fresh, time.perf_counter() - start)
+
+    shared: List[float] = []
+    pool = ClientPool()
+    await run(pool)  # 预热连接
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        t0 = time.perf_counter()
+        await run(pool)
+        shared.append(time.perf_counter() - t0)
+    _summary("shared pool", shared, time.perf_counter() - start)
+    await pool.aclose()
+
+
+async def bench_snapshot(args):
+    """对比 API 模式与快照模式下文件工具的单次调用延迟"""
+    from client_pool import ClientPool
+    from mock_upstream import make_sample_repo
+    from tools import GiteeTools
+
+    paths = sorted(make_sample_repo())
+    pool = ClientPool()
+
+    async def measure(tools) -> List[float]:
+        latencies = []
+        for _ in range(args.rounds):
+            for path in paths:
+                t0 = time.perf_counter()
+                result = await tools.get_file_content("mock", "demo", path)
+                latencies.append(time.perf_counter() - t0)
+                assert "error" not in result, result
+            t0 = time.perf_counter()
+            await tools.list_directory("mock", "demo", "app")
+            latencies.append(time.perf_counter() - t0)
+        return latencies
+
+    api_tools = GiteeTools(client=pool.gitee)
+    start = time.perf_counter()
+    latencies = await measure(api_tools)
+    _summary("api (cached)", latencies, time.perf_counter() - start)
+
+    snapshot_tools = GiteeTools(client=pool.gitee, snapshots=pool.snapshots)
+    snapshot_tools.enable_snapshot("mock", "demo")
+    t0 = time.perf_counter()
+    await snapshot_tools.get_readme("mock", "demo")
+    print(f"{'snapshot download':<24} {(time.perf_counter() - t0) * 1000:.1f}ms")
+    start = time.perf_counter()
+    latencies = await measure(snapshot_tools)
+    _summary("snapshot", latencies, time.perf_counter() - start)
+    print(f"snapshots: {pool.snapshots.stats()}")
+    await pool.aclose()
+
+
+class _SyntheticRepo:
+    """内存中的合成仓库，提供 paths() / read() 供索引使用"""
+
+    def __init__(self, files: int, lines: int, seed: int = 42):
+        import random
+        rng = random.Random(seed)
+        words = [f"{a}{b}" for a in ("get", "set", "load", "parse", "build", "handle", "init", "read")
+                 for b in ("User", "Config", "Repo", "Tree", "Cache", "Token", "Session", "Index", "Blob")]
+        self.files = {}
+        for i in range(files):
+            body = []
+            for j in range(lines):
+                name = rng.choice(words)
+                body.append(f"    result_{j} = {name}(ctx, {rng.randint(0, 9999)})")
+            path = f"pkg{i % 100}/mod{i // 100}/file_{i}.py"
+            self.files[path] = (f"def func_{i}(ctx):\n" + "\n".join(body) + "\n").encode("utf-8")
+
+    def paths(self):
+        return list(self.files)
+
+    def read(self, path):
+        return self.files.get(path)
+
+
+async def bench_codesearch(args):
+    """合成仓库上的 trigram 索引构建时间与查询延迟"""
+    import resource
+    from code_search import TrigramIndex
+
+    t0 = time.perf_counter()
+    repo = _SyntheticRepo(args.files, args.lines)
+    total_bytes = sum(len(v) for v in repo.files.values())
+    print(f"generated {args.files} files ({total_bytes / 1e6:.1f} MB) in {time.perf_counter() - t0:.1f}s")
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    index = TrigramIndex(repo)
+    index.build()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stats = index.stats()
+    print(f"build: {stats['build_seconds']:.1f}s  trigrams={stats['trigrams']}  "
+          f"postings={stats['posting_bytes'] / 1e6:.1f} MB  max_rss_growth={(rss_after - rss_before) / 1024:.1f} MB")
+
+    queries = [
+        ("func_4242(", False),
+        ("parseToken", False),
+        (r"def func_9\d{3}\(", True),
+        (r"result_\d+ = loadBlob\(ctx, 77\d\d\)", True),
+    ]
+    for query, regex in queries:
+        latencies = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            result = index.search(query, regex=regex)
+            latencies.append(time.perf_counter() - start)
+        print(f"{query!r:<48} candidates={result['candidates']:<7} matches={result['count']:<3} "
+              f"mean={statistics.mean(latencies) * 1000:8.2f}ms")
+
+
+async def bench_herd(args):
+    """同一时刻多个 Agent 读取同一仓库时，上游实际收到的请求数"""
+    from client_pool import ClientPool
+    from tools import GiteeTools
+
+    pool = ClientPool()
+    tools = GiteeTools(client=pool.gitee)
+
+    async def agent():
+        await asyncio.gather(
+            tools.get_repo_info("mock", "demo"),
+            tools.get_readme("mock", "demo"),
+            tools.list_directory("mock", "demo", ""),
+        )
+
+    before = args.gitee_server.request_count
+    start = time.perf_counter()
+    await asyncio.gather(*(agent() for _ in range(args.agents)))
+    wall = time.perf_counter() - start
+    print(f"{args.agents} agents: wall={wall * 1000:.1f}ms  "
+          f"upstream_requests={args.gitee_server.request_count - before}")
+    print(f"singleflight: {pool.gitee.inflight.stats()}")
+    await pool.aclose()
+
+
+async def bench_streaming(args):
+    """对比非流式与流式补全（工具参数完整即执行）下单次 Agent 运行的延迟"""
+    from agents import RepoAgent
+    from client_pool import ClientPool
+
+    latencies = {False: [], True: []}
+    walls = {False: 0.0, True: 0.0}
+    for _ in range(args.rounds):
+        for stream in (False, True):
+            # 每次使用新的客户端池，避免缓存掩盖 Gitee 往返
+            pool = ClientPool()
+            agent = RepoAgent(pool=pool)
+            agent.stream = stream
+            t0 = time.perf_counter()
+            result = await agent.chat("mock", "demo", "这个项目是做什么的？", ref="master")
+            elapsed = time.perf_counter() - t0
+            assert "error" not in result, result
+            latencies[stream].append(elapsed)
+            walls[stream] += elapsed
+            await pool.aclose()
+    _summary("non-streaming", latencies[False], walls[False])
+    _summary("streaming + dispatch", latencies[True], walls[True])
+
+
+async def bench_rawread(args):
+    """对比 contents 接口（Base64 JSON）与 raw 接口读取大文件的传输字节数和峰值内存"""
+    from client_pool import ClientPool
+
+    size = int(args.size_mb * 1024 * 1024)
+    line = "    value = compute(ctx, '中文注释')  # 示例\n"
+    text = line * (size // len(line.encode("utf-8")) + 1)
+    files = {
+        "big_utf8.py": text.encode("utf-8"),
+        "big_gbk.py": text.encode("gbk"),
+        "big.png": b"\x89PNG\r\n\x1a\n" + os.urandom(size),
+    }
+    server = args.gitee_server
+    server.files.update(files)
+
+    async def read_json(client, path, ref):
+        result = await client._request("GET", f"/repos/mock/demo/contents/{path}",
+                                       params={"ref": ref}, cache=False)
+        client._decode_content(result)
+        return result
+
+    async def read_raw(client, path, ref):
+        return await client.get_file_content("mock", "demo", path, ref)
+
+    for path, content in files.items():
+        for name, read in (("contents json", read_json), ("raw", read_raw)):
+            # 每次使用新的客户端池，确保真正访问上游
+            pool = ClientPool()
+            ref = await pool.gitee.resolve_ref("mock", "demo")
+            sent = server.bytes_sent
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            result = await read(pool.gitee, path, ref)
+            elapsed = time.perf_counter() - t0
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            assert "error" not in result, result
+            kind = "binary" if result.get("binary") else result.get("charset")
+            print(f"{path:<12} {name:<14} file={len(content) / 1e6:6.2f}MB  "
+                  f"transfer={(server.bytes_sent - sent) / 1e6:6.2f}MB  peak={peak / 1e6:7.2f}MB  "
+                  f"time={elapsed * 1000:7.1f}ms  ({kind})")
+            del result
+            await pool.aclose()
+
+
+async def bench_sessions(args):
+    """会话存储：10 万会话的内存占用、批量写入吞吐与冷加载延迟"""
+    import random
+    import sqlite3
+    import tempfile
+    from datetime import datetime
+    from models import ChatMessage, SessionHistory
+    from session_store import SessionStore, SqliteSessionStore
+
+    n = args.sessions
+    turns = args.turns
+    question = "这个项目的入口文件在哪里？"
+    answer = "入口在 main.py，启动后创建 FastAPI 应用并注册路由。" * 4
+
+    # 原实现：字典 + pydantic 模型
+    tracemalloc.start()
+    legacy = {}
+    for i in range(n):
+        session = SessionHistory(session_id=f"s{i}", messages=[], created_at=datetime.now(),
+                                 updated_at=datetime.now())
+        for _ in range(turns):
+            session.messages.append(ChatMessage(role="user", content=question))
+            session.messages.append(ChatMessage(role="assistant", content=answer))
+        legacy[f"s{i}"] = session
+    legacy_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del legacy
+
+    tracemalloc.start()
+    store = SessionStore(max_sessions=n)
+    for i in range(n):
+        session = await store.get_or_create(f"s{i}")
+        for _ in range(turns):
+            store.append(session, "user", question)
+            store.append(session, "assistant", answer)
+    await store.flush()
+    store_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    await store.aclose()
+    # 消息文本本身在两种实现中都被字符串驻留共享，差异来自对象开销
+    print(f"{n} sessions x {turns * 2} messages: pydantic dict={legacy_bytes / 1e6:.1f}MB  "
+          f"session store={store_bytes / 1e6:.1f}MB")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSessionStore(os.path.join(tmp, "sessions.db"), max_sessions=args.cache_size)
+        start = time.perf_counter()
+        for i in range(n):
+            session = await store.get_or_create(f"s{i}", repo="mock/demo")
+            for _ in range(turns):
+                store.append(session, "user", question)
+                store.append(session, "assistant", answer)
+            if i % 1000 == 999:
+                await store.flush()
+        await store.flush()
+        wall = time.perf_counter() - start
+        print(f"{'sqlite batched':<24} {n * turns * 2 / wall:10.0f} msg/s  ({n} sessions in {wall:.2f}s)")
+
+        # 对照：每条消息单独提交
+        conn = sqlite3.connect(os.path.join(tmp, "naive.db"), isolation_level=None)
+        conn.execute("CREATE TABLE messages (session_id TEXT, seq INTEGER, role TEXT, content TEXT)")
+        count = min(n, 2000)
+        start = time.perf_counter()
+        for i in range(count):
+            for seq in range(turns * 2):
+                conn.execute("INSERT INTO messages VALUES (?, ?, ?, ?)", (f"s{i}", seq, "user", question))
+        wall = time.perf_counter() - start
+        conn.close()
+        print(f"{'sqlite per-message':<24} {count * turns * 2 / wall:10.0f} msg/s")
+
+        # 冷加载：新的存储实例，内存前端为空
+        await store.aclose()
+        store = SqliteSessionStore(os.path.join(tmp, "sessions.db"), max_sessions=args.cache_size)
+        latencies = []
+        for _ in range(1000):
+            t0 = time.perf_counter()
+            session = await store.get(f"s{random.randrange(n)}")
+            latencies.append(time.perf_counter() - t0)
+            assert session is not None and len(session.messages) == turns * 2
+        _summary("cold load", latencies, sum(latencies))
+        latencies = []
+        for _ in range(1000):
+            t0 = time.perf_counter()
+            await store.get(f"s{random.randrange(n)}")
+            latencies.append(time.perf_counter() - t0)
+        _summary("lru mixed", latencies, sum(latencies))
+        print(f"sessions: {store.stats()}")
+        await store.aclose()
+
+
+async def bench_sessionlist(args):
+    """会话列表：不同会话总数下首页、深分页与按仓库过滤的延迟"""
+    import random
+    import tempfile
+    from session_store import SqliteSessionStore
+
+    async def page_latency(store, rounds: int = 50, **kwargs) -> List[float]:
+        latencies = []
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            await store.list_sessions(**kwargs)
+            latencies.append(time.perf_counter() - t0)
+        return latencies
+
+    sizes = [size for size in (10_000, 100_000, 1_000_000) if size < args.sessions] + [args.sessions]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSessionStore(os.path.join(tmp, "sessions.db"), ttl=0, idle_ttl=0)
+        repos = [f"org/repo{i}" for i in range(100)]
+        now = time.time()
+        inserted = 0
+        for size in sizes:
+            # 直接批量写入摘要行，模拟长期积累的会话
+            rows = [(f"s{i:08d}", "repo", random.choice(repos), f"问题 {i}", now - i, now - random.random() * 1e6, 4)
+                    for i in range(inserted, size)]
+            with store._conn_lock:
+                store._conn.execute("BEGIN")
+                store._conn.executemany(
+                    "INSERT INTO sessions (session_id, kind, repo, title, created_at, updated_at, message_count) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                store._conn.execute("COMMIT")
+            inserted = size
+
+            first = await page_latency(store, limit=50)
+            # 翻 20 页后的深分页
+            cursor = None
+            for _ in range(20):
+                _, cursor = await store.list_sessions(limit=50, cursor=cursor)
+            deep = await page_latency(store, limit=50, cursor=cursor)
+            by_repo = await page_latency(store, limit=50, repo="org/repo7")
+            t0 = time.perf_counter()
+            with store._conn_lock:
+                store._conn.execute("SELECT session_id, message_count, created_at, updated_at "
+                                    "FROM sessions ORDER BY updated_at DESC").fetchall()
+            full = time.perf_counter() - t0
+            print(f"{size:>9} sessions  first={statistics.mean(first) * 1000:6.2f}ms  "
+                  f"page21={statistics.mean(deep) * 1000:6.2f}ms  repo={statistics.mean(by_repo) * 1000:6.2f}ms  "
+                  f"full scan={full * 1000:8.1f}ms")
+        await store.aclose()
+
+
+async def bench_burst(args):
+    """突发请求下的准入控制：一个调用方突发大量请求时，另一个调用方的延迟与 429 数量"""
+    import httpx
+    from main import app
+
+    results = {"bursty": [], "light": []}
+    rejected = {"bursty": 0, "light": 0}
+
+    async def one(client, caller: str, i: int):
+        start = time.perf_counter()
+        response = await client.post("/api/chat/repo", headers={"X-API-Key": caller}, json={
+            "repo_owner": "mock", "repo_name": "demo", "question": f"问题 {i}",
+        })
+        if response.status_code == 429:
+            rejected[caller] += 1
+            return
+        response.raise_for_status()
+        results[caller].append(time.perf_counter() - start)
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=300) as client:
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(one(client, "bursty", i)) for i in range(args.requests)]
+        # 突发开始后，另一个调用方发来少量请求
+        await asyncio.sleep(0.05)
+        tasks += [asyncio.create_task(one(client, "light", i)) for i in range(args.light)]
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - start
+        for caller, latencies in results.items():
+            if latencies:
+                _summary(caller, latencies, wall)
+            print(f"{caller:<24} rejected(429)={rejected[caller]}")
+        print(f"admission: {(await client.get('/api/stats')).json()['admission']}")
+
+
+async def bench_batch(args):
+    """同一仓库的一组问题：逐个调用聊天接口 vs 批量接口（共用预读的上下文）"""
+    import json
+    import httpx
+    from main import app
+    from client_pool import close_client_pool
+
+    questions = [f"标准问题 {i}：这个模块的职责是什么？" for i in range(args.questions)]
+    body = {"repo_owner": "mock", "repo_name": "demo"}
+
+    async def separate(client):
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(question: str):
+            async with semaphore:
+                response = await client.post("/api/chat/repo", json={**body, "question": question})
+                response.raise_for_status()
+
+        await asyncio.gather(*(one(q) for q in questions))
+
+    async def batch(client):
+        async with client.stream("POST", "/api/chat/repo/batch", json={
+            **body, "questions": questions, "concurrency": args.concurrency
+        }) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line and json.loads(line)["type"] == "error":
+                    raise RuntimeError(line)
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=600) as client:
+        for name, run in (("separate /api/chat/repo", separate), ("batch", batch)):
+            # 每种方式从冷缓存开始
+            await close_client_pool()
+            gitee_before = args.gitee_server.request_count
+            llm_before = args.llm_server.request_count
+            start = time.perf_counter()
+            await run(client)
+            wall = time.perf_counter() - start
+            print(f"{name:<24} questions={len(questions)}  wall={wall:7.3f}s  "
+                  f"llm_requests={args.llm_server.request_count - llm_before}  "
+                  f"gitee_requests={args.gitee_server.request_count - gitee_before}")
+    await close_client_pool()
+
+
+async def bench_metrics(args):
+    """指标记录的单次开销与 /metrics 导出耗时"""
+    import metrics
+
+    histogram = metrics.registry.histogram("bench_seconds", "bench", labels=("tool", "outcome"))
+    counter = metrics.registry.counter("bench_total", "bench", labels=("upstream", "code"))
+    tools = [f"tool_{i}" for i in range(10)]
+
+    start = time.perf_counter()
+    for i in range(args.ops):
+        histogram.observe((i % 1000) / 1000, tools[i % 10], "ok")
+    observe_ns = (time.perf_counter() - start) / args.ops * 1e9
+
+    start = time.perf_counter()
+    for i in range(args.ops):
+        counter.inc("gitee", "200")
+    inc_ns = (time.perf_counter() - start) / args.ops * 1e9
+
+    start = time.perf_counter()
+    text = metrics.registry.render()
+    render_ms = (time.perf_counter() - start) * 1000
+    print(f"histogram.observe: {observe_ns:.0f}ns/op  counter.inc: {inc_ns:.0f}ns/op  "
+          f"render: {render_ms:.2f}ms ({len(text.splitlines())} lines)")
+
+
+async def bench_tracing(args):
+    """span 的记录开销（未采样 / 采样）与批量导出耗时"""
+    import tracing
+
+    tracer = tracing.get_tracer()
+    tracer.max_buffer = args.ops + 1
+
+    # 未采样：没有当前根 span，span() 直接返回空对象
+    start = time.perf_counter()
+    for _ in range(args.ops):
+        with tracing.span("bench", tool="get_readme") as span:
+            span.set(outcome="ok")
+    unsampled_ns = (time.perf_counter() - start) / args.ops * 1e9
+
+    with tracing.root_span("bench"):
+        start = time.perf_counter()
+        for _ in range(args.ops):
+            with tracing.span("bench", tool="get_readme") as span:
+                span.set(outcome="ok")
+        sampled_ns = (time.perf_counter() - start) / args.ops * 1e9
+
+    start = time.perf_counter()
+    await tracer.flush()
+    export_ms = (time.perf_counter() - start) * 1000
+    print(f"span (unsampled): {unsampled_ns:.0f}ns/op  span (sampled): {sampled_ns:.0f}ns/op  "
+          f"export {tracer.exported} spans: {export_ms:.1f}ms ({tracer.stats()['exporter']})")
+    await tracing.close_tracer()
+
+
+async def bench_profile(args):
+    """常驻低频采样对聊天接口吞吐的影响，以及按区域汇总的热点帧"""
+    import httpx
+    import profiler
+    from main import app
+
+    instance = profiler.get_profiler()
+    instance.attach()
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=300) as client:
+        await _fire(client, args.concurrency, args.concurrency)  # 预热
+        for interval in (0.0, args.interval):
+            instance.set_continuous(interval)
+            start = time.perf_counter()
+            latencies = await _fire(client, args.requests, args.concurrency)
+            _summary(f"sampling interval={interval}", latencies, time.perf_counter() - start)
+    summary = instance.continuous_profile()
+    print(f"samples={summary['samples']}")
+    for region, data in summary["regions"].items():
+        top = data["hot_frames"][0]["frame"] if data["hot_frames"] else "-"
+        print(f"  {region:<10} {data['percent']:5.1f}%  top: {top}")
+    profiler.close_profiler()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat2Repo 性能基准")
+    parser.add_argument("--gitee-latency", type=float, default=0.05, help="替身 Gitee 每次请求的延迟（秒）")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="替身 LLM 每次请求的延迟（秒）")
+    subparsers = parser.add_subparsers(dest="command")
+
+    load_parser = subparsers.add_parser("load", help="并发压测聊天接口")
+    load_parser.add_argument("--requests", type=int, default=20)
+    load_parser.add_argument("--concurrency", type=int, default=10)
+
+    pool_parser = subparsers.add_parser("pool", help="对比每请求新建客户端与共享连接池")
+    pool_parser.add_argument("--requests", type=int, default=50)
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="对比 API 模式与快照模式的文件读取延迟")
+    snapshot_parser.add_argument("--rounds", type=int, default=20)
+
+    codesearch_parser = subparsers.add_parser("codesearch", help="trigram 代码搜索索引的构建与查询")
+    codesearch_parser.add_argument("--files", type=int, default=100000)
+    codesearch_parser.add_argument("--lines", type=int, default=20)
+    codesearch_parser.add_argument("--rounds", type=int, default=5)
+
+    herd_parser = subparsers.add_parser("herd", help="并发相同请求的合并效果")
+    herd_parser.add_argument("--agents", type=int, default=20)
+
+    streaming_parser = subparsers.add_parser("streaming", help="对比非流式与流式补全的 Agent 延迟")
+    streaming_parser.add_argument("--rounds", type=int, default=5)
+    streaming_parser.add_argument("--tool-calls", type=int, default=5, help="每轮工具调用数")
+    streaming_parser.add_argument("--chunk-interval", type=float, default=0.01, help="替身 LLM 每个流式块的间隔（秒）")
+
+    rawread_parser = subparsers.add_parser("rawread", help="对比 Base64 JSON 与 raw 接口读取文件的传输量和内存")
+    rawread_parser.add_argument("--size-mb", type=float, default=4)
+
+    sessions_parser = subparsers.add_parser("sessions", help="会话存储的内存占用、写入吞吐与加载延迟")
+    sessions_parser.add_argument("--sessions", type=int, default=100000)
+    sessions_parser.add_argument("--turns", type=int, default=2, help="每个会话的问答轮数")
+    sessions_parser.add_argument("--cache-size", type=int, default=10000, help="内存前端保留的会话数")
+
+    sessionlist_parser = subparsers.add_parser("sessionlist", help="会话列表分页在不同会话总数下的延迟")
+    sessionlist_parser.add_argument("--sessions", type=int, default=1000000)
+
+    burst_parser = subparsers.add_parser("burst", help="突发请求下的准入控制与公平性")
+    burst_parser.add_argument("--requests", type=int, default=40, help="突发调用方的请求数")
+    burst_parser.add_argument("--light", type=int, default=4, help="另一个调用方的请求数")
+    burst_parser.add_argument("--max-runs", type=int, default=4)
+    burst_parser.add_argument("--queue", type=int, default=16)
+
+    batch_parser = subparsers.add_parser("batch", help="对比逐个提问与批量问答接口")
+    batch_parser.add_argument("--questions", type=int, default=50)
+    batch_parser.add_argument("--concurrency", type=int, default=4)
+
+    metrics_parser = subparsers.add_parser("metrics", help="指标记录开销与导出耗时")
+    metrics_parser.add_argument("--ops", type=int, default=1000000)
+
+    profile_parser = subparsers.add_parser("profile", help="常驻采样剖析的开销与热点汇总")
+    profile_parser.add_argument("--requests", type=int, default=200)
+    profile_parser.add_argument("--concurrency", type=int, default=20)
+    profile_parser.add_argument("--interval", type=float, default=0.01, help="常驻采样间隔（秒）")
+
+    tracing_parser = subparsers.add_parser("tracing", help="链路追踪的 span 开销与导出耗时")
+    tracing_parser.add_argument("--ops", type=int, default=100000)
+    tracing_parser.add_argument("--output", default="data/bench_traces.jsonl", help="导出的 JSONL 文件")
+
+    args = parser.parse_args()
+    commands = {"load": bench_load, "pool": bench_pool, "snapshot": bench_snapshot,
+                "codesearch": bench_codesearch, "herd": bench_herd, "streaming": bench_streaming,
+                "rawread": bench_rawread, "sessions": bench_sessions,
+                "sessionlist": bench_sessionlist, "burst": bench_burst,
+                "batch": bench_batch, "metrics": bench_metrics, "tracing": bench_tracing,
+                "profile": bench_profile}
+    if args.command not in commands:
+        parser.print_help()
+        return 1
+
+    if args.command == "burst":
+        os.environ["MAX_CONCURRENT_RUNS"] = str(args.max_runs)
+        os.environ["RUN_QUEUE_SIZE"] = str(args.queue)
+    if args.command == "tracing":
+        os.environ["TRACE_SAMPLE_RATE"] = "1"
+        os.environ["TRACE_EXPORTER"] = "jsonl"
+        os.environ["TRACE_FILE"] = args.output
+    args.gitee_server, args.llm_server = _setup_env(args.gitee_latency, args.llm_latency,
+                                   stream_interval=getattr(args, "chunk_interval", 0.0),
+                                   tool_calls_per_turn=getattr(args, "tool_calls", 1))
+    asyncio.run(commands[args.command](args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
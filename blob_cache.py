@@ -0,0 +1,114 @@
+"""
+按 git blob SHA 寻址的文件内容缓存
+
+同一个 blob 无论经由哪个路径、分支或 fork 访问，SHA 都相同，
+因此只需从 Gitee 拉取一次。内存层为按字节数限额的 LRU，
+可选的磁盘层在进程重启后依然有效。
+"""
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+
+class BlobCache:
+    """两级（内存 LRU + 可选磁盘）blob 缓存"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_dir: Optional[str] = None):
+        """
+        Args:
+            max_bytes: 内存层最大字节数，超出后按 LRU 淘汰
+            disk_dir: 磁盘层目录，为空时只使用内存
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, sha: str) -> str:
+        return os.path.join(self.disk_dir, sha[:2], sha[2:])
+
+    def _remember(self, sha: str, data: bytes):
+        """写入内存层并按字节数淘汰（调用方持有锁）"""
+        if len(data) > self.max_bytes:
+            return
+        old = self._entries.pop(sha, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[sha] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def get(self, sha: str) -> Optional[bytes]:
+        """按 SHA 读取 blob，未命中返回 None"""
+        if not sha:
+            return None
+
+        with self._lock:
+            data = self._entries.get(sha)
+            if data is not None:
+                self._entries.move_to_end(sha)
+                self.hits += 1
+                return data
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(sha), "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(sha, data)
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, sha: str, data: bytes):
+        """写入 blob"""
+        if not sha:
+            return
+
+        with self._lock:
+            self._remember(sha, data)
+
+        if self.disk_dir:
+            path = self._disk_path(sha)
+            if os.path.exists(path):
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再原子替换，避免并发读到半截内容
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
@@ -3,39 +3,67 @@
 Chat2Repo 命令行工具
 """
 import sys
+import time
 import argparse
 import requests
 import json
-from typing import Optional
+from typing import List, Optional
 
 
 class Chat2RepoCLI:
     """CLI 客户端"""
     
-    def __init__(self, base_url: str = "http://localhost:8000"):
+    def __init__(self, base_url: str = "http://localhost:8000", use_jobs: bool = False):
         self.base_url = base_url
         self.session_id: Optional[str] = None
+        # 通过异步任务接口提交并轮询，不必在整个运行期间保持连接
+        self.use_jobs = use_jobs
     
-    def chat_repo(self, owner: str, repo: str, question: str, ref: str = "master"):
+    def _ask(self, kind: str, data: dict) -> dict:
+        """提交问题并返回回答"""
+        if not self.use_jobs:
+            response = requests.post(f"{self.base_url}/api/chat/{kind}", json=data, timeout=120)
+            response.raise_for_status()
+            return response.json()
+        
+        response = requests.post(f"{self.base_url}/api/jobs", json={"kind": kind, **data}, timeout=30)
+        response.raise_for_status()
+        job = response.json()
+        print(f"任务已提交: {job['job_id']}")
+        
+        shown = 0
+        while True:
+            for event in job["progress"][shown:]:
+                if event["type"] == "tool_start":
+                    print(f"  → {event['name']}")
+                elif event.get("error"):
+                    print(f"  ✗ {event['name']}: {event['error']}")
+            shown = len(job["progress"])
+            if job["status"] == "succeeded":
+                return job["result"]
+            if job["status"] in ("failed", "cancelled"):
+                raise requests.exceptions.RequestException(job.get("error") or f"任务{job['status']}")
+            time.sleep(1)
+            response = requests.get(f"{self.base_url}/api/jobs/{job['job_id']}", timeout=30)
+            response.raise_for_status()
+            job = response.json()
+    
+    def chat_repo(self, owner: str, repo: str, question: str, ref: Optional[str] = None):
         """仓库对话"""
         data = {
             "repo_owner": owner,
             "repo_name": repo,
-            "question": question,
-            "ref": ref
+            "question": question
         }
         
+        if ref:
+            data["ref"] = ref
+        
         if self.session_id:
             data["session_id"] = self.session_id
         
         try:
-            response = requests.post(
-                f"{self.base_url}/api/chat/repo",
-                json=data,
-                timeout=120
-            )
-            response.raise_for_status()
-            result = response.json()
+            result = self._ask("repo", data)
             
             self.session_id = result["session_id"]
             
@@ -72,13 +100,7 @@ class Chat2RepoCLI:
             data["session_id"] = self.session_id
         
         try:
-            response = requests.post(
-                f"{self.base_url}/api/chat/tech",
-                json=data,
-                timeout=120
-            )
-            response.raise_for_status()
-            result = response.json()
+            result = self._ask("tech", data)
             
             self.session_id = result["session_id"]
             
@@ -103,6 +125,60 @@ class Chat2RepoCLI:
             print(f"错误: {e}", file=sys.stderr)
             sys.exit(1)
     
+    def batch(self, owner: str, repo: str, questions: List[str], ref: Optional[str] = None,
+              concurrency: Optional[int] = None, output: Optional[str] = None):
+        """批量问答：同一仓库的一组问题，按完成顺序输出回答"""
+        data = {
+            "repo_owner": owner,
+            "repo_name": repo,
+            "questions": questions
+        }
+        if ref:
+            data["ref"] = ref
+        if concurrency:
+            data["concurrency"] = concurrency
+        
+        out = open(output, "w", encoding="utf-8") if output else None
+        failed = False
+        try:
+            # 逐行读取 NDJSON，只限制两行之间的等待时间
+            with requests.post(f"{self.base_url}/api/chat/repo/batch", json=data,
+                               stream=True, timeout=(10, 600)) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line:
+                        continue
+                    if out:
+                        out.write(line + "\n")
+                        out.flush()
+                    event = json.loads(line)
+                    if event["type"] == "context":
+                        print(f"仓库: {event['repo']}  分支: {event['branch']} ({event['ref'][:10]})  "
+                              f"文件数: {event['file_count']}  上下文就绪: {event['elapsed_ms']}ms")
+                    elif event["type"] == "answer":
+                        print(f"\n{'='*60}")
+                        print(f"[{event['index'] + 1}/{len(questions)}] {event['question']}  ({event['elapsed_ms']}ms)")
+                        print(f"{'='*60}")
+                        if event.get("error"):
+                            failed = True
+                            print(f"错误: {event['error']}")
+                        if event.get("answer"):
+                            print(event["answer"])
+                    elif event["type"] == "done":
+                        print(f"\n完成 {event['count']} 个问题，失败 {event['failed']} 个，"
+                              f"耗时 {event['elapsed_ms'] / 1000:.1f}s")
+                    elif event["type"] == "error":
+                        failed = True
+                        print(f"错误: {event['message']}", file=sys.stderr)
+        except requests.exceptions.RequestException as e:
+            print(f"错误: {e}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            if out:
+                out.close()
+        if failed:
+            sys.exit(1)
+    
     def show_session(self, session_id: Optional[str] = None):
         """显示会话历史"""
         sid = session_id or self.session_id
@@ -224,6 +300,11 @@ def main():
         default="http://localhost:8000",
         help="API 服务地址 (默认: http://localhost:8000)"
     )
+    parser.add_argument(
+        "--job",
+        action="store_true",
+        help="通过异步任务接口提交并轮询结果，适合耗时较长的问题"
+    )
     
     subparsers = parser.add_subparsers(dest="command", help="可用命令")
     
@@ -232,13 +313,23 @@ def main():
     repo_parser.add_argument("owner", help="仓库所有者")
     repo_parser.add_argument("name", help="仓库名称")
     repo_parser.add_argument("question", help="问题")
-    repo_parser.add_argument("--ref", default="master", help="分支名称")
+    repo_parser.add_argument("--ref", help="分支名称（默认为仓库默认分支）")
     
     # tech 命令
     tech_parser = subparsers.add_parser("tech", help="技术搜索")
     tech_parser.add_argument("question", help="技术问题")
     tech_parser.add_argument("--language", help="编程语言过滤")
     
+    # batch 命令
+    batch_parser = subparsers.add_parser("batch", help="批量问答（同一仓库的一组问题）")
+    batch_parser.add_argument("owner", help="仓库所有者")
+    batch_parser.add_argument("name", help="仓库名称")
+    batch_parser.add_argument("questions", nargs="*", help="问题")
+    batch_parser.add_argument("--file", help="问题文件，每行一个问题，# 开头的行忽略")
+    batch_parser.add_argument("--ref", help="分支名称（默认为仓库默认分支）")
+    batch_parser.add_argument("--concurrency", type=int, help="同时回答的问题数")
+    batch_parser.add_argument("--output", help="把原始 NDJSON 结果写入文件")
+    
     # session 命令
     session_parser = subparsers.add_parser("session", help="查看会话历史")
     session_parser.add_argument("session_id", help="会话ID")
@@ -248,12 +339,21 @@ def main():
     
     args = parser.parse_args()
     
-    cli = Chat2RepoCLI(base_url=args.url)
+    cli = Chat2RepoCLI(base_url=args.url, use_jobs=args.job)
     
     if args.command == "repo":
         cli.chat_repo(args.owner, args.name, args.question, args.ref)
     elif args.command == "tech":
         cli.search_tech(args.question, args.language)
+    elif args.command == "batch":
+        questions = list(args.questions)
+        if args.file:
+            with open(args.file, encoding="utf-8") as f:
+                questions += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        if not questions:
+            print("错误: 请提供问题或 --file", file=sys.stderr)
+            sys.exit(1)
+        cli.batch(args.owner, args.name, questions, args.ref, args.concurrency, args.output)
     elif args.command == "session":
         cli.show_session(args.session_id)
     elif args.command == "interactive":
@@ -0,0 +1,123 @@
+"""
+进程级共享客户端池
+
+应用启动时创建一次，所有 Agent 从这里借用 LLM / Gitee 客户端，
+复用长连接，避免每个请求重新建立 TCP + TLS 握手。
+"""
+import os
+import time
+from typing import Optional
+import httpx
+import metrics
+import tracing
+from config import get_settings, Settings
+from admission import create_admission
+from blob_cache import BlobCache
+from gitee_client import GiteeClient, create_http_cache, create_scheduler
+from llm_client import LLMClient
+from shared_cache import SharedCacheStore
+from snapshot import SnapshotStore
+from tools import ToolLimiter, DecodedFileCache
+
+
+def _http2_available() -> bool:
+    """httpx 的 HTTP/2 支持依赖可选包 h2"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class MetricsTransport(httpx.AsyncBaseTransport):
+    """记录每个上游请求（含重试）的耗时与状态码，被追踪的请求中另记一个 span"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, upstream: str):
+        self._transport = transport
+        self.upstream = upstream
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        # 只记录路径，查询参数中带有 access_token
+        with tracing.span("http.client", upstream=self.upstream, method=request.method,
+                          path=request.url.path) as span:
+            try:
+                response = await self._transport.handle_async_request(request)
+            except Exception as e:
+                metrics.record_upstream(self.upstream, time.perf_counter() - start, exception=e)
+                raise
+            metrics.record_upstream(self.upstream, time.perf_counter() - start, status=response.status_code)
+            span.set(status_code=response.status_code)
+            return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class ClientPool:
+    """共享的 HTTP 客户端及上层 API 客户端"""
+
+    def __init__(self, settings: Optional[Settings] = None):
+        settings = settings or get_settings()
+        limits = httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry
+        )
+        http2 = settings.http2 and _http2_available()
+
+        # Gitee 与 LLM 分别使用独立的连接池，互不抢占连接
+        self.gitee_http = httpx.AsyncClient(
+            timeout=settings.gitee_timeout,
+            transport=MetricsTransport(httpx.AsyncHTTPTransport(limits=limits, http2=http2), "gitee")
+        )
+        self.llm_http = httpx.AsyncClient(
+            timeout=settings.timeout,
+            transport=MetricsTransport(httpx.AsyncHTTPTransport(limits=limits, http2=http2), "llm")
+        )
+        # 多进程部署时响应缓存挂接共享层，blob 缓存默认使用共享目录下的磁盘层
+        self.shared_cache: Optional[SharedCacheStore] = None
+        blob_dir = settings.blob_cache_dir
+        if settings.workers > 1:
+            self.shared_cache = SharedCacheStore(os.path.join(settings.shared_cache_dir, "http_cache.db"))
+            blob_dir = blob_dir or os.path.join(settings.shared_cache_dir, "blobs")
+        self.blob_cache = BlobCache(settings.blob_cache_max_bytes, blob_dir)
+        self.http_cache = create_http_cache(settings, shared=self.shared_cache)
+        self.scheduler = create_scheduler(settings)
+        self.gitee = GiteeClient(
+            http_client=self.gitee_http,
+            blob_cache=self.blob_cache,
+            http_cache=self.http_cache,
+            scheduler=self.scheduler
+        )
+        self.llm = LLMClient(http_client=self.llm_http)
+        self.snapshots = SnapshotStore(settings.snapshot_dir, settings.snapshot_disk_budget)
+        self.decoded_files = DecodedFileCache(settings.decoded_cache_max_bytes)
+        self.tool_limiter = ToolLimiter(settings.tool_max_concurrency, settings.tool_concurrency_limits)
+        self.admission = create_admission(settings)
+
+    async def aclose(self):
+        """关闭所有连接"""
+        await self.gitee_http.aclose()
+        await self.llm_http.aclose()
+        if self.shared_cache is not None:
+            self.shared_cache.close()
+
+
+_pool: Optional[ClientPool] = None
+
+
+def get_client_pool() -> ClientPool:
+    """获取进程级客户端池，首次调用时创建"""
+    global _pool
+    if _pool is None:
+        _pool = ClientPool()
+    return _pool
+
+
+async def close_client_pool():
+    """关闭进程级客户端池"""
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.aclose()
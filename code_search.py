@@ -0,0 +1,319 @@
+"""
+本地代码搜索
+
+基于仓库快照构建 trigram 倒排索引，替代远程 /search/code。
+查询先用 trigram 求候选文件，再用正则逐个验证，返回文件、行号和上下文。
+"""
+import asyncio
+import re
+import threading
+import time
+from array import array
+from typing import Dict, Any, List, Optional, Set
+from compat import to_thread
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# 超过该大小的文件不建索引（通常是生成文件或数据文件）
+_MAX_FILE_BYTES = 1024 * 1024
+# 以前 8KB 中是否含 NUL 字节判断二进制文件
+_BINARY_SNIFF_BYTES = 8192
+# 正则来自模型输出：限制长度，单次搜索最多扫描的字节数与耗时（超出时返回已找到的结果）
+_MAX_PATTERN_CHARS = 256
+_MAX_SCAN_BYTES = 64 * 1024 * 1024
+_MAX_SEARCH_SECONDS = 5.0
+
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT,
+            getattr(sre_constants, "POSSESSIVE_REPEAT", sre_constants.MAX_REPEAT))
+
+
+def _trigrams(data: bytes) -> Set[bytes]:
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+
+def _required_literals(pattern: str) -> List[str]:
+    """提取正则匹配时必然出现的字面量片段
+
+    只分析顶层序列中的连续字面量；遇到分支、重复等结构时断开，
+    不产生任何必需片段，保证候选集只会偏大不会漏。
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (sre_constants.error, re.error):
+        return []
+
+    literals = []
+    current = []
+    for op, value in parsed:
+        if op is sre_constants.LITERAL:
+            current.append(chr(value))
+            continue
+        if op is sre_constants.SUBPATTERN:
+            # 分组内部只有字面量时视为连续
+            inner = value[-1]
+            if all(sub_op is sre_constants.LITERAL for sub_op, _ in inner):
+                current.extend(chr(v) for _, v in inner)
+                continue
+        if current:
+            literals.append("".join(current))
+            current = []
+    if current:
+        literals.append("".join(current))
+    return [lit for lit in literals if len(lit.encode("utf-8")) >= 3]
+
+
+def _nested_repeat(parsed, inside: bool = False) -> bool:
+    """是否含嵌套的无界重复（例如 (a+)+），这类正则在不匹配时会发生灾难性回溯"""
+    for op, value in parsed:
+        if op in _REPEATS:
+            unbounded = value[1] == sre_constants.MAXREPEAT
+            if unbounded and inside:
+                return True
+            if _nested_repeat(value[2], inside or unbounded):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if _nested_repeat(value[-1], inside):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_nested_repeat(branch, inside) for branch in value[1]):
+                return True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if _nested_repeat(value[1], inside):
+                return True
+        elif op is getattr(sre_constants, "ATOMIC_GROUP", None):
+            if _nested_repeat(value, inside):
+                return True
+    return False
+
+
+def _check_pattern(pattern: str) -> Optional[str]:
+    """检查模型给出的正则，返回错误信息；可以执行时返回 None"""
+    if len(pattern) > _MAX_PATTERN_CHARS:
+        return f"正则表达式过长（超过 {_MAX_PATTERN_CHARS} 个字符）"
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (sre_constants.error, re.error) as e:
+        return f"无效的正则表达式: {e}"
+    if _nested_repeat(parsed):
+        return "正则表达式含嵌套的重复（如 (a+)+），请改写为不嵌套的形式"
+    return None
+
+
+class TrigramIndex:
+    """基于 trigram 倒排表的代码搜索索引
+
+    文件源需提供 paths() 和 read(path) 两个方法（例如 snapshot.Snapshot）。
+    倒排表用 array('I') 存储文件编号，按编号递增，内存紧凑。
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._pending: List[str] = list(source.paths())
+        self._paths: List[str] = []
+        self._postings: Dict[bytes, array] = {}
+        # 后台线程构建时与 stats() 的遍历互斥
+        self._lock = threading.Lock()
+        self.skipped = 0
+        self.build_seconds = 0.0
+        self._build_task: Optional[asyncio.Task] = None
+        self._stopped = False
+
+    @property
+    def complete(self) -> bool:
+        return not self._pending
+
+    @property
+    def indexed_files(self) -> int:
+        return len(self._paths)
+
+    def build_step(self, max_files: int = 2000) -> bool:
+        """增量构建：最多再索引 max_files 个文件
+
+        Returns:
+            是否已全部构建完成
+        """
+        start = time.perf_counter()
+        batch = self._pending[:max_files]
+        processed = 0
+        for path in batch:
+            if self._stopped:
+                break
+            processed += 1
+            data = self.source.read(path)
+            if data is None or len(data) > _MAX_FILE_BYTES:
+                self.skipped += 1
+                continue
+            data = bytes(data)
+            if b"\0" in data[:_BINARY_SNIFF_BYTES]:
+                self.skipped += 1
+                continue
+            trigrams = _trigrams(data.lower())
+            with self._lock:
+                file_id = len(self._paths)
+                self._paths.append(path)
+                for trigram in trigrams:
+                    posting = self._postings.get(trigram)
+                    if posting is None:
+                        posting = self._postings[trigram] = array("I")
+                    posting.append(file_id)
+        # 处理完才移出待索引列表，构建期间的查询不会漏掉这一批文件
+        with self._lock:
+            self._pending = self._pending[processed:]
+        self.build_seconds += time.perf_counter() - start
+        return self.complete or self._stopped
+
+    def build(self):
+        """一次性构建全部索引"""
+        while not self.build_step():
+            pass
+
+    def start_background_build(self):
+        """在线程中分批构建索引，不阻塞事件循环；重复调用无副作用"""
+        if self.complete or self._build_task is not None:
+            return
+
+        async def run():
+            while not await to_thread(self.build_step):
+                pass
+
+        self._build_task = asyncio.create_task(run())
+
+    def stop(self) -> Optional[asyncio.Task]:
+        """停止后台构建
+
+        Returns:
+            仍在运行的构建任务（当前批次在线程中结束后退出），没有时为 None
+        """
+        self._stopped = True
+        task = self._build_task
+        return task if task is not None and not task.done() else None
+
+    def _candidates(self, literals: List[str], ignore_case: bool = True) -> Optional[List[int]]:
+        """按必需字面量求候选文件编号，无法约束时返回 None（表示全部文件）
+
+        索引用 bytes.lower() 只折叠 ASCII 大小写，查询按同样方式折叠。忽略大小写时，
+        含非 ASCII 字符的字面量在文件中可能以其他大小写形式出现，不用于缩小候选集。
+        """
+        trigrams: Set[bytes] = set()
+        for literal in literals:
+            if ignore_case and not literal.isascii():
+                continue
+            trigrams |= _trigrams(literal.encode("utf-8").lower())
+        if not trigrams:
+            return None
+
+        postings = []
+        for trigram in trigrams:
+            posting = self._postings.get(trigram)
+            if posting is None:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+            if not result:
+                break
+        return sorted(result)
+
+    def search(self, query: str, regex: bool = False, ignore_case: bool = True,
+               max_results: int = 20, context: int = 2, max_per_file: int = 5) -> Dict[str, Any]:
+        """搜索代码
+
+        Args:
+            query: 关键词或正则表达式
+            regex: query 是否为正则表达式
+            ignore_case: 是否忽略大小写
+            max_results: 最多返回的匹配数
+            context: 每个匹配前后附带的行数
+            max_per_file: 每个文件最多返回的匹配数
+
+        Returns:
+            匹配列表，每项包含 path、line、text 以及上下文行
+        """
+        if regex:
+            error = _check_pattern(query)
+            if error:
+                return {"error": error}
+        pattern = query if regex else re.escape(query)
+        try:
+            compiled = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+        except re.error as e:
+            return {"error": f"无效的正则表达式: {e}"}
+
+        literals = _required_literals(pattern) if regex else [query]
+        # 后台线程可能正把文件从待索引列表移入索引，两者在锁内一起读取
+        with self._lock:
+            candidate_ids = self._candidates(literals, ignore_case)
+            if candidate_ids is None:
+                candidates = list(self._paths)
+            else:
+                candidates = [self._paths[i] for i in candidate_ids]
+            # 尚未建索引的文件直接扫描，保证增量构建期间结果完整
+            candidates = list(dict.fromkeys(candidates + self._pending))
+
+        matches: List[Dict[str, Any]] = []
+        files_matched = 0
+        scanned = 0
+        incomplete = False
+        deadline = time.monotonic() + _MAX_SEARCH_SECONDS
+        for path in candidates:
+            if scanned >= _MAX_SCAN_BYTES or time.monotonic() > deadline:
+                incomplete = True
+                break
+            data = self.source.read(path)
+            if data is None or len(data) > _MAX_FILE_BYTES:
+                continue
+            scanned += len(data)
+            text = str(data, "utf-8", "replace")
+            file_matches = 0
+            lines = None
+            for match in compiled.finditer(text):
+                if lines is None:
+                    lines = text.split("\n")
+                line_no = text.count("\n", 0, match.start())
+                matches.append({
+                    "path": path,
+                    "line": line_no + 1,
+                    "text": lines[line_no],
+                    "before": lines[max(0, line_no - context):line_no],
+                    "after": lines[line_no + 1:line_no + 1 + context]
+                })
+                file_matches += 1
+                if file_matches >= max_per_file or len(matches) >= max_results:
+                    break
+            if file_matches:
+                files_matched += 1
+            if len(matches) >= max_results:
+                break
+
+        return {
+            "query": query,
+            "matches": matches,
+            "count": len(matches),
+            "files_matched": files_matched,
+            "candidates": len(candidates),
+            "truncated": len(matches) >= max_results,
+            # 达到扫描字节数或耗时上限，结果可能不完整
+            "incomplete": incomplete
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """索引统计"""
+        with self._lock:
+            posting_bytes = sum(p.itemsize * len(p) for p in self._postings.values())
+            trigrams = len(self._postings)
+            indexed = len(self._paths)
+        return {
+            "indexed_files": indexed,
+            "pending_files": len(self._pending),
+            "skipped_files": self.skipped,
+            "trigrams": trigrams,
+            "posting_bytes": posting_bytes,
+            "build_seconds": round(self.build_seconds, 3)
+        }
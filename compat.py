@@ -0,0 +1,17 @@
+"""
+Python 版本兼容
+
+文档和 run.sh 要求 Python 3.8+，这里补齐 3.9 才加入的标准库接口。
+"""
+import asyncio
+import contextvars
+import functools
+
+try:
+    to_thread = asyncio.to_thread
+except AttributeError:  # Python < 3.9
+    async def to_thread(func, *args, **kwargs):
+        """在默认线程池中执行 func，并沿用当前的 contextvars 上下文（同 asyncio.to_thread）"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(None, functools.partial(context.run, func, *args, **kwargs))
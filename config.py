@@ -3,6 +3,7 @@
 """
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional, Dict
 
 
 class Settings(BaseSettings):
@@ -16,15 +17,119 @@ class Settings(BaseSettings):
     # Gitee API 配置
     gitee_access_token: str
     gitee_api_base: str = "https://gitee.com/api/v5"
+    gitee_timeout: float = 30.0
+    # 请求调度：令牌桶按 access token 配额设置（每秒令牌数与突发容量），
+    # 429 / 5xx 按带抖动的指数退避重试
+    gitee_rate_limit: float = 10.0
+    gitee_rate_burst: int = 30
+    gitee_retry_attempts: int = 4
+    gitee_retry_backoff: float = 0.5
+    gitee_retry_max_wait: float = 10.0
+    
+    # HTTP 连接池配置（进程内共享，应用启动时创建、关闭时释放）
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0
+    http2: bool = True
+    
+    # 文件内容缓存配置（按 blob SHA 寻址，进程内共享）
+    blob_cache_max_bytes: int = 64 * 1024 * 1024
+    blob_cache_dir: Optional[str] = None
+    path_sha_ttl: int = 60
+    # 通过 raw 接口读取单个文件的大小上限，超出时只返回大小信息
+    raw_max_bytes: int = 10 * 1024 * 1024
+    # 解码后文本的缓存上限；get_file_content 单页最多返回的行数和字符数（同时受 tool_output_max_tokens 限制）
+    decoded_cache_max_bytes: int = 32 * 1024 * 1024
+    file_page_lines: int = 400
+    file_page_max_chars: int = 40000
+    # 内存中保留的目录树索引数量（每个仓库提交一个）
+    tree_index_max_repos: int = 64
+    
+    # Gitee 响应缓存配置（TTL 单位为秒，过期后用 ETag 条件请求重新验证）
+    http_cache_max_bytes: int = 32 * 1024 * 1024
+    cache_ttl_repo: int = 300
+    cache_ttl_search: int = 120
+    cache_ttl_default: int = 60
+    cache_ttl_negative: int = 60
+    # 分支名解析为提交 SHA 的缓存时间；解析后的读取按 SHA 长期缓存
+    cache_ttl_ref: int = 30
+    
+    # 仓库快照配置（快照模式下整仓下载一次，文件工具在本地完成）
+    snapshot_dir: str = "data/snapshots"
+    snapshot_disk_budget: int = 2 * 1024 * 1024 * 1024
+    
+    # 会话存储：sqlite（WAL 模式，新消息按批写入）或 memory（不持久化）；
+    # 内存中最多保留的会话数，超出时按 LRU 换出，sqlite 后端下次访问时重新加载
+    session_backend: str = "sqlite"
+    session_db_path: str = "data/sessions.db"
+    session_cache_size: int = 10000
+    session_flush_interval: float = 0.5
+    # 会话自创建起的最长保留时间与空闲保留时间（秒，0 表示不限）；后台按间隔淘汰并压缩数据库
+    session_ttl: int = 30 * 24 * 3600
+    session_idle_ttl: int = 7 * 24 * 3600
+    session_compact_interval: int = 3600
     
     # 服务配置
     host: str = "0.0.0.0"
     port: int = 8000
     debug: bool = False
+    # 工作进程数（python main.py --workers N）。大于 1 时会话每轮立即写入并在读取时校验，
+    # Gitee 响应缓存与 blob 缓存通过 shared_cache_dir 共享，令牌桶配额按进程数均分
+    workers: int = 1
+    shared_cache_dir: str = "data/shared"
+    # 多进程部署时各进程把 /metrics 的计数写入共享目录的间隔（秒），导出时合并所有进程
+    metrics_flush_interval: float = 5.0
+    # 请求级链路追踪：根 span 的采样率（0 关闭，1 全部记录）；导出方式 jsonl（写入 TRACE_FILE）
+    # 或 otlp（以 OTLP/HTTP JSON 发送到 TRACE_OTLP_ENDPOINT/v1/traces），后台按间隔（秒）批量导出
+    trace_sample_rate: float = 0.0
+    trace_exporter: str = "jsonl"
+    trace_file: str = "data/traces.jsonl"
+    trace_otlp_endpoint: str = "http://localhost:4318"
+    trace_flush_interval: float = 1.0
+    # 管理员令牌（X-Admin-Token 头），用于性能剖析等管理功能；未设置时这些功能不可用
+    admin_token: Optional[str] = None
+    # 性能剖析：单次请求剖析（X-Profile 头）的采样间隔（秒）与结果目录；常驻低频采样间隔
+    # （秒，0 表示关闭，可通过管理接口在运行时开启）；每个样本集合最多记录的不同栈数
+    profile_interval: float = 0.005
+    profile_dir: str = "data/profiles"
+    profile_continuous_interval: float = 0.0
+    profile_max_stacks: int = 10000
     
     # Agent 配置
     max_iterations: int = 10
     timeout: int = 300
+    # 准入控制：同时执行的 Agent 运行数上限、等待队列长度与最长排队秒数，队列已满或排队超时返回 429；
+    # 队列按调用方（X-API-Key 头，缺省为客户端 IP）轮转出队，单个调用方同时运行数上限（0 表示不限）
+    max_concurrent_runs: int = 16
+    run_queue_size: int = 64
+    run_queue_timeout: float = 30.0
+    per_key_max_runs: int = 0
+    # 异步任务（/api/jobs）：执行任务的工作协程数与排队任务数上限（多进程部署时为全部进程合计），
+    # 结束的任务保留的秒数，每个任务最多记录的工具调用进度事件数；任务执行时占用运行许可，与聊天接口共用并发上限
+    job_workers: int = 4
+    job_queue_size: int = 256
+    job_ttl: int = 3600
+    job_max_progress: int = 200
+    # 批量问答（/api/chat/repo/batch）：每批最多的问题数与同时回答的问题数上限；
+    # 预读的 README 和目录概览写入每个问题的系统提示词，各自的 token 上限
+    batch_max_questions: int = 500
+    batch_concurrency: int = 4
+    batch_context_tokens: int = 1500
+    # 同一轮中多个工具调用并发执行：全局上限与按工具上限（JSON，例如 {"search_code": 2}）
+    tool_max_concurrency: int = 8
+    tool_concurrency_limits: Dict[str, int] = {"search_code": 2, "search_repositories": 2}
+    # 上下文 token 预算：模型窗口按模型名最长前缀匹配（JSON），未匹配时使用默认值；
+    # 为回复预留 token，单条工具输出和较早轮次的工具输出分别限制长度
+    context_budgets: Dict[str, int] = {
+        "gpt-4": 8192, "gpt-4-32k": 32768, "gpt-4-turbo": 128000, "gpt-4-1106": 128000,
+        "gpt-4-0125": 128000, "gpt-4o": 128000, "gpt-3.5-turbo": 16385
+    }
+    context_budget_default: int = 8192
+    context_reserve_tokens: int = 1024
+    tool_output_max_tokens: int = 2000
+    old_tool_output_tokens: int = 300
+    # Agent 循环使用流式补全，工具参数一完整就开始执行；模型服务不支持流式工具调用时关闭
+    llm_stream: bool = True
     
     class Config:
         env_file = ".env"
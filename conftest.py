@@ -0,0 +1,45 @@
+"""
+pytest 公共配置
+
+Gitee 和 LLM 均使用 mock_upstream 中的替身服务，测试不访问外网。
+替身服务在导入应用模块（读取配置）之前启动，整个测试会话共用。
+"""
+import os
+import tempfile
+
+import pytest
+
+from mock_upstream import make_sample_repo, start_mock_gitee, start_mock_llm
+
+SAMPLE_FILES = make_sample_repo()
+
+gitee_server, gitee_base = start_mock_gitee(SAMPLE_FILES)
+llm_server, llm_base = start_mock_llm(files=SAMPLE_FILES)
+
+_data_dir = tempfile.mkdtemp(prefix="chat2repo-test-")
+os.environ.update({
+    "GITEE_API_BASE": gitee_base,
+    "GITEE_ACCESS_TOKEN": "offline",
+    "OPENAI_API_BASE": llm_base,
+    "OPENAI_API_KEY": "offline",
+    # 替身服务没有配额，不让令牌桶成为瓶颈
+    "GITEE_RATE_LIMIT": "1000",
+    "GITEE_RATE_BURST": "1000",
+    "SNAPSHOT_DIR": os.path.join(_data_dir, "snapshots"),
+    "SESSION_DB_PATH": os.path.join(_data_dir, "sessions.db"),
+    "SHARED_CACHE_DIR": os.path.join(_data_dir, "shared"),
+    "PROFILE_DIR": os.path.join(_data_dir, "profiles"),
+    "TRACE_FILE": os.path.join(_data_dir, "traces.jsonl"),
+})
+
+
+@pytest.fixture
+def gitee():
+    """模拟 Gitee 服务（request_count / archive_count / bytes_sent 计数）"""
+    return gitee_server
+
+
+@pytest.fixture
+def llm():
+    """模拟 LLM 服务"""
+    return llm_server
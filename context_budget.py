@@ -0,0 +1,212 @@
+"""
+上下文 token 预算
+
+Agent 每轮都把完整的消息列表发给 LLM，工具输出（尤其是整个文件内容）原样累积，
+长会话很快超出上下文窗口，成本随迭代次数平方增长。这里在每次调用 LLM 前：
+1. 用 tiktoken 统计每条消息的 token 数（离线无法加载编码表时按字符估算）
+2. 单条工具输出超过上限时只保留首尾窗口
+3. 总量超出模型预算时，依次压缩较早的工具输出、省略它们，最后裁剪早期对话历史
+"""
+import math
+from functools import lru_cache
+from typing import Dict, Any, List
+
+# 每条消息的格式开销（role、分隔符等），与 OpenAI 的计数方式一致
+_MESSAGE_OVERHEAD = 4
+# 整个请求的固定开销（assistant 回复的起始标记）
+_REPLY_OVERHEAD = 3
+
+_TRUNCATED_MARKER = "\n...[已截断 {n} tokens]...\n"
+_OMITTED_TOOL_OUTPUT = "[较早的工具输出已省略以节省上下文，如仍需要请重新调用工具]"
+
+
+@lru_cache(maxsize=None)
+def _load_encoding(model: str):
+    """加载模型对应的 tiktoken 编码，失败时返回 None"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception:
+        # 编码表需要联网下载，离线环境下直接估算
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+class TokenCounter:
+    """按模型统计 token 数"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.encoding = _load_encoding(model)
+
+    @property
+    def exact(self) -> bool:
+        """是否使用 tiktoken 精确计数"""
+        return self.encoding is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        # 估算：ASCII 约 4 个字符一个 token，中日韩等多字节字符约一个字符一个 token
+        extra_bytes = len(text.encode("utf-8")) - len(text)
+        wide = extra_bytes // 2
+        return math.ceil((len(text) - wide) / 4) + wide
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        tokens = _MESSAGE_OVERHEAD + self.count(message.get("content") or "")
+        for call in message.get("tool_calls") or []:
+            function = call.get("function", {})
+            tokens += self.count(function.get("name", "")) + self.count(function.get("arguments", ""))
+        return tokens
+
+    def window(self, text: str, max_tokens: int) -> str:
+        """超过 max_tokens 时只保留首尾（首部占 2/3），中间替换为截断标记"""
+        total = self.count(text)
+        if total <= max_tokens:
+            return text
+        head = max_tokens * 2 // 3
+        tail = max_tokens - head
+        marker = _TRUNCATED_MARKER.format(n=total - max_tokens)
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return (self.encoding.decode(tokens[:head]) + marker
+                    + (self.encoding.decode(tokens[-tail:]) if tail else ""))
+        # 估算模式下按字符比例截取
+        ratio = len(text) / total
+        head_chars = int(head * ratio)
+        tail_chars = int(tail * ratio)
+        return text[:head_chars] + marker + (text[-tail_chars:] if tail_chars else "")
+
+
+class ContextBudget:
+    """一次 Agent 运行的上下文预算"""
+
+    def __init__(self, model: str, max_tokens: int, reserve_tokens: int = 1024,
+                 tool_output_max_tokens: int = 2000, old_tool_output_tokens: int = 300):
+        """
+        Args:
+            model: 模型名称，用于选择分词器
+            max_tokens: 模型上下文窗口大小
+            reserve_tokens: 为模型回复预留的 token 数
+            tool_output_max_tokens: 单条工具输出的上限
+            old_tool_output_tokens: 较早轮次的工具输出压缩后的上限
+        """
+        self.counter = TokenCounter(model)
+        self.max_tokens = max_tokens
+        self.reserve_tokens = reserve_tokens
+        self.tool_output_max_tokens = tool_output_max_tokens
+        self.old_tool_output_tokens = old_tool_output_tokens
+        # id(message) -> (content, tokens)；content 未变化时复用计数
+        self._counts: Dict[int, Any] = {}
+
+    @classmethod
+    def for_model(cls, model: str, settings) -> "ContextBudget":
+        """按配置创建，模型窗口取 context_budgets 中最长的前缀匹配"""
+        budgets = settings.context_budgets
+        window = settings.context_budget_default
+        best = ""
+        for name, size in budgets.items():
+            if model.startswith(name) and len(name) > len(best):
+                best, window = name, size
+        return cls(
+            model,
+            window,
+            reserve_tokens=settings.context_reserve_tokens,
+            tool_output_max_tokens=settings.tool_output_max_tokens,
+            old_tool_output_tokens=settings.old_tool_output_tokens
+        )
+
+    @property
+    def prompt_budget(self) -> int:
+        return self.max_tokens - self.reserve_tokens
+
+    def clip_tool_output(self, content: str) -> str:
+        """限制单条工具输出的长度"""
+        return self.counter.window(content, self.tool_output_max_tokens)
+
+    def _count(self, message: Dict[str, Any]) -> int:
+        cached = self._counts.get(id(message))
+        if cached is not None and cached[0] is message.get("content"):
+            return cached[1]
+        tokens = self.counter.count_message(message)
+        self._counts[id(message)] = (message.get("content"), tokens)
+        return tokens
+
+    def count(self, messages: List[Dict[str, Any]]) -> int:
+        return _REPLY_OVERHEAD + sum(self._count(m) for m in messages)
+
+    def fit(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """原地调整消息列表使其不超过预算
+
+        最近一轮的工具输出和当前用户问题始终保留；system 消息不动。
+
+        Returns:
+            本轮统计：prompt_tokens、budget、trimmed_tokens 以及各项调整的数量
+        """
+        before = self.count(messages)
+        total = before
+        stats = {"windowed": 0, "omitted": 0, "history_dropped": 0}
+
+        # 最后一条 assistant 工具调用之后的工具输出属于最近一轮
+        last_call = max((i for i, m in enumerate(messages)
+                         if m.get("role") == "assistant" and m.get("tool_calls")), default=len(messages))
+        old_tools = [i for i, m in enumerate(messages) if m.get("role") == "tool" and i < last_call]
+
+        # 1. 压缩较早的工具输出
+        for i in old_tools:
+            if total <= self.prompt_budget:
+                break
+            message = messages[i]
+            content = message.get("content") or ""
+            windowed = self.counter.window(content, self.old_tool_output_tokens)
+            if windowed != content:
+                old = self._count(message)
+                message["content"] = windowed
+                total += self._count(message) - old
+                stats["windowed"] += 1
+
+        # 2. 仍然超出时省略较早的工具输出
+        for i in old_tools:
+            if total <= self.prompt_budget:
+                break
+            message = messages[i]
+            if message.get("content") == _OMITTED_TOOL_OUTPUT:
+                continue
+            old = self._count(message)
+            message["content"] = _OMITTED_TOOL_OUTPUT
+            total += self._count(message) - old
+            stats["omitted"] += 1
+
+        # 3. 最后裁剪早期对话历史（不含工具调用的 user / assistant 消息，不动当前问题）
+        current_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+        i = 0
+        while total > self.prompt_budget and i < len(messages):
+            message = messages[i]
+            if (i < current_user and message.get("role") in ("user", "assistant")
+                    and not message.get("tool_calls")):
+                total -= self._count(message)
+                self._counts.pop(id(message), None)
+                del messages[i]
+                current_user -= 1
+                stats["history_dropped"] += 1
+                continue
+            i += 1
+
+        return {
+            "prompt_tokens": total,
+            "budget": self.prompt_budget,
+            "trimmed_tokens": before - total,
+            "exact": self.counter.exact,
+            **stats
+        }
+
@@ -2,39 +2,287 @@
 Gitee API 客户端
 """
 import base64
-from typing import Dict, List, Optional, Any
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Tuple
+from urllib.parse import quote
 import httpx
 from config import get_settings
+from blob_cache import BlobCache
+from http_cache import HttpCache, CacheEntry
+from scheduler import RequestScheduler
+from shared_cache import SharedCacheStore
+from singleflight import Singleflight
+from text_decode import is_binary, decode_text, binary_summary
+from tree_index import TreeIndex
+
+# 路径 -> blob SHA 映射的最大条目数
+_PATH_SHA_MAX_ENTRIES = 100_000
+
+_COMMIT_SHA_RE = re.compile(r"^[0-9a-f]{40}$")
+
+
+def is_commit_sha(ref: Optional[str]) -> bool:
+    """判断 ref 是否为完整的提交 SHA（不可变）"""
+    return bool(ref) and bool(_COMMIT_SHA_RE.match(ref))
+
+
+def create_scheduler(settings) -> RequestScheduler:
+    """按配置创建 Gitee 请求调度器
+    
+    多进程部署时同一个 access token 的配额由各工作进程均分。
+    """
+    workers = max(1, settings.workers)
+    return RequestScheduler(
+        rate=settings.gitee_rate_limit / workers,
+        burst=max(1, settings.gitee_rate_burst // workers),
+        max_attempts=settings.gitee_retry_attempts,
+        backoff_base=settings.gitee_retry_backoff,
+        backoff_max=settings.gitee_retry_max_wait
+    )
+
+
+def create_http_cache(settings, shared: Optional[SharedCacheStore] = None) -> HttpCache:
+    """按配置创建 Gitee 响应缓存
+    
+    Args:
+        shared: 多进程部署时的共享层
+    """
+    return HttpCache(
+        ttl_rules=[
+            (r"^/repos/[^/]+/[^/]+$", settings.cache_ttl_repo),
+            (r"^/search/", settings.cache_ttl_search),
+            (r"^/repos/[^/]+/[^/]+/branches/", settings.cache_ttl_ref),
+        ],
+        default_ttl=settings.cache_ttl_default,
+        negative_ttl=settings.cache_ttl_negative,
+        max_bytes=settings.http_cache_max_bytes,
+        shared=shared
+    )
 
 
 class GiteeClient:
     """Gitee API 客户端"""
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None,
+                 blob_cache: Optional[BlobCache] = None,
+                 http_cache: Optional[HttpCache] = None,
+                 scheduler: Optional[RequestScheduler] = None):
+        """
+        Args:
+            http_client: 共享的 HTTP 客户端；不传时自行创建，并在 aclose() 时关闭
+            blob_cache: 共享的 blob 缓存；不传时按配置创建私有缓存
+            http_cache: 共享的响应缓存；不传时按配置创建私有缓存
+            scheduler: 共享的请求调度器；不传时按配置创建私有调度器
+        """
         settings = get_settings()
         self.api_base = settings.gitee_api_base
         self.access_token = settings.gitee_access_token
-        self.client = httpx.Client(timeout=30.0)
+        self._owns_client = http_client is None
+        self.client = http_client or httpx.AsyncClient(timeout=settings.gitee_timeout)
+        self.blob_cache = blob_cache or BlobCache(settings.blob_cache_max_bytes, settings.blob_cache_dir)
+        self.http_cache = http_cache or create_http_cache(settings)
+        self.scheduler = scheduler or create_scheduler(settings)
+        # 并发的相同 GET 请求只向上游发出一次
+        self.inflight = Singleflight()
+        
+        # (owner, repo, ref, path) -> (sha, 过期时间)；分支可变，所以需要 TTL
+        self._path_shas: "OrderedDict[Tuple[str, str, str, str], Tuple[str, float]]" = OrderedDict()
+        self._path_sha_ttl = settings.path_sha_ttl
+        self.raw_max_bytes = settings.raw_max_bytes
+        
+        # (owner, repo, 提交 SHA) -> 目录树索引
+        self._tree_indexes: "OrderedDict[Tuple[str, str, str], TreeIndex]" = OrderedDict()
+        self._tree_index_max = settings.tree_index_max_repos
+    
+    def _remember_path_sha(self, owner: str, repo: str, ref: str, path: str, sha: Optional[str]):
+        """记录路径对应的 blob SHA"""
+        if not sha:
+            return
+        key = (owner, repo, ref, path)
+        # 提交 SHA 下的路径映射永不过期，分支名下的映射只短暂有效
+        expires_at = float("inf") if is_commit_sha(ref) else time.monotonic() + self._path_sha_ttl
+        self._path_shas.pop(key, None)
+        self._path_shas[key] = (sha, expires_at)
+        while len(self._path_shas) > _PATH_SHA_MAX_ENTRIES:
+            self._path_shas.popitem(last=False)
+    
+    def _lookup_path_sha(self, owner: str, repo: str, ref: str, path: str) -> Optional[str]:
+        """查询路径对应的 blob SHA，过期返回 None"""
+        key = (owner, repo, ref, path)
+        entry = self._path_shas.get(key)
+        if entry is None:
+            return None
+        sha, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._path_shas[key]
+            return None
+        return sha
+    
+    def lookup_blob_sha(self, owner: str, repo: str, ref: str, path: str) -> Optional[str]:
+        """不访问上游，从已知的路径映射或目录树索引查询文件的 blob SHA
+        
+        Args:
+            ref: 已解析的提交 SHA（或分支名）
+        """
+        path = path.strip("/")
+        sha = self._lookup_path_sha(owner, repo, ref, path)
+        if sha:
+            return sha
+        index = self._tree_indexes.get((owner, repo, ref))
+        return index.blob_sha(path) if index is not None else None
+    
+    @staticmethod
+    def _decode_raw(result: Dict[str, Any], raw: bytes):
+        """把原始字节解码为 decoded_content；二进制文件只给出类型和大小摘要"""
+        if is_binary(raw):
+            result.update(binary_summary(raw, result.get("path", ""), len(raw)))
+            return
+        result["decoded_content"], result["charset"] = decode_text(raw)
+    
+    def _decode_content(self, result: Dict[str, Any]):
+        """解码 Base64 内容，并以 blob SHA 为键写入缓存"""
+        if "content" in result and not result.get("error"):
+            try:
+                raw = base64.b64decode(result["content"])
+            except Exception as e:
+                result["decode_error"] = str(e)
+                return
+            self.blob_cache.put(result.get("sha"), raw)
+            self._decode_raw(result, raw)
     
-    def _request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
-        """发送 API 请求"""
+    async def _request(self, method: str, endpoint: str, cache: bool = True,
+                       immutable: bool = False, **kwargs) -> Dict[str, Any]:
+        """发送 API 请求
+        
+        GET 请求经过响应缓存：TTL 内直接返回，过期后带 ETag / Last-Modified
+        发送条件请求，404 会被负缓存。并发的相同 GET 请求（方法、接口和参数
+        均相同）合并为一次上游调用。
+        
+        Args:
+            method: HTTP 方法
+            endpoint: 接口路径
+            cache: 是否使用响应缓存
+            immutable: 请求针对提交 SHA，结果不会变化，可长期缓存
+        """
+        is_get = method.upper() == "GET"
+        key = self.http_cache.make_key(method, endpoint, kwargs.get('params'))
+        if cache and is_get:
+            entry = self.http_cache.get(key)
+            if entry is not None and entry.fresh:
+                if entry.error:
+                    self.http_cache.record("negative_hit")
+                    return {"error": entry.error}
+                self.http_cache.record("hit")
+                return json.loads(entry.body)
+        
+        if not is_get or kwargs.get('headers'):
+            return await self._send(method, endpoint, key, cache, immutable, **kwargs)
+        return await self.inflight.do(
+            key, lambda: self._send(method, endpoint, key, cache, immutable, **kwargs)
+        )
+    
+    async def _send(self, method: str, endpoint: str, key: str, cache: bool,
+                    immutable: bool, **kwargs) -> Dict[str, Any]:
+        """向上游发送请求，缓存条目过期时发送条件请求"""
         url = f"{self.api_base}/{endpoint.lstrip('/')}"
-        params = kwargs.get('params', {})
+        params = dict(kwargs.get('params') or {})
+        
+        cacheable = cache and method.upper() == "GET"
+        entry = None
+        if cacheable:
+            ttl = self.http_cache.immutable_ttl if immutable else self.http_cache.ttl_for(endpoint)
+            entry = self.http_cache.get(key)
+            if entry is not None and entry.fresh:
+                # 等待合并期间已被其他请求刷新
+                if entry.error:
+                    return {"error": entry.error}
+                return json.loads(entry.body)
+            if entry is not None and not entry.error:
+                headers = dict(kwargs.get('headers') or {})
+                if entry.etag:
+                    headers['If-None-Match'] = entry.etag
+                if entry.last_modified:
+                    headers['If-Modified-Since'] = entry.last_modified
+                kwargs['headers'] = headers
+        
         params['access_token'] = self.access_token
         kwargs['params'] = params
         
         try:
-            response = self.client.request(method, url, **kwargs)
+            async for attempt in self.scheduler.retrying():
+                with attempt:
+                    await self.scheduler.acquire()
+                    response = await self.client.request(method, url, **kwargs)
+                    self.scheduler.check(response)
+            if cacheable and entry is not None and response.status_code == 304:
+                entry.expires_at = time.monotonic() + ttl
+                # 重新写入，使共享层中的过期时间同步延长
+                self.http_cache.put(key, entry)
+                self.http_cache.record("revalidated")
+                return json.loads(entry.body)
             response.raise_for_status()
-            return response.json()
+        except httpx.HTTPStatusError as e:
+            if cacheable and e.response.status_code == 404:
+                self.http_cache.record("miss")
+                self.http_cache.put(key, CacheEntry(
+                    status=404,
+                    body=b"",
+                    expires_at=time.monotonic() + self.http_cache.negative_ttl,
+                    error=str(e)
+                ))
+            return {"error": str(e)}
         except httpx.HTTPError as e:
             return {"error": str(e)}
+        
+        if cacheable:
+            self.http_cache.record("miss")
+            self.http_cache.put(key, CacheEntry(
+                status=response.status_code,
+                body=response.content,
+                expires_at=time.monotonic() + ttl,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified")
+            ))
+        return response.json()
     
-    def get_repo_info(self, owner: str, repo: str) -> Dict[str, Any]:
+    async def get_repo_info(self, owner: str, repo: str) -> Dict[str, Any]:
         """获取仓库信息"""
-        return self._request("GET", f"/repos/{owner}/{repo}")
+        return await self._request("GET", f"/repos/{owner}/{repo}")
+    
+    async def get_default_branch(self, owner: str, repo: str) -> str:
+        """获取仓库默认分支，查询失败时回退为 master"""
+        info = await self.get_repo_info(owner, repo)
+        return info.get("default_branch") or "master"
     
-    def get_repo_tree(self, owner: str, repo: str, path: str = "", recursive: int = 0) -> Dict[str, Any]:
+    async def resolve_ref(self, owner: str, repo: str, ref: Optional[str] = None) -> str:
+        """把分支名解析为提交 SHA
+        
+        分支到 SHA 的映射按 CACHE_TTL_REF 短暂缓存；之后的目录树和文件读取
+        都针对不可变的 SHA 发起，结果可以无限期缓存。
+        
+        Args:
+            owner: 仓库所有者
+            repo: 仓库名称
+            ref: 分支名、标签或提交 SHA，为空时使用默认分支
+            
+        Returns:
+            提交 SHA；无法解析（如标签、分支不存在）时原样返回 ref
+        """
+        if is_commit_sha(ref):
+            return ref
+        if not ref:
+            ref = await self.get_default_branch(owner, repo)
+        
+        branch = await self._request("GET", f"/repos/{owner}/{repo}/branches/{ref}")
+        sha = branch.get("commit", {}).get("sha") if isinstance(branch, dict) else None
+        return sha if is_commit_sha(sha) else ref
+    
+    async def get_repo_tree(self, owner: str, repo: str, path: str = "", recursive: int = 0,
+                            ref: Optional[str] = None) -> Dict[str, Any]:
         """获取仓库目录树
         
         Args:
@@ -42,64 +290,290 @@ class GiteeClient:
             repo: 仓库名称
             path: 路径，默认为根目录
             recursive: 是否递归获取，1为递归，0为不递归
+            ref: 分支名、标签或提交 SHA，默认为仓库默认分支
         """
+        sha = await self.resolve_ref(owner, repo, ref)
         params = {"recursive": recursive}
         if path:
             params["path"] = path
-        return self._request("GET", f"/repos/{owner}/{repo}/git/trees/master", params=params)
+        return await self._request("GET", f"/repos/{owner}/{repo}/git/trees/{sha}", params=params,
+                                   immutable=is_commit_sha(sha))
     
-    def get_file_content(self, owner: str, repo: str, path: str, ref: str = "master") -> Dict[str, Any]:
+    async def get_tree_index(self, owner: str, repo: str, ref: Optional[str] = None) -> Optional[TreeIndex]:
+        """获取 (仓库, 提交) 的目录树索引，每个提交只递归拉取一次
+        
+        Args:
+            owner: 仓库所有者
+            repo: 仓库名称
+            ref: 分支名、标签或提交 SHA，默认为仓库默认分支
+            
+        Returns:
+            索引；ref 无法解析为提交 SHA 或拉取失败时返回 None
+        """
+        sha = await self.resolve_ref(owner, repo, ref)
+        if not is_commit_sha(sha):
+            return None
+        
+        key = (owner, repo, sha)
+        index = self._tree_indexes.get(key)
+        if index is not None:
+            self._tree_indexes.move_to_end(key)
+            return index
+        
+        # 原始 JSON 可能很大，只保留紧凑索引，不进入响应缓存
+        tree = await self._request("GET", f"/repos/{owner}/{repo}/git/trees/{sha}",
+                                   params={"recursive": 1}, cache=False)
+        if tree.get("error") or "tree" not in tree:
+            return None
+        
+        index = TreeIndex.from_tree(tree)
+        self._tree_indexes[key] = index
+        while len(self._tree_indexes) > self._tree_index_max:
+            self._tree_indexes.popitem(last=False)
+        return index
+    
+    async def get_file_content(self, owner: str, repo: str, path: str, ref: Optional[str] = None) -> Dict[str, Any]:
         """获取文件内容
         
+        优先通过 raw 接口读取原始字节，比 contents 接口的 Base64 JSON 少传约 1/3 的数据，
+        也不必在内存中同时保留 JSON、Base64 和解码结果；raw 接口不可用时回退到 contents 接口。
+        二进制文件不解码，只返回类型和大小摘要。
+        
         Args:
             owner: 仓库所有者
             repo: 仓库名称
             path: 文件路径
-            ref: 分支名称，默认为 master
+            ref: 分支名、标签或提交 SHA，默认为仓库默认分支
         """
-        result = self._request("GET", f"/repos/{owner}/{repo}/contents/{path}", params={"ref": ref})
+        ref = await self.resolve_ref(owner, repo, ref)
+        path = path.strip("/")
         
-        # 解码 Base64 内容
-        if "content" in result and not result.get("error"):
-            try:
-                result["decoded_content"] = base64.b64decode(result["content"]).decode("utf-8")
-            except Exception as e:
-                result["decode_error"] = str(e)
+        # 已知该路径的 blob SHA 时直接命中内容寻址缓存
+        sha = self._lookup_path_sha(owner, repo, ref, path)
+        index = self._tree_indexes.get((owner, repo, ref))
+        if not sha and index is not None:
+            if not index.truncated and not index.exists(path):
+                return {"error": f"文件不存在: {path}"}
+            sha = index.blob_sha(path)
+        raw = self.blob_cache.get(sha) if sha else None
+        if raw is not None:
+            return self._file_result(path, sha, raw)
+        
+        fetched = await self.get_raw(owner, repo, path, ref)
+        if fetched.get("too_large"):
+            return {
+                "type": "file",
+                "name": path.rsplit("/", 1)[-1],
+                "path": path,
+                "size": fetched["size"],
+                "sha": sha,
+                "url": None,
+                "too_large": True,
+                "summary": f"文件过大（至少 {fetched['size']} 字节），未下载内容"
+            }
+        if not fetched.get("error"):
+            return self._file_result(path, fetched["sha"], fetched["raw"])
+        if fetched.get("status") == 404:
+            return {"error": fetched["error"]}
+        
+        result = await self._request("GET", f"/repos/{owner}/{repo}/contents/{path}", params={"ref": ref},
+                                     immutable=is_commit_sha(ref))
+        
+        if isinstance(result, dict):
+            self._decode_content(result)
+            self._remember_path_sha(owner, repo, ref, path, result.get("sha"))
         
         return result
     
-    def list_directory(self, owner: str, repo: str, path: str = "", ref: str = "master") -> List[Dict[str, Any]]:
+    def _file_result(self, path: str, sha: Optional[str], raw: bytes) -> Dict[str, Any]:
+        """由原始字节构造与 contents 接口相同结构的结果"""
+        result = {
+            "type": "file",
+            "name": path.rsplit("/", 1)[-1],
+            "path": path,
+            "size": len(raw),
+            "sha": sha,
+            "url": None
+        }
+        self._decode_raw(result, raw)
+        return result
+    
+    async def get_raw(self, owner: str, repo: str, path: str, ref: str) -> Dict[str, Any]:
+        """通过 raw 接口获取文件原始字节
+        
+        响应按块读取，超过 RAW_MAX_BYTES 时立即停止下载；blob SHA 在本地按 git
+        的规则计算，内容写入 blob 缓存。并发的相同读取合并为一次上游调用。
+        
+        Args:
+            owner: 仓库所有者
+            repo: 仓库名称
+            path: 文件路径
+            ref: 分支名、标签或提交 SHA
+            
+        Returns:
+            成功时包含 sha、size 和 raw（原始字节）；文件过大时 too_large 为 True 且不含 raw；
+            失败时包含 error 及 HTTP 状态码 status
+        """
+        path = path.strip("/")
+        key = self.http_cache.make_key("GET", f"/repos/{owner}/{repo}/raw/{path}", {"ref": ref})
+        entry = self.http_cache.get(key)
+        if entry is not None and entry.fresh and entry.error:
+            self.http_cache.record("negative_hit")
+            return {"error": entry.error, "status": entry.status}
+        return await self.inflight.do(key, lambda: self._fetch_raw(owner, repo, path, ref, key))
+    
+    async def _fetch_raw(self, owner: str, repo: str, path: str, ref: str, key: str) -> Dict[str, Any]:
+        """流式下载 raw 内容"""
+        url = f"{self.api_base}/repos/{owner}/{repo}/raw/{quote(path)}"
+        params = {"ref": ref, "access_token": self.access_token}
+        try:
+            async for attempt in self.scheduler.retrying():
+                with attempt:
+                    await self.scheduler.acquire()
+                    async with self.client.stream("GET", url, params=params, follow_redirects=True) as response:
+                        self.scheduler.check(response)
+                        response.raise_for_status()
+                        length = response.headers.get("Content-Length")
+                        if length and length.isdigit() and int(length) > self.raw_max_bytes:
+                            return {"size": int(length), "too_large": True}
+                        chunks = []
+                        size = 0
+                        async for chunk in response.aiter_bytes():
+                            size += len(chunk)
+                            if size > self.raw_max_bytes:
+                                return {"size": size, "too_large": True}
+                            chunks.append(chunk)
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if status == 404:
+                self.http_cache.put(key, CacheEntry(
+                    status=404,
+                    body=b"",
+                    expires_at=time.monotonic() + self.http_cache.negative_ttl,
+                    error=str(e)
+                ))
+            return {"error": str(e), "status": status}
+        except httpx.HTTPError as e:
+            return {"error": str(e)}
+        
+        digest = hashlib.sha1(b"blob %d\0" % size)
+        for chunk in chunks:
+            digest.update(chunk)
+        raw = b"".join(chunks)
+        del chunks
+        sha = digest.hexdigest()
+        self.blob_cache.put(sha, raw)
+        self._remember_path_sha(owner, repo, ref, path, sha)
+        return {"sha": sha, "size": size, "raw": raw}
+    
+    async def get_blob(self, owner: str, repo: str, sha: str) -> Dict[str, Any]:
+        """按 SHA 获取 blob 原始内容
+        
+        Args:
+            owner: 仓库所有者
+            repo: 仓库名称
+            sha: blob SHA
+            
+        Returns:
+            成功时 raw 字段为原始字节
+        """
+        raw = self.blob_cache.get(sha)
+        if raw is not None:
+            return {"sha": sha, "size": len(raw), "raw": raw}
+        
+        # blob 内容已进入 blob 缓存，不必在响应缓存中再存一份
+        result = await self._request("GET", f"/repos/{owner}/{repo}/git/blobs/{sha}", cache=False)
+        if result.get("error") or "content" not in result:
+            return result
+        
+        try:
+            raw = base64.b64decode(result["content"])
+        except Exception as e:
+            return {"error": f"blob 解码失败: {e}"}
+        self.blob_cache.put(sha, raw)
+        return {"sha": sha, "size": len(raw), "raw": raw}
+    
+    async def download_archive(self, owner: str, repo: str, ref: str, dest: str) -> Dict[str, Any]:
+        """下载仓库 zip 归档到本地文件
+        
+        Args:
+            owner: 仓库所有者
+            repo: 仓库名称
+            ref: 分支名、标签或提交 SHA
+            dest: 目标文件路径
+            
+        Returns:
+            成功时包含 size（字节数）
+        """
+        url = f"{self.api_base}/repos/{owner}/{repo}/zipball"
+        params = {"ref": ref, "access_token": self.access_token}
+        size = 0
+        try:
+            async for attempt in self.scheduler.retrying():
+                with attempt:
+                    await self.scheduler.acquire()
+                    async with self.client.stream("GET", url, params=params, follow_redirects=True) as response:
+                        self.scheduler.check(response)
+                        response.raise_for_status()
+                        size = 0
+                        with open(dest, "wb") as f:
+                            async for chunk in response.aiter_bytes():
+                                f.write(chunk)
+                                size += len(chunk)
+        except httpx.HTTPError as e:
+            return {"error": str(e)}
+        return {"size": size}
+    
+    async def list_directory(self, owner: str, repo: str, path: str = "", ref: Optional[str] = None) -> List[Dict[str, Any]]:
         """列出目录内容
         
         Args:
             owner: 仓库所有者
             repo: 仓库名称
             path: 目录路径，默认为根目录
-            ref: 分支名称，默认为 master
+            ref: 分支名、标签或提交 SHA，默认为仓库默认分支
         """
-        result = self._request("GET", f"/repos/{owner}/{repo}/contents/{path}", params={"ref": ref})
+        ref = await self.resolve_ref(owner, repo, ref)
+        result = await self._request("GET", f"/repos/{owner}/{repo}/contents/{path}", params={"ref": ref},
+                                     immutable=is_commit_sha(ref))
         
         if isinstance(result, list):
+            for item in result:
+                if item.get("type") == "file":
+                    self._remember_path_sha(owner, repo, ref, item.get("path", ""), item.get("sha"))
             return result
         elif isinstance(result, dict) and not result.get("error"):
             return [result]
         else:
             return []
     
-    def get_repo_readme(self, owner: str, repo: str, ref: str = "master") -> Dict[str, Any]:
-        """获取仓库 README"""
-        result = self._request("GET", f"/repos/{owner}/{repo}/readme", params={"ref": ref})
+    async def get_repo_readme(self, owner: str, repo: str, ref: Optional[str] = None) -> Dict[str, Any]:
+        """获取仓库 README
+        
+        已有目录树索引时直接按 README 路径走 raw 读取，否则使用 readme 接口。
+        """
+        ref = await self.resolve_ref(owner, repo, ref)
+        index = self._tree_indexes.get((owner, repo, ref))
+        if index is not None and not index.truncated:
+            candidates = [item["name"] for item in index.list_dir("") or []
+                          if item.get("type") == "file" and item["name"].lower().startswith("readme")]
+            if not candidates:
+                return {"error": "仓库中没有 README 文件"}
+            # 与快照一致：优先 README.md，其次按名称排序
+            candidates.sort(key=lambda name: (name.lower() != "readme.md", name.lower()))
+            result = await self.get_file_content(owner, repo, candidates[0], ref)
+            result.setdefault("html_url", None)
+            return result
+        
+        result = await self._request("GET", f"/repos/{owner}/{repo}/readme", params={"ref": ref},
+                                     immutable=is_commit_sha(ref))
         
         # 解码内容
-        if "content" in result and not result.get("error"):
-            try:
-                result["decoded_content"] = base64.b64decode(result["content"]).decode("utf-8")
-            except Exception as e:
-                result["decode_error"] = str(e)
+        self._decode_content(result)
         
         return result
     
-    def search_repositories(self, query: str, page: int = 1, per_page: int = 20, 
+    async def search_repositories(self, query: str, page: int = 1, per_page: int = 20, 
                           language: Optional[str] = None, sort: str = "best_match") -> Dict[str, Any]:
         """搜索仓库
         
@@ -121,10 +595,10 @@ class GiteeClient:
         if language:
             params["language"] = language
         
-        return self._request("GET", "/search/repositories", params=params)
+        return await self._request("GET", "/search/repositories", params=params)
     
-    def get_repo_commits(self, owner: str, repo: str, page: int = 1, per_page: int = 10, 
-                        sha: str = "master") -> List[Dict[str, Any]]:
+    async def get_repo_commits(self, owner: str, repo: str, page: int = 1, per_page: int = 10, 
+                        sha: Optional[str] = None) -> List[Dict[str, Any]]:
         """获取仓库提交历史
         
         Args:
@@ -132,21 +606,24 @@ class GiteeClient:
             repo: 仓库名称
             page: 页码
             per_page: 每页数量
-            sha: 分支名称
+            sha: 分支名或提交 SHA，默认为仓库默认分支
         """
+        # 从解析后的提交 SHA 开始的历史不会变化
+        sha = await self.resolve_ref(owner, repo, sha)
         params = {
             "sha": sha,
             "page": page,
             "per_page": per_page
         }
-        result = self._request("GET", f"/repos/{owner}/{repo}/commits", params=params)
+        result = await self._request("GET", f"/repos/{owner}/{repo}/commits", params=params,
+                                     immutable=is_commit_sha(sha))
         
         if isinstance(result, list):
             return result
         else:
             return []
     
-    def search_code(self, query: str, owner: str, repo: str, page: int = 1, per_page: int = 20) -> Dict[str, Any]:
+    async def search_code(self, query: str, owner: str, repo: str, page: int = 1, per_page: int = 20) -> Dict[str, Any]:
         """在仓库中搜索代码
         
         Args:
@@ -162,9 +639,9 @@ class GiteeClient:
             "page": page,
             "per_page": per_page
         }
-        return self._request("GET", "/search/code", params=params)
+        return await self._request("GET", "/search/code", params=params)
     
-    def __del__(self):
-        """清理资源"""
-        if hasattr(self, 'client'):
-            self.client.close()
+    async def aclose(self):
+        """关闭自行创建的 HTTP 连接（共享客户端由连接池负责关闭）"""
+        if self._owns_client:
+            await self.client.aclose()
@@ -0,0 +1,164 @@
+"""
+Gitee API 响应缓存
+
+为 GiteeClient._request 提供三类能力：
+1. 保存 ETag / Last-Modified，过期后发送条件请求，304 时复用旧响应体
+2. 按接口配置 TTL，TTL 内直接命中不访问上游
+3. 对 404 做负缓存，Agent 反复猜测不存在的路径时无需再次请求
+
+多进程部署时可挂接共享层（SharedCacheStore），各工作进程共享拉取结果。
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple
+from shared_cache import SharedCacheStore, encode_entry, decode_entry
+
+
+@dataclass
+class CacheEntry:
+    """一条缓存的响应"""
+    status: int
+    body: bytes
+    expires_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires_at > time.monotonic()
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+
+class HttpCache:
+    """按字节数限额的 LRU 响应缓存"""
+
+    def __init__(self, ttl_rules: List[Tuple[str, int]], default_ttl: int,
+                 negative_ttl: int, max_bytes: int = 32 * 1024 * 1024,
+                 immutable_ttl: int = 30 * 24 * 3600,
+                 shared: Optional[SharedCacheStore] = None):
+        """
+        Args:
+            ttl_rules: (接口正则, TTL 秒) 列表，按顺序匹配第一条
+            default_ttl: 未匹配任何规则时的 TTL
+            negative_ttl: 404 响应的缓存时间
+            max_bytes: 响应体总字节数上限
+            immutable_ttl: 针对提交 SHA 的请求（内容不可变）的 TTL
+            shared: 跨进程共享层，内存未命中时读取，写入时同步写入
+        """
+        self.ttl_rules = [(re.compile(pattern), ttl) for pattern, ttl in ttl_rules]
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.immutable_ttl = immutable_ttl
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.shared_hits = 0
+
+    @staticmethod
+    def make_key(method: str, endpoint: str, params: Optional[Dict[str, Any]]) -> str:
+        """生成缓存键（不包含 access_token）"""
+        items = sorted(
+            (k, str(v)) for k, v in (params or {}).items() if k != "access_token"
+        )
+        query = "&".join(f"{k}={v}" for k, v in items)
+        return f"{method.upper()} /{endpoint.lstrip('/')}?{query}"
+
+    def ttl_for(self, endpoint: str) -> int:
+        """查询接口对应的 TTL"""
+        endpoint = "/" + endpoint.lstrip("/")
+        for pattern, ttl in self.ttl_rules:
+            if pattern.search(endpoint):
+                return ttl
+        return self.default_ttl
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """读取缓存条目（可能已过期，由调用方决定是否重新验证）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        if self.shared is None:
+            return None
+
+        found = self.shared.get(key)
+        if found is None:
+            return None
+        value, expires_at = found
+        meta, body = decode_entry(value)
+        # 共享层保存墙钟时间，换算为本进程的单调时钟
+        entry = CacheEntry(
+            status=meta["status"],
+            body=body,
+            expires_at=time.monotonic() + (expires_at - time.time()),
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+            error=meta.get("error")
+        )
+        self._remember(key, entry)
+        with self._lock:
+            self.shared_hits += 1
+        return entry
+
+    def put(self, key: str, entry: CacheEntry):
+        """写入缓存条目并按字节数淘汰（有共享层时同时写入共享层）"""
+        self._remember(key, entry)
+        if self.shared is not None:
+            meta = {"status": entry.status, "etag": entry.etag,
+                    "last_modified": entry.last_modified, "error": entry.error}
+            self.shared.put(key, encode_entry(meta, entry.body),
+                            time.time() + (entry.expires_at - time.monotonic()))
+
+    def _remember(self, key: str, entry: CacheEntry):
+        """写入内存层并按字节数淘汰"""
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.size
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+    def record(self, outcome: str):
+        """记录一次缓存结果：hit / negative_hit / miss / revalidated"""
+        with self._lock:
+            if outcome == "hit":
+                self.hits += 1
+            elif outcome == "negative_hit":
+                self.negative_hits += 1
+            elif outcome == "revalidated":
+                self.revalidated += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "shared_hits": self.shared_hits,
+            }
@@ -0,0 +1,376 @@
+"""
+异步任务
+
+Agent 运行可能持续数分钟，同步接口要求客户端在整个运行期间保持连接。这里把
+请求处理与 Agent 执行解耦：
+1. 提交后立即返回任务 ID，任务进入有上限的队列，队列已满时拒绝
+2. 固定数量的工作协程从队列中取出任务，在准入许可内执行，与聊天接口共用同一个并发上限
+3. 执行过程中记录工具调用进度，客户端轮询状态与进度
+4. 结束的任务保留一段时间后清理
+5. 多进程部署时任务状态写入共享的 SQLite，任意工作进程都能查询
+"""
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field, asdict
+from typing import AsyncContextManager, Awaitable, Callable, Dict, Any, List, Optional, Tuple
+from admission import AdmissionRejected
+from compat import to_thread
+from config import get_settings
+import tracing
+
+# 运行时长滑动平均的权重，用于估算 Retry-After
+_RUN_EWMA_ALPHA = 0.2
+# 清理过期任务的间隔（秒）
+_PURGE_INTERVAL = 60
+
+# 任务执行函数：接收进度事件回调，返回 Agent 结果
+JobRunner = Callable[[Callable[[Dict[str, Any]], Awaitable[None]]], Awaitable[Dict[str, Any]]]
+# 任务执行前进入的上下文（如运行许可）
+JobSlot = Callable[[], AsyncContextManager]
+
+
+@dataclass
+class Job:
+    """一个异步任务"""
+    job_id: str
+    kind: str
+    session_id: str
+    status: str = "queued"  # queued / running / succeeded / failed / cancelled
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # 工具调用进度：tool_start / tool_end 事件的精简记录
+    progress: List[Dict[str, Any]] = field(default_factory=list)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class JobStore:
+    """SQLite（WAL 模式）中的任务状态，供多个工作进程共享"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 数据库文件路径
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute("PRAGMA busy_timeout = 5000")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, data TEXT NOT NULL, finished_at REAL)"
+            )
+
+    def save(self, job: Job):
+        data = json.dumps(job.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO jobs (job_id, data, finished_at) VALUES (?, ?, ?)",
+                               (job.job_id, data, job.finished_at))
+
+    def load(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return Job(**json.loads(row[0])) if row else None
+
+    def purge(self, finished_before: float) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM jobs WHERE finished_at < ?", (finished_before,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobManager:
+    """有界任务队列 + 固定数量的工作协程"""
+
+    def __init__(self, workers: int, max_queue: int, ttl: float,
+                 max_progress: int = 200, store: Optional[JobStore] = None):
+        """
+        Args:
+            workers: 工作协程数，即同时执行的任务数
+            max_queue: 排队任务数上限，超出时拒绝提交
+            ttl: 任务结束后保留的秒数
+            max_progress: 每个任务最多记录的进度事件数
+            store: 共享的任务状态存储，多进程部署时使用
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.max_progress = max_progress
+        self.store = store
+
+        self._jobs: Dict[str, Job] = {}
+        self._queue: "asyncio.Queue[Tuple[Job, JobRunner, Optional[JobSlot]]]" = asyncio.Queue()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._run_avg = 0.0
+
+        self.submitted = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.deferred = 0
+        self.purged = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def _ensure_started(self):
+        """首次提交时在当前事件循环中启动工作协程与清理任务"""
+        if self._tasks and not any(task.done() for task in self._tasks):
+            return
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._purge_loop()))
+
+    async def _save(self, job: Job):
+        """把任务状态写入共享存储；写入失败不影响任务执行"""
+        if self.store is None:
+            return
+        try:
+            await to_thread(self.store.save, job)
+        except sqlite3.Error as e:
+            self.errors += 1
+            self.last_error = f"写入任务状态失败: {e}"
+
+    def _retry_after(self) -> int:
+        """按平均运行时长和排队长度估算多久后队列有空位"""
+        average = self._run_avg or 1.0
+        return max(1, math.ceil(average * (self._queue.qsize() + 1) / self.workers))
+
+    async def submit(self, kind: str, session_id: str, run: JobRunner,
+                     slot: Optional[JobSlot] = None) -> Job:
+        """提交任务，立即返回
+
+        Args:
+            slot: 任务执行前进入的上下文（如提交方的运行许可）；进入时被拒绝
+                （AdmissionRejected）的任务保持排队，按 Retry-After 稍后重试
+
+        Raises:
+            AdmissionRejected: 排队任务已满
+        """
+        if self._queue.qsize() >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected("任务队列已满", self._retry_after())
+        self._ensure_started()
+        job = Job(job_id=uuid.uuid4().hex, kind=kind, session_id=session_id)
+        self._jobs[job.job_id] = job
+        self._queue.put_nowait((job, run, slot))
+        self.submitted += 1
+        await self._save(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """查询任务；本进程中没有时从共享存储读取（可能由其他工作进程执行）"""
+        job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = await to_thread(self.store.load, job_id)
+        if job is not None and job.finished_at is not None and job.finished_at < time.time() - self.ttl:
+            return None
+        return job
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """取消本进程中排队或执行中的任务，返回取消后的任务"""
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        task = self._running.get(job_id)
+        job.status = "cancelled"
+        self.cancelled += 1
+        if task is not None:
+            # 由执行该任务的工作协程记录结束时间
+            task.cancel()
+            return job
+        # 仍在排队：由工作协程取出时跳过
+        job.finished_at = time.time()
+        await self._save(job)
+        return job
+
+    def _recorder(self, job: Job) -> Callable[[Dict[str, Any]], Awaitable[None]]:
+        """进度事件回调：只记录工具调用，回答文本的增量不保留"""
+        async def emit(event: Dict[str, Any]):
+            if event["type"] not in ("tool_start", "tool_end") or len(job.progress) >= self.max_progress:
+                return
+            job.progress.append({**event, "at": time.time()})
+            await self._save(job)
+        return emit
+
+    async def _worker(self):
+        while True:
+            job, run, slot = await self._queue.get()
+            try:
+                if job.status != "queued":
+                    continue
+                await self._execute(job, run, slot)
+            finally:
+                self._queue.task_done()
+
+    async def _traced(self, job: Job, run: JobRunner) -> Dict[str, Any]:
+        """执行任务；任务在提交请求结束后才运行，按采样率另起一条链路"""
+        with tracing.root_span(f"job.{job.kind}", job_id=job.job_id, session_id=job.session_id):
+            return await run(self._recorder(job))
+
+    async def _start(self, job: Job, run: JobRunner, slot: Optional[JobSlot]) -> Dict[str, Any]:
+        """进入 slot 后开始执行；等待许可期间任务仍为排队状态"""
+        async with AsyncExitStack() as stack:
+            while slot is not None:
+                try:
+                    await stack.enter_async_context(slot())
+                    break
+                except AdmissionRejected as e:
+                    # 任务已在本队列中排过队，准入被拒时不失败，稍后重试
+                    self.deferred += 1
+                    await asyncio.sleep(e.retry_after)
+            job.status = "running"
+            job.started_at = time.time()
+            await self._save(job)
+            return await self._traced(job, run)
+
+    async def _execute(self, job: Job, run: JobRunner, slot: Optional[JobSlot] = None):
+        task = asyncio.create_task(self._start(job, run, slot))
+        self._running[job.job_id] = task
+        try:
+            try:
+                # 不直接 await task：工作协程本身被取消时不能与客户端取消任务混淆
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                # 工作协程本身被取消（服务关闭），中止任务
+                task.cancel()
+                await asyncio.wait({task})
+                if job.status != "cancelled":
+                    job.status = "cancelled"
+                    job.error = "服务关闭，任务中止"
+                raise
+            if task.cancelled() or job.status == "cancelled":
+                # 客户端取消，或取消请求到达时任务恰好已完成
+                return
+            job.result = task.result()
+            job.status = "succeeded"
+            self.succeeded += 1
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"处理请求时出错: {str(e)}"
+            self.failed += 1
+        finally:
+            self._running.pop(job.job_id, None)
+            job.finished_at = time.time()
+            if job.started_at is not None:
+                elapsed = job.finished_at - job.started_at
+                self._run_avg = elapsed if not self._run_avg else (
+                    _RUN_EWMA_ALPHA * elapsed + (1 - _RUN_EWMA_ALPHA) * self._run_avg
+                )
+            await self._save(job)
+
+    def _purge(self) -> int:
+        """清理结束超过保留时间的任务"""
+        before = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < before]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+    async def _purge_loop(self):
+        while True:
+            await asyncio.sleep(min(_PURGE_INTERVAL, self.ttl))
+            try:
+                self.purged += self._purge()
+                if self.store is not None:
+                    await to_thread(self.store.purge, time.time() - self.ttl)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"清理失败: {e}"
+
+    async def aclose(self):
+        """停止工作协程；执行中的任务被中止，排队的任务标记为取消"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            job, _, _ = self._queue.get_nowait()
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.error = "服务关闭，任务中止"
+                job.finished_at = time.time()
+                await self._save(job)
+        if self.store is not None:
+            self.store.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """任务统计"""
+        return {
+            "workers": self.workers,
+            "running": sum(1 for job_id in self._running if self._jobs[job_id].status == "running"),
+            "waiting_admission": sum(1 for job_id in self._running if self._jobs[job_id].status == "queued"),
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "retained": len(self._jobs),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "deferred": self.deferred,
+            "purged": self.purged,
+            "run_seconds_avg": round(self._run_avg, 3),
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+def create_job_manager(settings) -> JobManager:
+    """按配置创建任务管理器；多进程部署时工作协程数与队列上限按进程数均分，任务状态写入共享目录"""
+    workers = max(1, settings.workers)
+    store = None
+    if workers > 1:
+        store = JobStore(os.path.join(settings.shared_cache_dir, "jobs.db"))
+    return JobManager(
+        workers=max(1, settings.job_workers // workers),
+        max_queue=max(1, settings.job_queue_size // workers),
+        ttl=settings.job_ttl,
+        max_progress=settings.job_max_progress,
+        store=store
+    )
+
+
+_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    """获取进程级任务管理器，首次调用时创建"""
+    global _manager
+    if _manager is None:
+        _manager = create_job_manager(get_settings())
+    return _manager
+
+
+async def close_job_manager():
+    """关闭进程级任务管理器"""
+    global _manager
+    if _manager is not None:
+        manager, _manager = _manager, None
+        await manager.aclose()
@@ -1,23 +1,33 @@
 """
 LLM 客户端，支持 OpenAI 标准 API
 """
+import time
 from typing import List, Dict, Any, Optional
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 from config import get_settings
+import metrics
+import tracing
 
 
 class LLMClient:
     """LLM 客户端，支持 OpenAI 标准 API 格式"""
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        """
+        Args:
+            http_client: 共享的 HTTP 客户端；不传时由 OpenAI SDK 自行创建
+        """
         settings = get_settings()
-        self.client = OpenAI(
+        self._owns_client = http_client is None
+        self.client = AsyncOpenAI(
             api_key=settings.openai_api_key,
-            base_url=settings.openai_api_base
+            base_url=settings.openai_api_base,
+            http_client=http_client
         )
         self.model = settings.openai_model
     
-    def chat(self, messages: List[Dict[str, str]], 
+    async def chat(self, messages: List[Dict[str, str]], 
              temperature: float = 0.7,
              max_tokens: Optional[int] = None,
              tools: Optional[List[Dict[str, Any]]] = None,
@@ -32,7 +42,7 @@ class LLMClient:
             tool_choice: 工具选择策略
             
         Returns:
-            API 响应
+            API 响应；成功时 usage 为服务端返回的 token 用量（未返回时为 None）
         """
         kwargs = {
             "model": self.model,
@@ -48,27 +58,40 @@ class LLMClient:
             if tool_choice:
                 kwargs["tool_choice"] = tool_choice
         
-        try:
-            response = self.client.chat.completions.create(**kwargs)
+        start = time.perf_counter()
+        with tracing.span("llm.chat", mode="complete", model=self.model, messages=len(messages)) as span:
+            try:
+                response = await self.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                metrics.llm_duration.observe(time.perf_counter() - start, "complete", "error")
+                span.fail(e)
+                return {
+                    "success": False,
+                    "error": str(e)
+                }
+            metrics.llm_duration.observe(time.perf_counter() - start, "complete", "ok")
+            usage = response.usage.model_dump() if response.usage else None
+            if usage:
+                span.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
             return {
                 "success": True,
-                "response": response
-            }
-        except Exception as e:
-            return {
-                "success": False,
-                "error": str(e)
+                "response": response,
+                "usage": usage
             }
     
-    def stream_chat(self, messages: List[Dict[str, str]], 
+    async def stream_chat(self, messages: List[Dict[str, str]], 
                     temperature: float = 0.7,
-                    max_tokens: Optional[int] = None):
+                    max_tokens: Optional[int] = None,
+                    tools: Optional[List[Dict[str, Any]]] = None,
+                    tool_choice: Optional[str] = None):
         """流式聊天请求
         
         Args:
             messages: 消息列表
             temperature: 温度参数
             max_tokens: 最大 token 数
+            tools: 可用工具列表（Function Calling），工具调用以增量形式返回
+            tool_choice: 工具选择策略
             
         Yields:
             响应流
@@ -83,9 +106,43 @@ class LLMClient:
         if max_tokens:
             kwargs["max_tokens"] = max_tokens
         
+        if tools:
+            kwargs["tools"] = tools
+            if tool_choice:
+                kwargs["tool_choice"] = tool_choice
+        
+        start = time.perf_counter()
+        first = True
+        chunks = 0
+        # 调用方提前结束迭代（如客户端断开）时保持为 cancelled
+        outcome = "cancelled"
+        # 生成器在 yield 之间交还控制权，span 不设为当前 span，只在发起请求期间作为父 span
+        span = tracing.start_span("llm.chat", mode="stream", model=self.model, messages=len(messages))
         try:
-            stream = self.client.chat.completions.create(**kwargs)
-            for chunk in stream:
+            with tracing.activate(span):
+                stream = await self.client.chat.completions.create(**kwargs)
+            async for chunk in stream:
+                chunks += 1
+                if first:
+                    metrics.llm_first_token.observe(time.perf_counter() - start)
+                    span.set(first_chunk_ms=round((time.perf_counter() - start) * 1000, 1))
+                    first = False
+                usage = getattr(chunk, "usage", None)
+                if usage:
+                    usage = usage if isinstance(usage, dict) else usage.model_dump()
+                    span.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
                 yield chunk
+            outcome = "ok"
         except Exception as e:
+            outcome = "error"
+            span.fail(e)
             yield {"error": str(e)}
+        finally:
+            metrics.llm_duration.observe(time.perf_counter() - start, "stream", outcome)
+            span.set(chunks=chunks, outcome=outcome)
+            span.end()
+    
+    async def aclose(self):
+        """关闭自行创建的 HTTP 连接（共享客户端由连接池负责关闭）"""
+        if self._owns_client:
+            await self.client.close()
@@ -1,31 +1,73 @@
 """
 Chat2Repo 主应用
 """
+import asyncio
+import json
+import time
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Dict
-from fastapi import FastAPI, HTTPException
+from typing import AsyncIterator, Dict, Any, Callable, Awaitable, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
 from models import (
     RepoChatRequest, 
     TechChatRequest, 
+    BatchChatRequest,
     ChatResponse, 
     ChatMessage,
-    SessionHistory
+    SessionHistory,
+    JobRequest,
+    JobStatus
 )
-from agents import RepoAgent, SearchAgent
+from agents import RepoAgent, SearchAgent, answer_batch
 from config import get_settings
+from client_pool import get_client_pool, close_client_pool
+from session_store import Session, get_session_store, close_session_store
+from admission import AdmissionRejected
+from jobs import Job, get_job_manager, close_job_manager
+import metrics
+import profiler
+import tracing
 import uvicorn
 import os
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时创建共享客户端池、会话存储、任务管理器、追踪器和剖析器，关闭时中止任务、释放连接、写入剩余会话并导出剩余 span"""
+    get_client_pool()
+    get_session_store()
+    get_job_manager()
+    tracing.get_tracer()
+    # 剖析器在事件循环线程中绑定，记录被剖析请求创建的任务
+    profiler.get_profiler().attach()
+    flush_task = None
+    settings = get_settings()
+    if settings.workers > 1:
+        # 多进程部署：/metrics 合并所有工作进程的计数
+        metrics.registry.enable_shared(os.path.join(settings.shared_cache_dir, "metrics"),
+                                       settings.metrics_flush_interval)
+        flush_task = asyncio.create_task(metrics.registry.flush_loop())
+    yield
+    if flush_task is not None:
+        flush_task.cancel()
+    # 先中止任务，任务中已完成的问答仍会写入会话
+    await close_job_manager()
+    await close_session_store()
+    await close_client_pool()
+    await tracing.close_tracer()
+    profiler.close_profiler()
+
+
 # 创建应用
 app = FastAPI(
     title="Chat2Repo - Gitee Repository Chat Agent",
     description="与 Gitee 仓库对话，获取技术解决方案",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 挂载静态文件目录
@@ -40,10 +82,167 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
+)
+# 请求级链路追踪：按采样率为 API 请求记录根 span，覆盖流式响应的整个发送过程
+app.add_middleware(tracing.TracingMiddleware)
+# 管理员请求带 X-Profile 头时在采样剖析下执行
+app.add_middleware(profiler.ProfilingMiddleware)
+
+
+def _stored_sessions() -> Dict[Tuple[str, ...], float]:
+    """存储中的会话总数（由 count_stored 按 TTL 刷新，尚未统计时不导出）"""
+    stored = get_session_store().stats()["stored"]
+    return {(): stored} if stored is not None else {}
+
+
+# 导出时从各组件统计中读取的状态量
+metrics.registry.gauge(
+    "sessions", "本进程内存中的会话数；state 为 cached（全部）或 dirty（尚未写入）",
+    lambda: {(state,): get_session_store().stats()[key] for state, key in (("cached", "cached"), ("dirty", "dirty"))},
+    labels=("state",)
 )
+metrics.registry.gauge("sessions_stored", "存储中的会话总数", _stored_sessions, shared=True)
+metrics.registry.gauge(
+    "runs_in_flight", "执行中的 Agent 运行数（聊天接口）", lambda: {(): get_client_pool().admission.stats()["running"]}
+)
+metrics.registry.gauge(
+    "run_queue_depth", "等待运行许可的请求数", lambda: {(): get_client_pool().admission.stats()["queue_depth"]}
+)
+metrics.registry.gauge(
+    "jobs", "异步任务数；state 为 running 或 queued",
+    lambda: {(state,): get_job_manager().stats()[key] for state, key in (("running", "running"), ("queued", "queue_depth"))},
+    labels=("state",)
+)
+
+
+def _to_history(session: Session) -> SessionHistory:
+    """把存储中的会话转换为 API 响应模型"""
+    return SessionHistory(
+        session_id=session.session_id,
+        messages=[
+            ChatMessage(role=msg.role, content=msg.content, timestamp=datetime.fromtimestamp(msg.timestamp))
+            for msg in session.messages
+        ],
+        created_at=datetime.fromtimestamp(session.created_at),
+        updated_at=datetime.fromtimestamp(session.updated_at)
+    )
+
 
-# 会话存储（简单的内存存储，生产环境应使用数据库）
-sessions: Dict[str, SessionHistory] = {}
+async def _save_turn(session: Session, question: str, answer: str):
+    """保存一轮问答到会话；多进程部署时立即写入，使其他工作进程可见"""
+    store = get_session_store()
+    store.append(session, "user", question)
+    store.append(session, "assistant", answer)
+    if store.write_through:
+        await store.flush()
+
+
+def _caller_key(http_request: Request) -> str:
+    """准入控制中的调用方：X-API-Key 头，缺省为客户端 IP"""
+    api_key = http_request.headers.get("X-API-Key")
+    if api_key:
+        return f"key:{api_key}"
+    return f"ip:{http_request.client.host if http_request.client else 'unknown'}"
+
+
+async def _admit(http_request: Request) -> str:
+    """等待运行许可，未获准入时返回 429，返回调用方 Key"""
+    key = _caller_key(http_request)
+    try:
+        await get_client_pool().admission.acquire(key)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"服务繁忙（{e.reason}），请稍后重试",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    return key
+
+
+@asynccontextmanager
+async def _admitted(http_request: Request):
+    """在运行许可内执行一次 Agent 运行"""
+    key = await _admit(http_request)
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        get_client_pool().admission.release(key, time.monotonic() - start)
+
+
+async def _release_later(http_request: Request) -> Callable[[], None]:
+    """流式接口：先获取运行许可（未获准入时直接返回 429），返回归还许可的回调"""
+    key = await _admit(http_request)
+    start = time.monotonic()
+    return lambda: get_client_pool().admission.release(key, time.monotonic() - start)
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    """编码一条 Server-Sent Event"""
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+def _stream_agent(session: Session, question: str,
+                  run: Callable[[Callable], Awaitable[Dict[str, Any]]],
+                  on_finish: Callable[[], None]) -> StreamingResponse:
+    """以 SSE 形式执行 Agent
+    
+    先立即发送 session 事件，随后转发工具调用的 tool_start / tool_end 事件和
+    回答文本的 token 事件，最后发送包含完整回答的 done 事件（出错时为 error 事件）。
+    客户端断开时取消仍在执行的 Agent。
+    
+    Args:
+        on_finish: Agent 结束（含取消）时调用，用于归还运行许可
+    """
+    queue: "asyncio.Queue" = asyncio.Queue()
+    
+    async def emit(event: Dict[str, Any]):
+        await queue.put(event)
+    
+    async def worker():
+        try:
+            result = await run(emit)
+            
+            # 保存消息到会话
+            await _save_turn(session, question, result["answer"])
+            
+            done = {
+                "type": "done",
+                "answer": result["answer"],
+                "session_id": session.session_id,
+                "tool_calls": result.get("tool_calls", []),
+                "token_usage": result.get("token_usage")
+            }
+            if result.get("error"):
+                done["error"] = result["error"]
+            await queue.put(done)
+        except Exception as e:
+            await queue.put({"type": "error", "message": f"处理请求时出错: {str(e)}"})
+        finally:
+            on_finish()
+            await queue.put(None)
+    
+    # 立即启动：即使响应还没开始发送客户端就断开，许可也会在 Agent 结束时归还
+    task = asyncio.create_task(worker())
+    
+    async def events():
+        try:
+            yield _sse({"type": "session", "session_id": session.session_id})
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield _sse(event)
+        finally:
+            task.cancel()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.get("/")
@@ -57,7 +256,9 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "repo_chat": "/api/chat/repo",
+            "repo_chat_stream": "/api/chat/repo/stream",
             "tech_chat": "/api/chat/tech",
+            "tech_chat_stream": "/api/chat/tech/stream",
             "session": "/api/sessions/{session_id}"
         }
     }
@@ -69,75 +270,173 @@ async def health_check():
     return {"status": "healthy"}
 
 
+def _stream_batch(events: AsyncIterator[Dict[str, Any]], on_finish: Callable[[], None]) -> StreamingResponse:
+    """以 NDJSON 形式逐行返回批量问答的事件
+    
+    客户端断开时停止剩余的问题。
+    
+    Args:
+        on_finish: 批量问答结束（含取消）时调用，用于归还运行许可
+    """
+    queue: "asyncio.Queue" = asyncio.Queue()
+    
+    async def worker():
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put({"type": "error", "message": f"处理请求时出错: {str(e)}"})
+        finally:
+            await events.aclose()
+            on_finish()
+            await queue.put(None)
+    
+    # 立即启动：即使响应还没开始发送客户端就断开，许可也会在批量问答结束时归还
+    task = asyncio.create_task(worker())
+    
+    async def lines():
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield json.dumps(event, ensure_ascii=False, default=str) + "\n"
+        finally:
+            if not task.done():
+                task.cancel()
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus 格式的指标"""
+    # 会话总数按 TTL 缓存，过期时在线程中重新统计
+    await get_session_store().count_stored()
+    return PlainTextResponse(await metrics.registry.export(), media_type="text/plain; version=0.0.4")
+
+
+def _require_admin(http_request: Request):
+    """管理接口要求 X-Admin-Token 头与 ADMIN_TOKEN 一致"""
+    reason = profiler.authorize(http_request.headers.get("X-Admin-Token"))
+    if reason is not None:
+        raise HTTPException(status_code=403, detail=reason)
+
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, http_request: Request):
+    """下载单次请求剖析的结果（X-Profile 头请求的响应头 X-Profile-Id）"""
+    _require_admin(http_request)
+    found = profiler.get_profiler().find(profile_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="剖析结果不存在")
+    path, fmt = found
+    media_type = "application/json" if fmt == "speedscope" else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+
+
+@app.get("/api/admin/profile")
+async def get_continuous_profile(
+    http_request: Request,
+    format: str = Query("summary", pattern="^(summary|collapsed|speedscope)$",
+                        description="summary 按区域汇总热点帧；collapsed / speedscope 为完整的栈"),
+    reset: bool = Query(False, description="读取后清空已有样本")
+):
+    """本工作进程常驻低频采样的结果"""
+    _require_admin(http_request)
+    result = profiler.get_profiler().continuous_profile(format, reset)
+    if format == "collapsed":
+        return PlainTextResponse(result)
+    return result
+
+
+@app.post("/api/admin/profile/continuous")
+async def set_continuous_profile(
+    http_request: Request,
+    interval: float = Query(..., ge=0, description="采样间隔（秒），0 表示关闭")
+):
+    """运行时开启或关闭本工作进程的常驻低频采样"""
+    _require_admin(http_request)
+    instance = profiler.get_profiler()
+    instance.set_continuous(interval)
+    return instance.stats()
+
+
+@app.get("/api/stats")
+async def get_stats():
+    """缓存等运行时统计，供监控使用"""
+    pool = get_client_pool()
+    await get_session_store().count_stored()
+    return {
+        "pid": os.getpid(),
+        "blob_cache": pool.blob_cache.stats(),
+        "decoded_files": pool.decoded_files.stats(),
+        "http_cache": pool.http_cache.stats(),
+        "snapshots": pool.snapshots.stats(),
+        "singleflight": pool.gitee.inflight.stats(),
+        "scheduler": pool.scheduler.stats(),
+        "admission": pool.admission.stats(),
+        "jobs": get_job_manager().stats(),
+        "tracing": tracing.get_tracer().stats(),
+        "profiler": profiler.get_profiler().stats(),
+        "sessions": get_session_store().stats(),
+        "shared_cache": pool.shared_cache.stats() if pool.shared_cache is not None else None
+    }
+
+
 @app.post("/api/chat/repo", response_model=ChatResponse)
-async def chat_with_repo(request: RepoChatRequest):
+async def chat_with_repo(request: RepoChatRequest, http_request: Request):
     """与仓库对话
     
     与指定的 Gitee 仓库进行对话，Agent 会自动读取所需的文件内容
     """
     # 获取或创建会话
     session_id = request.session_id or str(uuid.uuid4())
-    
-    if session_id not in sessions:
-        sessions[session_id] = SessionHistory(
-            session_id=session_id,
-            messages=[],
-            created_at=datetime.now(),
-            updated_at=datetime.now()
-        )
-    
-    session = sessions[session_id]
+    session = await get_session_store().get_or_create(
+        session_id, kind="repo", repo=f"{request.repo_owner}/{request.repo_name}"
+    )
     
     # 创建 Agent
-    agent = RepoAgent()
+    agent = RepoAgent(snapshot=request.snapshot)
     
     # 恢复对话历史
     for msg in session.messages:
         agent.add_message(msg.role, msg.content)
     
-    try:
-        # 执行对话
-        result = agent.chat(
-            repo_owner=request.repo_owner,
-            repo_name=request.repo_name,
-            question=request.question,
-            ref=request.ref
-        )
-        
-        # 保存消息到会话
-        session.messages.append(ChatMessage(role="user", content=request.question))
-        session.messages.append(ChatMessage(role="assistant", content=result["answer"]))
-        session.updated_at = datetime.now()
-        
-        # 构建响应
-        return ChatResponse(
-            answer=result["answer"],
-            session_id=session_id,
-            tool_calls=result.get("tool_calls", [])
-        )
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"处理请求时出错: {str(e)}")
+    async with _admitted(http_request):
+        try:
+            # 执行对话
+            result = await agent.chat(
+                repo_owner=request.repo_owner,
+                repo_name=request.repo_name,
+                question=request.question,
+                ref=request.ref
+            )
+            
+            # 保存消息到会话
+            await _save_turn(session, request.question, result["answer"])
+            
+            # 构建响应
+            return ChatResponse(
+                answer=result["answer"],
+                session_id=session_id,
+                tool_calls=result.get("tool_calls", []),
+                token_usage=result.get("token_usage")
+            )
+            
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"处理请求时出错: {str(e)}")
 
 
 @app.post("/api/chat/tech", response_model=ChatResponse)
-async def chat_tech_question(request: TechChatRequest):
+async def chat_tech_question(request: TechChatRequest, http_request: Request):
     """技术问答
     
     提出技术问题，Agent 会在 Gitee 上搜索相关的开源解决方案
     """
     # 获取或创建会话
     session_id = request.session_id or str(uuid.uuid4())
-    
-    if session_id not in sessions:
-        sessions[session_id] = SessionHistory(
-            session_id=session_id,
-            messages=[],
-            created_at=datetime.now(),
-            updated_at=datetime.now()
-        )
-    
-    session = sessions[session_id]
+    session = await get_session_store().get_or_create(session_id, kind="tech")
     
     # 创建 Agent
     agent = SearchAgent()
@@ -146,70 +445,271 @@ async def chat_tech_question(request: TechChatRequest):
     for msg in session.messages:
         agent.add_message(msg.role, msg.content)
     
-    try:
-        # 执行搜索
-        result = agent.search(
-            question=request.question,
-            language=request.language
+    async with _admitted(http_request):
+        try:
+            # 执行搜索
+            result = await agent.search(
+                question=request.question,
+                language=request.language
+            )
+            
+            # 保存消息到会话
+            await _save_turn(session, request.question, result["answer"])
+            
+            # 构建响应
+            return ChatResponse(
+                answer=result["answer"],
+                session_id=session_id,
+                tool_calls=result.get("tool_calls", []),
+                token_usage=result.get("token_usage")
+            )
+            
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"处理请求时出错: {str(e)}")
+
+
+@app.post("/api/chat/repo/stream")
+async def chat_with_repo_stream(request: RepoChatRequest, http_request: Request):
+    """与仓库对话（SSE 流式）
+    
+    逐条推送工具调用进度，并在最终回答生成时逐段推送文本
+    """
+    session = await get_session_store().get_or_create(
+        request.session_id or str(uuid.uuid4()),
+        kind="repo", repo=f"{request.repo_owner}/{request.repo_name}"
+    )
+    
+    agent = RepoAgent(snapshot=request.snapshot)
+    for msg in session.messages:
+        agent.add_message(msg.role, msg.content)
+    
+    return _stream_agent(session, request.question, lambda emit: agent.chat(
+        repo_owner=request.repo_owner,
+        repo_name=request.repo_name,
+        question=request.question,
+        ref=request.ref,
+        emit=emit
+    ), await _release_later(http_request))
+
+
+@app.post("/api/chat/repo/batch")
+async def chat_with_repo_batch(request: BatchChatRequest, http_request: Request):
+    """批量仓库问答（NDJSON 流式）
+    
+    对同一仓库的一组问题只读取一次 README 和目录概览，并发回答后按完成顺序逐行返回：
+    context、每个问题一条 answer（含 index），最后是 done。读取仓库上下文时占用一个运行许可
+    （未获准入时返回 429），之后每个问题各自获取运行许可。
+    """
+    settings = get_settings()
+    if len(request.questions) > settings.batch_max_questions:
+        raise HTTPException(status_code=400, detail=f"每批最多 {settings.batch_max_questions} 个问题")
+    concurrency = min(request.concurrency or settings.batch_concurrency, settings.batch_concurrency)
+    
+    key = await _admit(http_request)
+    admission = get_client_pool().admission
+    released = False
+    
+    def release():
+        """归还读取上下文期间占用的许可（只归还一次）"""
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(key)
+    
+    async def events() -> AsyncIterator[Dict[str, Any]]:
+        batch = answer_batch(
+            request.repo_owner,
+            request.repo_name,
+            request.questions,
+            ref=request.ref,
+            concurrency=concurrency,
+            snapshot=request.snapshot,
+            context_tokens=settings.batch_context_tokens,
+            slot=lambda: admission.slot(key)
         )
-        
-        # 保存消息到会话
-        session.messages.append(ChatMessage(role="user", content=request.question))
-        session.messages.append(ChatMessage(role="assistant", content=result["answer"]))
-        session.updated_at = datetime.now()
-        
-        # 构建响应
+        try:
+            async for event in batch:
+                if event["type"] in ("context", "error"):
+                    # 上下文就绪后才开始回答，先归还许可，避免与问题的许可互相等待
+                    release()
+                yield event
+        finally:
+            await batch.aclose()
+    
+    return _stream_batch(events(), release)
+
+
+@app.post("/api/chat/tech/stream")
+async def chat_tech_question_stream(request: TechChatRequest, http_request: Request):
+    """技术问答（SSE 流式）"""
+    session = await get_session_store().get_or_create(request.session_id or str(uuid.uuid4()), kind="tech")
+    
+    agent = SearchAgent()
+    for msg in session.messages:
+        agent.add_message(msg.role, msg.content)
+    
+    return _stream_agent(session, request.question, lambda emit: agent.search(
+        question=request.question,
+        language=request.language,
+        emit=emit
+    ), await _release_later(http_request))
+
+
+def _to_job_status(job: Job) -> JobStatus:
+    """把任务转换为 API 响应模型"""
+    def when(timestamp: Optional[float]) -> Optional[datetime]:
+        return datetime.fromtimestamp(timestamp) if timestamp is not None else None
+    
+    return JobStatus(
+        job_id=job.job_id,
+        kind=job.kind,
+        status=job.status,
+        session_id=job.session_id,
+        created_at=datetime.fromtimestamp(job.created_at),
+        started_at=when(job.started_at),
+        finished_at=when(job.finished_at),
+        progress=job.progress,
+        result=job.result,
+        error=job.error
+    )
+
+
+@app.post("/api/jobs", response_model=JobStatus, status_code=202)
+async def submit_job(request: JobRequest, http_request: Request):
+    """提交异步任务
+    
+    立即返回任务 ID，Agent 在后台工作协程中执行；通过 GET /api/jobs/{job_id} 轮询状态、
+    工具调用进度和最终回答。任务执行时占用提交方的运行许可，与聊天接口共用并发上限
+    """
+    repo = None
+    if request.kind == "repo":
+        if not request.repo_owner or not request.repo_name:
+            raise HTTPException(status_code=400, detail="repo 任务需要 repo_owner 和 repo_name")
+        repo = f"{request.repo_owner}/{request.repo_name}"
+    session = await get_session_store().get_or_create(
+        request.session_id or str(uuid.uuid4()), kind=request.kind, repo=repo
+    )
+    
+    async def run(emit) -> Dict[str, Any]:
+        # 执行时才恢复对话历史，排队期间同一会话可能已有新的问答
+        agent = RepoAgent(snapshot=request.snapshot) if request.kind == "repo" else SearchAgent()
+        for msg in session.messages:
+            agent.add_message(msg.role, msg.content)
+        if request.kind == "repo":
+            result = await agent.chat(
+                repo_owner=request.repo_owner,
+                repo_name=request.repo_name,
+                question=request.question,
+                ref=request.ref,
+                emit=emit
+            )
+        else:
+            result = await agent.search(question=request.question, language=request.language, emit=emit)
+        await _save_turn(session, request.question, result["answer"])
         return ChatResponse(
             answer=result["answer"],
-            session_id=session_id,
-            tool_calls=result.get("tool_calls", [])
+            session_id=session.session_id,
+            tool_calls=result.get("tool_calls", []),
+            token_usage=result.get("token_usage")
+        ).model_dump()
+    
+    try:
+        key = _caller_key(http_request)
+        admission = get_client_pool().admission
+        job = await get_job_manager().submit(request.kind, session.session_id, run,
+                                             slot=lambda: admission.slot(key))
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"服务繁忙（{e.reason}），请稍后重试",
+            headers={"Retry-After": str(e.retry_after)}
         )
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"处理请求时出错: {str(e)}")
+    return _to_job_status(job)
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """查询异步任务的状态、工具调用进度和结果"""
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return _to_job_status(job)
+
+
+@app.delete("/api/jobs/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    """取消排队或执行中的异步任务"""
+    manager = get_job_manager()
+    job = await manager.cancel(job_id)
+    if job is None:
+        job = await manager.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="任务不存在或已过期")
+        if not job.finished:
+            raise HTTPException(status_code=409, detail="任务由其他工作进程执行，无法在此取消")
+    return _to_job_status(job)
 
 
 @app.get("/api/sessions/{session_id}", response_model=SessionHistory)
 async def get_session(session_id: str):
     """获取会话历史"""
-    if session_id not in sessions:
+    session = await get_session_store().get(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="会话不存在")
     
-    return sessions[session_id]
+    return _to_history(session)
 
 
 @app.delete("/api/sessions/{session_id}")
 async def delete_session(session_id: str):
     """删除会话"""
-    if session_id not in sessions:
+    if not await get_session_store().delete(session_id):
         raise HTTPException(status_code=404, detail="会话不存在")
     
-    del sessions[session_id]
     return {"message": "会话已删除", "session_id": session_id}
 
 
 @app.get("/api/sessions")
-async def list_sessions():
-    """列出所有会话"""
+async def list_sessions(
+    limit: int = Query(50, ge=1, le=200, description="每页数量"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    repo: Optional[str] = Query(None, description="只列出该仓库（owner/name）的会话")
+):
+    """按更新时间倒序分页列出会话摘要（不含消息内容）"""
+    try:
+        sessions, next_cursor = await get_session_store().list_sessions(limit=limit, cursor=cursor, repo=repo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
         "sessions": [
             {
-                "session_id": sid,
-                "message_count": len(session.messages),
-                "created_at": session.created_at,
-                "updated_at": session.updated_at
+                **summary,
+                "created_at": datetime.fromtimestamp(summary["created_at"]),
+                "updated_at": datetime.fromtimestamp(summary["updated_at"])
             }
-            for sid, session in sessions.items()
+            for summary in sessions
         ],
-        "total": len(sessions)
+        "next_cursor": next_cursor
     }
 
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Chat2Repo 服务")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，默认读取 WORKERS 配置")
+    args = parser.parse_args()
+    if args.workers is not None:
+        # 工作进程从环境变量读取配置，据此共享会话与缓存
+        os.environ["WORKERS"] = str(args.workers)
+    
     settings = get_settings()
+    workers = max(1, settings.workers)
     uvicorn.run(
         "main:app",
         host=settings.host,
         port=settings.port,
-        reload=settings.debug
+        # 自动重载与多进程不能同时使用
+        reload=settings.debug and workers == 1,
+        workers=workers
     )
@@ -0,0 +1,331 @@
+"""
+Prometheus 格式的运行指标
+
+/api/stats 只有各组件的累计计数，看不到延迟分布。这里提供 /metrics 所需的指标：
+1. 计数器与直方图只在事件循环线程中记录，记录一次只是一次字典查找和整数自增，
+   不加锁；直方图按桶分别计数，导出时再累加
+2. 会话数、执行中的运行数等状态量在导出时从各组件的统计中读取，热路径上没有开销
+3. 多进程部署时各工作进程定期把自己的计数写入共享目录，导出时合并所有存活进程的数据
+"""
+import asyncio
+import bisect
+import json
+import math
+import os
+from typing import Callable, Dict, Any, Iterable, List, Optional, Sequence, Tuple
+from compat import to_thread
+
+# 默认的延迟桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """单调递增计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> List[Any]:
+        return [[list(labels), value] for labels, value in self._values.items()]
+
+    @staticmethod
+    def merge(snapshots: Iterable[List[Any]]) -> Dict[Labels, float]:
+        merged: Dict[Labels, float] = {}
+        for snapshot in snapshots:
+            for labels, value in snapshot:
+                key = tuple(labels)
+                merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def render(self, merged: Dict[Labels, float]) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+                for labels, value in sorted(merged.items())]
+
+
+class Histogram:
+    """按桶计数的直方图"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [各桶计数（非累计，最后一个为 +Inf）, 总和]
+        self._values: Dict[Labels, List[Any]] = {}
+
+    def observe(self, value: float, *labels: str):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def snapshot(self) -> List[Any]:
+        return [[list(labels), list(counts), total] for labels, (counts, total) in self._values.items()]
+
+    @staticmethod
+    def merge(snapshots: Iterable[List[Any]]) -> Dict[Labels, List[Any]]:
+        merged: Dict[Labels, List[Any]] = {}
+        for snapshot in snapshots:
+            for labels, counts, total in snapshot:
+                key = tuple(labels)
+                entry = merged.get(key)
+                if entry is None:
+                    merged[key] = [list(counts), total]
+                else:
+                    entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                    entry[1] += total
+        return merged
+
+    def render(self, merged: Dict[Labels, List[Any]]) -> List[str]:
+        lines = []
+        bounds = list(self.buckets) + [math.inf]
+        for labels, (counts, total) in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """导出时通过回调读取的状态量"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], Dict[Labels, float]],
+                 labels: Sequence[str] = (), shared: bool = False):
+        """
+        Args:
+            read: 返回 {标签值元组: 数值}
+            shared: 数值来自多进程共享的存储（各进程读到的相同），合并时不累加
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.read = read
+        self.shared = shared
+
+    def snapshot(self) -> List[Any]:
+        try:
+            values = self.read()
+        except Exception:
+            # 组件尚未创建或已关闭
+            return []
+        return [[list(labels), value] for labels, value in values.items()]
+
+    def merge(self, snapshots: List[List[Any]]) -> Dict[Labels, float]:
+        if self.shared:
+            # 第一个快照为本进程的数据
+            return Counter.merge(snapshots[:1])
+        return Counter.merge(snapshots)
+
+    def render(self, merged: Dict[Labels, float]) -> List[str]:
+        return Counter.render(self, merged)
+
+
+class MetricsRegistry:
+    """指标注册表与文本格式导出"""
+
+    def __init__(self, namespace: str = "chat2repo"):
+        self.namespace = namespace
+        self._metrics: Dict[str, Any] = {}
+        # 多进程部署时各进程快照所在目录
+        self.shared_dir: Optional[str] = None
+        self.flush_interval = 5.0
+
+    def _register(self, metric):
+        metric.name = f"{self.namespace}_{metric.name}"
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], Dict[Labels, float]],
+              labels: Sequence[str] = (), shared: bool = False) -> Gauge:
+        return self._register(Gauge(name, help, read, labels, shared))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """本进程所有指标的当前值"""
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    # ---- 多进程 ----
+
+    def enable_shared(self, directory: str, flush_interval: float = 5.0):
+        """多进程部署：快照写入共享目录，导出时合并"""
+        os.makedirs(directory, exist_ok=True)
+        self.shared_dir = directory
+        self.flush_interval = flush_interval
+
+    def _write(self, local: Dict[str, Any]):
+        """把本进程的快照写入共享目录（原子替换）；共享存储中的状态量各进程相同，不写入"""
+        path = os.path.join(self.shared_dir, f"{os.getpid()}.json")
+        data = {name: values for name, values in local.items()
+                if not isinstance(self._metrics[name], Gauge) or not self._metrics[name].shared}
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def _exchange(self, local: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """写入本进程的快照并读取其他进程的快照"""
+        self._write(local)
+        return self._peer_snapshots()
+
+    async def flush(self):
+        """把本进程的快照写入共享目录；快照在事件循环中读取，文件写入在线程中执行"""
+        if self.shared_dir is None:
+            return
+        await to_thread(self._write, self.snapshot())
+
+    def _peer_snapshots(self) -> List[Dict[str, Any]]:
+        """其他存活工作进程的快照；已退出进程的文件被删除"""
+        if self.shared_dir is None:
+            return []
+        snapshots = []
+        for name in os.listdir(self.shared_dir):
+            if not name.endswith(".json"):
+                continue
+            pid = int(name[:-5]) if name[:-5].isdigit() else 0
+            if pid == os.getpid():
+                continue
+            path = os.path.join(self.shared_dir, name)
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            except PermissionError:
+                pass
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    async def flush_loop(self):
+        """多进程部署时定期写入本进程的快照，供其他进程导出时合并"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except OSError:
+                pass
+
+    # ---- 导出 ----
+
+    def _format(self, local: Dict[str, Any], peers: List[Dict[str, Any]]) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        lines: List[str] = []
+        for name, metric in self._metrics.items():
+            snapshots = [local[name]] + [peer[name] for peer in peers if name in peer]
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(metric.merge(snapshots)))
+        return "\n".join(lines) + "\n"
+
+    def render(self) -> str:
+        """本进程的指标，不读写共享目录"""
+        return self._format(self.snapshot(), [])
+
+    async def export(self) -> str:
+        """合并所有工作进程后的指标；多进程部署时共享目录的读写在线程中执行"""
+        local = self.snapshot()
+        peers = await to_thread(self._exchange, local) if self.shared_dir is not None else []
+        return self._format(local, peers)
+
+
+# ---- 进程级注册表与指标 ----
+
+registry = MetricsRegistry()
+
+tool_duration = registry.histogram(
+    "tool_duration_seconds", "Agent 工具执行耗时", labels=("tool", "outcome")
+)
+llm_duration = registry.histogram(
+    "llm_request_duration_seconds", "LLM 请求耗时（流式为完整接收所有块的耗时）", labels=("mode", "outcome")
+)
+llm_first_token = registry.histogram(
+    "llm_first_chunk_seconds", "流式 LLM 请求收到首个块的耗时"
+)
+llm_tokens = registry.counter(
+    "llm_tokens_total", "LLM token 用量；source 为 reported（服务端 usage）或 estimated（本地估算）",
+    labels=("type", "source")
+)
+agent_iterations = registry.histogram(
+    "agent_iterations", "每次 Agent 运行的迭代次数", labels=("agent", "outcome"),
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+)
+upstream_duration = registry.histogram(
+    "upstream_request_duration_seconds", "上游 HTTP 请求耗时（到收到响应头）", labels=("upstream",)
+)
+upstream_requests = registry.counter(
+    "upstream_requests_total", "上游 HTTP 请求数（含重试）；code 为状态码或异常类型", labels=("upstream", "code")
+)
+upstream_errors = registry.counter(
+    "upstream_errors_total", "上游错误数；kind 为 rate_limited / client_error / server_error / 异常类型",
+    labels=("upstream", "kind")
+)
+
+
+def record_upstream(upstream: str, elapsed: float, status: Optional[int] = None,
+                    exception: Optional[BaseException] = None):
+    """记录一次上游 HTTP 请求"""
+    upstream_duration.observe(elapsed, upstream)
+    if exception is not None:
+        kind = type(exception).__name__
+        upstream_requests.inc(upstream, kind)
+        upstream_errors.inc(upstream, kind)
+        return
+    upstream_requests.inc(upstream, str(status))
+    if status == 429:
+        upstream_errors.inc(upstream, "rate_limited")
+    elif status >= 500:
+        upstream_errors.inc(upstream, "server_error")
+    elif status >= 400 and status != 404:
+        # 404 是正常的查询结果（文件不存在等），不计为错误
+        upstream_errors.inc(upstream, "client_error")
@@ -0,0 +1,442 @@
+"""
+本地上游替身服务
+
+提供一个模拟 Gitee API v5 的 HTTP 服务、一个兼容 OpenAI Chat Completions 的
+模拟 LLM 服务和一个接收 OTLP/HTTP JSON 的链路收集器，用于在不访问外网的情况下
+压测和验证 Chat2Repo。
+"""
+import base64
+import hashlib
+import io
+import json
+import threading
+import time
+import uuid
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs, unquote
+
+
+def make_sample_repo() -> Dict[str, bytes]:
+    """生成一个小型示例仓库"""
+    files = {
+        "README.md": "# demo\n\n示例仓库，用于本地压测。\n".encode("utf-8"),
+        "main.py": b"import app\n\nif __name__ == '__main__':\n    app.run()\n",
+        "app/__init__.py": b"from .core import run\n",
+        "app/core.py": b"def run():\n    print('hello')\n",
+        "docs/guide.md": b"# Guide\n",
+    }
+    return files
+
+
+class _MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class MockGiteeHandler(BaseHTTPRequestHandler):
+    """模拟 Gitee API 的请求处理器"""
+
+    server_version = "MockGitee/1.0"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = dict(headers or {})
+        if status == 200:
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self._write_body(body)
+
+    def _write_body(self, body: bytes):
+        self.server.bytes_sent += len(body)
+        self.wfile.write(body)
+
+    def _entry(self, owner: str, repo: str, path: str) -> Dict[str, Any]:
+        content = self.server.files[path]
+        return {
+            "type": "file",
+            "name": path.rsplit("/", 1)[-1],
+            "path": path,
+            "size": len(content),
+            "sha": _blob_sha(content),
+            "url": f"/repos/{owner}/{repo}/contents/{path}",
+        }
+
+    def _list_dir(self, owner: str, repo: str, path: str) -> List[Dict[str, Any]]:
+        prefix = f"{path}/" if path else ""
+        items: Dict[str, Dict[str, Any]] = {}
+        for file_path in self.server.files:
+            if not file_path.startswith(prefix):
+                continue
+            rest = file_path[len(prefix):]
+            if "/" in rest:
+                name = rest.split("/", 1)[0]
+                items[name] = {"type": "dir", "name": name, "path": prefix + name, "size": 0, "sha": ""}
+            else:
+                items[rest] = self._entry(owner, repo, file_path)
+        return [items[name] for name in sorted(items)]
+
+    def do_GET(self):
+        self.server.request_count += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        parsed = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        parts = [unquote(p) for p in parsed.path.split("/") if p]
+        if parts[:2] == ["api", "v5"]:
+            parts = parts[2:]
+
+        if parts[:2] == ["search", "repositories"]:
+            return self._send_json(200, {"total_count": 1, "items": [{
+                "name": "demo", "full_name": "mock/demo", "description": "示例仓库",
+                "language": "Python", "stars_count": 42, "forks_count": 3,
+                "html_url": "https://gitee.com/mock/demo", "updated_at": "2024-01-01T00:00:00+08:00",
+            }]})
+        if parts[:2] == ["search", "code"]:
+            return self._send_json(200, {"total_count": 0, "items": []})
+
+        if len(parts) < 3 or parts[0] != "repos":
+            return self._send_json(404, {"message": "Not Found"})
+
+        owner, repo, rest = parts[1], parts[2], parts[3:]
+        files = self.server.files
+
+        if not rest:
+            return self._send_json(200, {
+                "name": repo, "full_name": f"{owner}/{repo}", "description": "示例仓库",
+                "language": "Python", "stars_count": 42, "forks_count": 3,
+                "default_branch": self.server.default_branch,
+                "html_url": f"https://gitee.com/{owner}/{repo}",
+            })
+
+        if rest[0] == "branches" and len(rest) == 2:
+            if rest[1] != self.server.default_branch:
+                return self._send_json(404, {"message": "Branch not found"})
+            return self._send_json(200, {"name": rest[1], "commit": {"sha": self.server.head_sha}})
+
+        if rest == ["readme"]:
+            if "README.md" not in files:
+                return self._send_json(404, {"message": "Not Found"})
+            entry = self._entry(owner, repo, "README.md")
+            entry["content"] = base64.b64encode(files["README.md"]).decode("ascii")
+            entry["encoding"] = "base64"
+            return self._send_json(200, entry)
+
+        if rest[0] == "contents":
+            path = "/".join(rest[1:])
+            if path in files:
+                entry = self._entry(owner, repo, path)
+                entry["content"] = base64.b64encode(files[path]).decode("ascii")
+                entry["encoding"] = "base64"
+                return self._send_json(200, entry)
+            listing = self._list_dir(owner, repo, path)
+            if listing:
+                return self._send_json(200, listing)
+            return self._send_json(404, {"message": "Not Found"})
+
+        if rest[0] == "raw":
+            path = "/".join(rest[1:])
+            if path not in files:
+                return self._send_json(404, {"message": "Not Found"})
+            body = files[path]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self._write_body(body)
+            return
+
+        if rest == ["zipball"]:
+            self.server.archive_count += 1
+            buffer = io.BytesIO()
+            prefix = f"{repo}-{query.get('ref', 'master')[:7]}/"
+            with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                for path, content in sorted(files.items()):
+                    zf.writestr(prefix + path, content)
+            body = buffer.getvalue()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self._write_body(body)
+            return
+
+        if rest[:2] == ["git", "blobs"] and len(rest) == 3:
+            for content in files.values():
+                if _blob_sha(content) == rest[2]:
+                    return self._send_json(200, {
+                        "sha": rest[2], "size": len(content), "encoding": "base64",
+                        "content": base64.b64encode(content).decode("ascii"),
+                    })
+            return self._send_json(404, {"message": "Not Found"})
+
+        if rest[:2] == ["git", "trees"]:
+            tree = [
+                {"path": p, "mode": "100644", "type": "blob", "sha": _blob_sha(c), "size": len(c)}
+                for p, c in sorted(files.items())
+            ]
+            return self._send_json(200, {"sha": rest[2] if len(rest) > 2 else "", "tree": tree, "truncated": False})
+
+        if rest == ["commits"]:
+            return self._send_json(200, [{
+                "sha": self.server.head_sha,
+                "html_url": f"https://gitee.com/{owner}/{repo}/commit/{self.server.head_sha}",
+                "commit": {"message": "initial commit", "author": {"name": "mock", "date": "2024-01-01T00:00:00+08:00"}},
+            }])
+
+        return self._send_json(404, {"message": "Not Found"})
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """模拟 OpenAI Chat Completions 接口
+
+    收到的最后一条消息不是工具结果时，返回一次 get_readme 工具调用
+    （server.tool_calls_per_turn 大于 1 时改为同时读取多个文件）；
+    否则返回最终答案。这样每个 Agent 运行固定为两轮迭代。
+    系统提示词中已包含预读的仓库信息（批量问答）时直接返回最终答案。
+    请求带 stream=true 时按 SSE 分块返回，每块间隔 server.stream_interval 秒；
+    非流式请求等待同样的总生成时间后一次性返回，便于两种模式对比。
+    """
+
+    server_version = "MockLLM/1.0"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.server.request_count += 1
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        messages = request.get("messages", [])
+        message: Dict[str, Any]
+        preloaded = bool(messages) and "已预先读取" in (messages[0].get("content") or "")
+        if preloaded or (messages and messages[-1].get("role") == "tool"):
+            message = {"role": "assistant", "content": "这是一个示例仓库。"}
+            finish_reason = "stop"
+        elif self.server.tool_calls_per_turn > 1:
+            paths = sorted(self.server.files)
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": "get_file_content", "arguments": json.dumps({
+                        "owner": "mock", "repo": "demo", "path": paths[i % len(paths)]
+                    })},
+                } for i in range(self.server.tool_calls_per_turn)],
+            }
+            finish_reason = "tool_calls"
+        else:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": "get_readme", "arguments": json.dumps({"owner": "mock", "repo": "demo"})},
+                }],
+            }
+            finish_reason = "tool_calls"
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = request.get("model", "mock")
+        deltas = self._deltas(message)
+        if request.get("stream"):
+            return self._stream(completion_id, model, deltas, finish_reason)
+        if self.server.stream_interval:
+            time.sleep(self.server.stream_interval * len(deltas))
+
+        body = json.dumps({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _deltas(message: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """把完整消息切成流式增量：文本每块 2 个字符，工具参数每块 8 个字符"""
+        deltas: List[Dict[str, Any]] = [{"role": "assistant", "content": ""}]
+        content = message.get("content") or ""
+        deltas.extend({"content": content[i:i + 2]} for i in range(0, len(content), 2))
+        for index, call in enumerate(message.get("tool_calls") or []):
+            deltas.append({"tool_calls": [{
+                "index": index, "id": call["id"], "type": "function",
+                "function": {"name": call["function"]["name"], "arguments": ""},
+            }]})
+            arguments = call["function"]["arguments"]
+            deltas.extend(
+                {"tool_calls": [{"index": index, "function": {"arguments": arguments[i:i + 8]}}]}
+                for i in range(0, len(arguments), 8)
+            )
+        return deltas
+
+    def _stream(self, completion_id: str, model: str, deltas: List[Dict[str, Any]], finish_reason: str):
+        """按 SSE 分块返回"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        created = int(time.time())
+        for i, delta in enumerate(deltas + [{}]):
+            if i and self.server.stream_interval:
+                time.sleep(self.server.stream_interval)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": delta,
+                    "finish_reason": finish_reason if i == len(deltas) else None,
+                }],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class MockCollectorHandler(BaseHTTPRequestHandler):
+    """模拟 OTLP/HTTP 收集器：接收 POST /v1/traces（JSON 编码），span 保存在 server.spans"""
+
+    server_version = "MockCollector/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.server.request_count += 1
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if urlparse(self.path).path != "/v1/traces":
+            return self._reply(404, b"{}")
+        try:
+            payload = json.loads(body)
+            with self.server.lock:
+                for resource_spans in payload.get("resourceSpans", []):
+                    for scope_spans in resource_spans.get("scopeSpans", []):
+                        self.server.spans.extend(scope_spans.get("spans", []))
+        except (ValueError, AttributeError):
+            return self._reply(400, b"{}")
+        self._reply(200, b"{}")
+
+    def _reply(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _blob_sha(content: bytes) -> str:
+    """计算 git blob SHA"""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def _serve(handler, latency: float, **attrs) -> Tuple[ThreadingHTTPServer, str]:
+    server = _MockServer(("127.0.0.1", 0), handler)
+    server.latency = latency
+    server.request_count = 0
+    for key, value in attrs.items():
+        setattr(server, key, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
+
+
+def start_mock_gitee(files: Optional[Dict[str, bytes]] = None, latency: float = 0.0,
+                     default_branch: str = "master") -> Tuple[ThreadingHTTPServer, str]:
+    """在后台线程启动模拟 Gitee 服务
+
+    Returns:
+        (server, api_base)，api_base 可直接作为 GITEE_API_BASE 使用
+    """
+    server, base = _serve(
+        MockGiteeHandler, latency,
+        files=files if files is not None else make_sample_repo(),
+        default_branch=default_branch,
+        head_sha="0" * 39 + "1",
+        archive_count=0,
+        bytes_sent=0,
+    )
+    return server, f"{base}/api/v5"
+
+
+def start_mock_llm(latency: float = 0.0, stream_interval: float = 0.0,
+                   tool_calls_per_turn: int = 1,
+                   files: Optional[Dict[str, bytes]] = None) -> Tuple[ThreadingHTTPServer, str]:
+    """在后台线程启动模拟 LLM 服务
+
+    Args:
+        latency: 首个响应字节前的延迟（秒）
+        stream_interval: 流式响应中相邻两块之间的间隔（秒）
+        tool_calls_per_turn: 每轮返回的工具调用数，大于 1 时调用 get_file_content
+        files: get_file_content 读取的文件集合，默认为示例仓库
+
+    Returns:
+        (server, api_base)，api_base 可直接作为 OPENAI_API_BASE 使用
+    """
+    server, base = _serve(
+        MockLLMHandler, latency,
+        stream_interval=stream_interval,
+        tool_calls_per_turn=tool_calls_per_turn,
+        files=files if files is not None else make_sample_repo(),
+    )
+    return server, f"{base}/v1"
+
+
+def start_mock_collector() -> Tuple[ThreadingHTTPServer, str]:
+    """在后台线程启动模拟 OTLP 收集器
+
+    Returns:
+        (server, endpoint)，endpoint 可直接作为 TRACE_OTLP_ENDPOINT 使用
+    """
+    return _serve(MockCollectorHandler, 0.0, spans=[], lock=threading.Lock())
+
+
+if __name__ == "__main__":
+    gitee_server, gitee_base = start_mock_gitee()
+    llm_server, llm_base = start_mock_llm()
+    print(f"GITEE_API_BASE={gitee_base}")
+    print(f"OPENAI_API_BASE={llm_base}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
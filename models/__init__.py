@@ -2,7 +2,7 @@
 数据模型
 """
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 
 
@@ -19,7 +19,18 @@ class RepoChatRequest(BaseModel):
     repo_name: str = Field(..., description="仓库名称")
     question: str = Field(..., description="用户问题")
     session_id: Optional[str] = Field(None, description="会话 ID，用于保持上下文")
-    ref: str = Field("master", description="分支名称")
+    ref: Optional[str] = Field(None, description="分支名、标签或提交 SHA，默认为仓库默认分支")
+    snapshot: bool = Field(False, description="快照模式：下载整个仓库归档后在本地读取文件，适合深度问答")
+
+
+class BatchChatRequest(BaseModel):
+    """批量仓库问答请求"""
+    repo_owner: str = Field(..., description="仓库所有者")
+    repo_name: str = Field(..., description="仓库名称")
+    questions: List[str] = Field(..., min_length=1, description="问题列表，各问题相互独立")
+    ref: Optional[str] = Field(None, description="分支名、标签或提交 SHA，默认为仓库默认分支")
+    snapshot: bool = Field(False, description="快照模式，见 RepoChatRequest")
+    concurrency: Optional[int] = Field(None, ge=1, description="同时回答的问题数，不超过服务端上限")
 
 
 class TechChatRequest(BaseModel):
@@ -35,6 +46,7 @@ class ChatResponse(BaseModel):
     session_id: str = Field(..., description="会话 ID")
     sources: Optional[List[Dict[str, Any]]] = Field(None, description="引用来源")
     tool_calls: Optional[List[Dict[str, Any]]] = Field(None, description="工具调用记录")
+    token_usage: Optional[List[Dict[str, Any]]] = Field(None, description="每轮迭代的上下文 token 统计")
 
 
 class SessionHistory(BaseModel):
@@ -43,3 +55,29 @@ class SessionHistory(BaseModel):
     messages: List[ChatMessage]
     created_at: datetime
     updated_at: datetime
+
+
+class JobRequest(BaseModel):
+    """异步任务请求"""
+    kind: Literal["repo", "tech"] = Field(..., description="任务类型：repo 为仓库问答，tech 为技术问答")
+    question: str = Field(..., description="用户问题")
+    session_id: Optional[str] = Field(None, description="会话 ID，用于保持上下文")
+    repo_owner: Optional[str] = Field(None, description="仓库所有者（repo 任务必填）")
+    repo_name: Optional[str] = Field(None, description="仓库名称（repo 任务必填）")
+    ref: Optional[str] = Field(None, description="分支名、标签或提交 SHA，默认为仓库默认分支")
+    snapshot: bool = Field(False, description="快照模式，见 RepoChatRequest")
+    language: Optional[str] = Field(None, description="编程语言过滤（tech 任务）")
+
+
+class JobStatus(BaseModel):
+    """异步任务状态"""
+    job_id: str
+    kind: str
+    status: str = Field(..., description="queued / running / succeeded / failed / cancelled")
+    session_id: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    progress: List[Dict[str, Any]] = Field(default_factory=list, description="工具调用进度（tool_start / tool_end 事件）")
+    result: Optional[ChatResponse] = Field(None, description="任务成功时的回答")
+    error: Optional[str] = None
@@ -0,0 +1,522 @@
+"""
+采样式性能剖析
+
+生产环境中定位 CPU 热点不能依赖重新部署加插桩。这里用后台线程定期读取事件循环
+线程的调用栈（sys._current_frames），不修改被剖析的代码：
+1. 单次请求剖析：管理员在请求上带 X-Profile 头，该请求及其创建的任务（流式输出、并发
+   工具调用）执行期间按 PROFILE_INTERVAL 采样，只统计这些任务在事件循环上运行时的栈；
+   结果以 collapsed 或 speedscope 格式保存到 PROFILE_DIR，响应头返回 X-Profile-Id
+2. 常驻低频采样：按 PROFILE_CONTINUOUS_INTERVAL 持续采样整个事件循环，按区域（Agent 循环、
+   Gitee 请求、pydantic 校验与序列化）汇总热点帧，可在运行时开启或关闭
+3. 事件循环空闲（等待 I/O）的样本只计数，不记录栈
+"""
+import asyncio
+import contextvars
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+import weakref
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from compat import to_thread
+from config import get_settings
+
+# 单次请求剖析支持的输出格式 -> 文件后缀
+FORMATS = {"collapsed": ".collapsed.txt", "speedscope": ".speedscope.json"}
+# 汇总结果中每个区域列出的热点帧数
+_TOP_FRAMES = 20
+# 只剖析 API 请求
+_PROFILED_PREFIX = "/api/"
+
+# (栈上各帧的代码对象，从外到内；最内层帧的行号)
+Stack = Tuple[Tuple[Any, ...], int]
+
+_session: contextvars.ContextVar[Optional["ProfileSession"]] = contextvars.ContextVar(
+    "profile_session", default=None
+)
+
+
+def authorize(token: Optional[str]) -> Optional[str]:
+    """校验管理员令牌
+
+    Returns:
+        未通过时的原因，通过时为 None
+    """
+    expected = get_settings().admin_token
+    if not expected:
+        return "未配置管理员令牌（ADMIN_TOKEN），剖析功能不可用"
+    if not token or not hmac.compare_digest(token.encode(), expected.encode()):
+        return "管理员令牌无效"
+    return None
+
+
+def _short_path(filename: str) -> str:
+    """第三方包保留包内路径，项目文件使用相对路径"""
+    marker = "site-packages" + os.sep
+    index = filename.rfind(marker)
+    if index >= 0:
+        return filename[index + len(marker):]
+    cwd = os.getcwd() + os.sep
+    if filename.startswith(cwd):
+        return filename[len(cwd):]
+    return filename
+
+
+def _code_name(code) -> str:
+    # co_qualname 在 Python 3.11 才加入，之前的版本只有函数名
+    return getattr(code, "co_qualname", code.co_name)
+
+
+def _frame_name(code, lineno: Optional[int] = None) -> str:
+    location = _short_path(code.co_filename)
+    if lineno is not None:
+        location = f"{location}:{lineno}"
+    # collapsed 格式以分号分隔帧
+    return f"{_code_name(code)} ({location})".replace(";", ",")
+
+
+class StackAggregate:
+    """按栈计数的样本集合"""
+
+    def __init__(self, max_stacks: int):
+        self.max_stacks = max_stacks
+        self.counts: Dict[Stack, int] = {}
+        self.samples = 0
+        self.idle = 0
+        # 超出栈数上限后新出现的栈只计入总数
+        self.truncated = 0
+        self.started_at = time.time()
+
+    def add(self, stack: Stack):
+        self.samples += 1
+        count = self.counts.get(stack)
+        if count is not None:
+            self.counts[stack] = count + 1
+        elif len(self.counts) < self.max_stacks:
+            self.counts[stack] = 1
+        else:
+            self.truncated += 1
+
+    def collapsed(self) -> str:
+        """collapsed 格式：每行为分号分隔的栈（从外到内）和样本数，可直接用于 flamegraph.pl"""
+        lines = []
+        for (codes, lineno), count in sorted(self.counts.items(), key=lambda item: -item[1]):
+            frames = [_frame_name(code) for code in codes[:-1]] + [_frame_name(codes[-1], lineno)]
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str, interval: float) -> Dict[str, Any]:
+        """speedscope 的 sampled 格式，每个样本的权重为采样间隔（秒）"""
+        frames: List[Dict[str, Any]] = []
+        index: Dict[Tuple[Any, Optional[int]], int] = {}
+
+        def frame_index(code, lineno: Optional[int]) -> int:
+            key = (code, lineno)
+            if key not in index:
+                index[key] = len(frames)
+                frames.append({"name": _code_name(code), "file": _short_path(code.co_filename),
+                               "line": lineno if lineno is not None else code.co_firstlineno})
+            return index[key]
+
+        samples, weights = [], []
+        for (codes, lineno), count in self.counts.items():
+            samples.append([frame_index(code, None) for code in codes[:-1]] + [frame_index(codes[-1], lineno)])
+            weights.append(round(count * interval, 6))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "chat2repo.profiler",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 6),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def hot_frames(self, limit: int = _TOP_FRAMES) -> List[Dict[str, Any]]:
+        """按自身样本数（栈最内层）排序的热点帧"""
+        own: Dict[Tuple[Any, int], int] = {}
+        for (codes, lineno), count in self.counts.items():
+            key = (codes[-1], lineno)
+            own[key] = own.get(key, 0) + count
+        top = sorted(own.items(), key=lambda item: -item[1])[:limit]
+        return [{"frame": _frame_name(code, lineno), "samples": count,
+                 "percent": round(count * 100 / self.samples, 1) if self.samples else 0.0}
+                for (code, lineno), count in top]
+
+
+class ProfileSession:
+    """一次请求的剖析"""
+
+    def __init__(self, fmt: str, max_stacks: int):
+        self.profile_id = uuid.uuid4().hex
+        self.format = fmt
+        self.stacks = StackAggregate(max_stacks)
+        # 属于该请求的任务：请求自身的任务以及它执行期间创建的任务
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        self.started = time.monotonic()
+        self.token: Optional[contextvars.Token] = None
+
+
+class Profiler:
+    """后台采样线程：服务于进行中的单次请求剖析与常驻低频采样"""
+
+    def __init__(self, interval: float, continuous_interval: float, directory: str, max_stacks: int = 10000):
+        """
+        Args:
+            interval: 单次请求剖析的采样间隔（秒）
+            continuous_interval: 常驻采样间隔（秒），0 表示关闭
+            directory: 单次请求剖析结果的保存目录
+            max_stacks: 每个样本集合最多记录的不同栈数
+        """
+        self.interval = interval
+        self.continuous_interval = continuous_interval
+        self.directory = directory
+        self.max_stacks = max_stacks
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._sessions: List[ProfileSession] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._continuous: Dict[str, StackAggregate] = {}
+        # (区域名, 判断代码对象是否属于该区域)，栈从内到外第一个命中的区域
+        self._regions: List[Tuple[str, Callable[[Any], bool]]] = []
+        self._region_cache: Dict[Any, Optional[str]] = {}
+
+        self.profiles = 0
+        self.samples = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    # ---- 启动与区域 ----
+
+    def attach(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """绑定到当前事件循环，安装记录请求任务的任务工厂；配置了常驻采样时启动采样线程"""
+        loop = loop or asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        previous = self._loop.get_task_factory()
+
+        def task_factory(loop, coro, context=None):
+            if previous is not None:
+                task = previous(loop, coro) if context is None else previous(loop, coro, context=context)
+            elif context is None:
+                # Python 3.11 之前 Task 不接受 context 参数，事件循环也不会传入
+                task = asyncio.Task(coro, loop=loop)
+            else:
+                task = asyncio.Task(coro, loop=loop, context=context)
+            # 显式指定上下文的任务按该上下文判断，否则按创建者的上下文
+            session = context.get(_session) if context is not None else _session.get()
+            if session is not None:
+                session.tasks.add(task)
+            return task
+
+        self._loop.set_task_factory(task_factory)
+        if self.continuous_interval > 0:
+            self._ensure_thread()
+
+    def add_region(self, name: str, match: Callable[[Any], bool]):
+        """注册常驻采样的汇总区域"""
+        self._regions.append((name, match))
+        self._region_cache.clear()
+
+    def _region_of(self, codes: Tuple[Any, ...]) -> str:
+        for code in reversed(codes):
+            region = self._region_cache.get(code, "")
+            if region == "":
+                region = next((name for name, match in self._regions if match(code)), None)
+                self._region_cache[code] = region
+            if region is not None:
+                return region
+        return "other"
+
+    # ---- 采样线程 ----
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def _stack(self) -> Optional[Stack]:
+        """事件循环线程当前的栈；空闲（等待 I/O）时返回 None"""
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return None
+        lineno = frame.f_lineno
+        codes = []
+        while frame is not None:
+            code = frame.f_code
+            # 只保留任务或回调内部的帧，事件循环与服务器外层的帧都相同
+            if code.co_name == "_run" and code.co_filename.endswith(os.path.join("asyncio", "events.py")):
+                break
+            codes.append(code)
+            frame = frame.f_back
+        if not codes or (frame is None and codes[0].co_name in ("select", "poll", "_run_once")):
+            return None
+        codes.reverse()
+        return tuple(codes), lineno
+
+    def _sample(self, sessions: List[ProfileSession], continuous: bool):
+        task = asyncio.current_task(self._loop) if sessions else None
+        stack = self._stack()
+        self.samples += 1
+        with self._lock:
+            if continuous:
+                if stack is None:
+                    self._aggregate("idle").idle += 1
+                else:
+                    self._aggregate(self._region_of(stack[0])).add(stack)
+            if stack is None or task is None:
+                return
+            for session in sessions:
+                if task in session.tasks:
+                    session.stacks.add(stack)
+
+    def _aggregate(self, region: str) -> StackAggregate:
+        aggregate = self._continuous.get(region)
+        if aggregate is None:
+            aggregate = self._continuous[region] = StackAggregate(self.max_stacks)
+        return aggregate
+
+    def _run(self):
+        next_continuous = 0.0
+        while not self._closed:
+            sessions = self._sessions
+            continuous_interval = self.continuous_interval
+            if not sessions and continuous_interval <= 0:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            now = time.monotonic()
+            continuous = continuous_interval > 0 and now >= next_continuous
+            if continuous:
+                next_continuous = now + continuous_interval
+            if sessions or continuous:
+                try:
+                    self._sample(sessions, continuous)
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = f"采样失败: {e}"
+            wait = self.interval if sessions else continuous_interval
+            if self._wake.wait(wait):
+                self._wake.clear()
+
+    # ---- 单次请求剖析 ----
+
+    def start(self, fmt: str) -> ProfileSession:
+        """开始剖析当前任务（及其之后创建的任务）"""
+        session = ProfileSession(fmt, self.max_stacks)
+        task = asyncio.current_task()
+        if task is not None:
+            session.tasks.add(task)
+        session.token = _session.set(session)
+        with self._lock:
+            # 采样线程只读取列表引用，修改时整体替换
+            self._sessions = self._sessions + [session]
+        self._ensure_thread()
+        return session
+
+    async def finish(self, session: ProfileSession, name: str) -> str:
+        """结束剖析并保存结果，返回文件路径"""
+        _session.reset(session.token)
+        with self._lock:
+            self._sessions = [s for s in self._sessions if s is not session]
+        self.profiles += 1
+        path = os.path.join(self.directory, session.profile_id + FORMATS[session.format])
+        elapsed = time.monotonic() - session.started
+        try:
+            await to_thread(self._save, session, name, elapsed, path)
+        except OSError as e:
+            self.errors += 1
+            self.last_error = f"保存剖析结果失败: {e}"
+        return path
+
+    def _save(self, session: ProfileSession, name: str, elapsed: float, path: str):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            if session.format == "speedscope":
+                data = json.dumps(session.stacks.speedscope(f"{name} ({elapsed:.3f}s)", self.interval),
+                                  ensure_ascii=False)
+            else:
+                data = session.stacks.collapsed()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def find(self, profile_id: str) -> Optional[Tuple[str, str]]:
+        """按 ID 查找已保存的剖析结果，返回 (路径, 格式)"""
+        if not profile_id.isalnum():
+            return None
+        for fmt, suffix in FORMATS.items():
+            path = os.path.join(self.directory, profile_id + suffix)
+            if os.path.exists(path):
+                return path, fmt
+        return None
+
+    # ---- 常驻采样 ----
+
+    def set_continuous(self, interval: float):
+        """运行时开启（interval > 0）或关闭常驻采样"""
+        self.continuous_interval = max(0.0, interval)
+        if self.continuous_interval > 0:
+            self._ensure_thread()
+
+    def continuous_profile(self, fmt: str = "summary", reset: bool = False) -> Any:
+        """常驻采样的结果
+
+        Args:
+            fmt: summary（按区域汇总热点帧）、collapsed 或 speedscope
+            reset: 读取后清空
+        """
+        with self._lock:
+            aggregates = self._continuous
+            if reset:
+                self._continuous = {}
+            if fmt == "summary":
+                total = sum(a.samples + a.idle for a in aggregates.values())
+                return {
+                    "interval": self.continuous_interval,
+                    "since": min((a.started_at for a in aggregates.values()), default=None),
+                    "samples": total,
+                    "regions": {
+                        region: {
+                            "samples": a.samples + a.idle,
+                            "percent": round((a.samples + a.idle) * 100 / total, 1) if total else 0.0,
+                            "hot_frames": a.hot_frames(),
+                        }
+                        for region, a in sorted(aggregates.items(), key=lambda item: -(item[1].samples + item[1].idle))
+                    },
+                }
+            merged = StackAggregate(self.max_stacks)
+            for region, aggregate in aggregates.items():
+                for stack, count in aggregate.counts.items():
+                    merged.counts[stack] = merged.counts.get(stack, 0) + count
+                    merged.samples += count
+        if fmt == "speedscope":
+            return merged.speedscope("continuous", self.continuous_interval)
+        return merged.collapsed()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """剖析统计"""
+        return {
+            "interval": self.interval,
+            "continuous_interval": self.continuous_interval,
+            "active_profiles": len(self._sessions),
+            "profiles": self.profiles,
+            "samples": self.samples,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+def _code_in(*functions) -> Callable[[Any], bool]:
+    codes = {function.__code__ for function in functions}
+    return lambda code: code in codes
+
+
+def _file_under(*modules) -> Callable[[Any], bool]:
+    prefixes = tuple(os.path.dirname(module.__file__) + os.sep for module in modules)
+    return lambda code: code.co_filename.startswith(prefixes)
+
+
+def create_profiler(settings) -> Profiler:
+    """按配置创建剖析器，注册常驻采样的汇总区域"""
+    import pydantic
+    from fastapi import encoders, routing
+    from agents.base_agent import BaseAgent
+    from gitee_client import GiteeClient
+
+    profiler = Profiler(
+        interval=settings.profile_interval,
+        continuous_interval=settings.profile_continuous_interval,
+        directory=settings.profile_dir,
+        max_stacks=settings.profile_max_stacks
+    )
+    # 区域按栈从内到外匹配，Gitee 请求位于 Agent 循环之内。合并的请求与并发的工具调用在
+    # 独立的任务中执行，栈上没有外层函数，因此同时匹配 _send 与 _execute_tool
+    in_pydantic = _file_under(pydantic)
+    fastapi_models = _code_in(encoders.jsonable_encoder, routing.serialize_response)
+    profiler.add_region("pydantic", lambda code: in_pydantic(code) or fastapi_models(code))
+    profiler.add_region("gitee", _code_in(GiteeClient._request, GiteeClient._send))
+    profiler.add_region("agent", _code_in(BaseAgent.run, BaseAgent._run, BaseAgent._execute_tool))
+    return profiler
+
+
+class ProfilingMiddleware:
+    """ASGI 中间件：带 X-Profile 头（collapsed / speedscope）的管理员请求在采样剖析下执行"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(_PROFILED_PREFIX):
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        fmt = headers.get(b"x-profile")
+        if fmt is None:
+            return await self.app(scope, receive, send)
+        fmt = fmt.decode("latin-1").strip().lower() or "collapsed"
+        token = headers.get(b"x-admin-token")
+        reason = authorize(token.decode("latin-1") if token else None)
+        if reason is None and fmt not in FORMATS:
+            reason = f"不支持的剖析格式: {fmt}（可选 {', '.join(FORMATS)}）"
+        if reason is not None:
+            body = json.dumps({"detail": reason}, ensure_ascii=False).encode()
+            await send({"type": "http.response.start", "status": 403, "headers": [
+                (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        profiler = get_profiler()
+        session = profiler.start(fmt)
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers") or []) + [
+                    (b"x-profile-id", session.profile_id.encode("ascii"))
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            await profiler.finish(session, f"{scope['method']} {scope['path']}")
+
+
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Profiler:
+    """获取进程级剖析器，首次调用时创建"""
+    global _profiler
+    if _profiler is None:
+        _profiler = create_profiler(get_settings())
+    return _profiler
+
+
+def close_profiler():
+    """停止进程级剖析器的采样线程"""
+    global _profiler
+    if _profiler is not None:
+        profiler, _profiler = _profiler, None
+        profiler.close()
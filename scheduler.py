@@ -0,0 +1,189 @@
+"""
+Gitee 请求调度
+
+整个进程共享一个调度器，所有上游请求先领取令牌再发出：
+1. 令牌桶按 access token 的配额限速，允许一定突发
+2. 等待令牌的请求按优先级通道排队，交互式工具调用优先于后台预取
+3. 429 / 5xx / 网络错误按带抖动的指数退避重试；429 时暂停整个令牌桶
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+import httpx
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt
+
+# 优先级通道，数值越小越优先
+INTERACTIVE = 0
+BACKGROUND = 1
+_LANE_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_current_lane: contextvars.ContextVar[int] = contextvars.ContextVar("gitee_lane", default=INTERACTIVE)
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+@contextmanager
+def background():
+    """在该上下文中发出的 Gitee 请求进入后台通道"""
+    token = _current_lane.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def _retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in _RETRY_STATUS
+    return isinstance(exc, httpx.TransportError)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """解析 Retry-After 头（仅支持秒数形式）"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class RequestScheduler:
+    """令牌桶 + 优先级通道 + 退避重试"""
+
+    def __init__(self, rate: float, burst: int, max_attempts: int = 4,
+                 backoff_base: float = 0.5, backoff_max: float = 10.0):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            burst: 令牌桶容量
+            max_attempts: 单个请求最多尝试次数（含首次）
+            backoff_base: 指数退避的基准秒数
+            backoff_max: 单次退避的上限秒数
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+        self.requests = 0
+        self.throttled = 0
+        self.throttle_seconds = 0.0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.burst, self._tokens + (now - start) * self.rate)
+        self._updated = now
+
+    def _drain(self):
+        """按优先级把可用令牌分给排队的请求，不足时定时再次尝试"""
+        self._wakeup = None
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+        # 跳过已取消的等待者
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        if self._waiters:
+            now = time.monotonic()
+            delay = max(self._paused_until - now, 0.0) + (1 - self._tokens) / self.rate
+            self._wakeup = asyncio.get_running_loop().call_later(max(delay, 0.001), self._drain)
+
+    async def acquire(self):
+        """领取一个令牌，令牌不足时按当前通道排队等待"""
+        self.requests += 1
+        self._refill()
+        if not self._waiters and self._tokens >= 1 and time.monotonic() >= self._paused_until:
+            self._tokens -= 1
+            return
+
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (_current_lane.get(), next(self._seq), future))
+        if self._wakeup is None:
+            self._drain()
+        try:
+            await future
+        finally:
+            if not future.done():
+                future.cancel()
+            self.throttled += 1
+            self.throttle_seconds += time.monotonic() - start
+
+    def pause(self, seconds: float):
+        """上游限流时清空令牌并暂停发放"""
+        self._refill()
+        self._tokens = 0.0
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def check(self, response: httpx.Response):
+        """检查响应，需要重试的状态码抛出 HTTPStatusError"""
+        if response.status_code not in _RETRY_STATUS:
+            return
+        if response.status_code == 429:
+            self.rate_limited += 1
+            self.pause(_retry_after(response) or self.backoff_base)
+        response.raise_for_status()
+
+    def _wait(self, retry_state) -> float:
+        """带完全抖动的指数退避；429 带 Retry-After 时不早于该时间"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (retry_state.attempt_number - 1)))
+        exc = retry_state.outcome.exception() if retry_state.outcome else None
+        if isinstance(exc, httpx.HTTPStatusError):
+            retry_after = _retry_after(exc.response)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _before_sleep(self, retry_state):
+        self.retries += 1
+
+    def retrying(self) -> AsyncRetrying:
+        """单个请求的重试控制，最后一次失败时抛出原异常"""
+        return AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=self._wait,
+            retry=retry_if_exception(_retryable),
+            before_sleep=self._before_sleep,
+            reraise=True
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """调度统计"""
+        self._refill()
+        depth: Dict[str, int] = {name: 0 for name in _LANE_NAMES.values()}
+        for lane, _, future in self._waiters:
+            if not future.done():
+                depth[_LANE_NAMES.get(lane, str(lane))] += 1
+        return {
+            "queue_depth": depth,
+            "tokens": round(self._tokens, 2),
+            "paused_seconds": round(max(0.0, self._paused_until - time.monotonic()), 3),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "throttle_seconds": round(self.throttle_seconds, 3),
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+        }
@@ -0,0 +1,633 @@
+"""
+会话存储
+
+会话原先保存在进程内的字典中，永不淘汰、重启即丢失，每条消息还是一个完整的
+pydantic 对象。这里提供可替换的存储后端：
+1. 内存前端为有上限的 LRU，消息以紧凑的元组保存
+2. 默认后端为 WAL 模式的 SQLite，新消息在后台按批写入，一个事务写入多个会话
+3. 超过最长保留时间或长期未活动的会话被淘汰，后台定期压缩数据库
+4. 多进程部署时每轮问答立即写入，读取内存中的会话前先向数据库校验，
+   另一个工作进程追加的消息会被增量加载
+"""
+import asyncio
+import base64
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+from compat import to_thread
+from config import get_settings
+
+# 会话标题取首个问题的前若干字符
+_TITLE_CHARS = 50
+# 存储中会话总数的缓存秒数：/metrics 与 /api/stats 频繁读取，不必每次扫描
+_STORED_COUNT_TTL = 10.0
+
+_SUMMARY_FIELDS = ("session_id", "kind", "repo", "title", "message_count", "created_at", "updated_at")
+
+# 分页位置：上一页最后一条的 (updated_at, session_id)
+Cursor = Tuple[float, str]
+
+
+def encode_cursor(summary: Dict[str, Any]) -> str:
+    """由一页的最后一条摘要生成下一页游标"""
+    raw = f"{summary['updated_at']!r}|{summary['session_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        updated_at, session_id = raw.split("|", 1)
+        return float(updated_at), session_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    repo TEXT,
+    title TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+DROP INDEX IF EXISTS idx_sessions_updated_at;
+CREATE INDEX IF NOT EXISTS idx_sessions_recent ON sessions (updated_at, session_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_repo_recent ON sessions (repo, updated_at, session_id);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+class StoredMessage(NamedTuple):
+    """一条会话消息"""
+    role: str
+    content: str
+    timestamp: float
+
+
+@dataclass
+class Session:
+    """一个会话及其消息"""
+    session_id: str
+    kind: str
+    repo: Optional[str]
+    created_at: float
+    updated_at: float
+    title: Optional[str] = None
+    messages: List[StoredMessage] = field(default_factory=list)
+    # 已写入后端的消息数
+    persisted: int = 0
+
+    @property
+    def dirty(self) -> bool:
+        return self.persisted < len(self.messages)
+
+    def summary(self) -> Dict[str, Any]:
+        """不含消息内容的摘要"""
+        return {
+            "session_id": self.session_id,
+            "kind": self.kind,
+            "repo": self.repo,
+            "title": self.title,
+            "message_count": len(self.messages),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+
+class SessionStore:
+    """会话存储：有上限的 LRU 内存前端 + 可替换的持久化后端
+
+    基类本身不做持久化（即内存后端），LRU 淘汰的会话直接丢弃；
+    子类实现 _load / _write / _delete / _page / _expire / _compact 接入持久化后端。
+    """
+
+    backend = "memory"
+    persistent = False
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 0, idle_ttl: float = 0,
+                 flush_interval: float = 0.5, compact_interval: float = 3600,
+                 write_through: bool = False):
+        """
+        Args:
+            max_sessions: 内存中最多保留的会话数
+            ttl: 会话自创建起的最长保留秒数，0 表示不限
+            idle_ttl: 会话最后一次更新后的保留秒数，0 表示不限
+            flush_interval: 后台批量写入的间隔秒数
+            compact_interval: 后台淘汰过期会话并压缩存储的间隔秒数
+            write_through: 多进程共享同一后端：调用方每轮问答后立即 flush，读取时校验内存中的会话
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.write_through = write_through
+
+        self._entries: "OrderedDict[str, Session]" = OrderedDict()
+        # 尚未写入后端的会话；被 LRU 换出后仍保留在这里直到写入完成
+        self._dirty: Dict[str, Session] = {}
+        # 写入、删除和压缩串行执行，避免已删除的会话被批量写入重新写回
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self.hits = 0
+        self.loads = 0
+        self.refreshes = 0
+        self.misses = 0
+        self.flushes = 0
+        self.flushed_messages = 0
+        self.expired = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        # 存储中的会话总数（count_stored 按 TTL 刷新）
+        self._stored: Optional[int] = None
+        self._stored_at = 0.0
+
+    # ---- 持久化后端接口（内存后端均为空操作） ----
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        return None
+
+    def _fetch_since(self, session_id: str, seq: int) -> Optional[Tuple[float, Optional[str], List[StoredMessage]]]:
+        """读取会话的更新时间、标题及第 seq 条之后的消息；会话不存在时返回 None"""
+        return None
+
+    def _write(self, batch: List[Tuple[Session, int, int]]) -> List[str]:
+        """写入一批会话；batch 中为 (会话, 已写入的消息数, 本次写入到的消息数)
+
+        消息序号在写事务内按后端已有的消息分配；返回其间有其他进程追加过消息、
+        内存中的消息顺序与后端不一致的会话 ID
+        """
+        return []
+
+    def _delete(self, session_id: str) -> bool:
+        return False
+
+    def _page(self, limit: int, after: Optional[Cursor], repo: Optional[str],
+              created_after: float, updated_after: float) -> List[Dict[str, Any]]:
+        """按 (updated_at, session_id) 倒序读取 after 之后的至多 limit 条摘要"""
+        # 内存后端的全部会话都在 LRU 中，数量有上限
+        summaries = [
+            s.summary() for s in self._entries.values()
+            if s.messages and (repo is None or s.repo == repo)
+            and s.created_at >= created_after and s.updated_at >= updated_after
+            and (after is None or (s.updated_at, s.session_id) < after)
+        ]
+        summaries.sort(key=lambda s: (s["updated_at"], s["session_id"]), reverse=True)
+        return summaries[:limit]
+
+    def _expire(self, created_before: float, updated_before: float) -> int:
+        return 0
+
+    def _count(self) -> int:
+        # 内存后端的全部会话都在 LRU 中
+        return len(self._entries)
+
+    def _compact(self):
+        pass
+
+    def _close(self):
+        pass
+
+    # ---- 内存前端 ----
+
+    def _expired(self, session: Session, now: float) -> bool:
+        return bool((self.ttl and session.created_at < now - self.ttl)
+                    or (self.idle_ttl and session.updated_at < now - self.idle_ttl))
+
+    def _remember(self, session: Session):
+        self._entries[session.session_id] = session
+        self._entries.move_to_end(session.session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+    def _lock(self) -> asyncio.Lock:
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        return self._write_lock
+
+    async def get(self, session_id: str) -> Optional[Session]:
+        """获取会话，内存未命中时从后端加载；已过期的会话视为不存在"""
+        now = time.time()
+        session = self._entries.get(session_id)
+        if session is not None:
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            if self.write_through and self.persistent and not session.dirty:
+                session = await self._refresh(session)
+                if session is None:
+                    return None
+        else:
+            session = self._dirty.get(session_id)
+            if session is None:
+                session = await to_thread(self._load, session_id)
+                if session is None:
+                    self.misses += 1
+                    return None
+                self.loads += 1
+            self._remember(session)
+        if self._expired(session, now):
+            return None
+        return session
+
+    async def _refresh(self, session: Session) -> Optional[Session]:
+        """向后端校验内存中的会话：增量加载其他进程追加的消息，已被删除时返回 None"""
+        fetched = await to_thread(self._fetch_since, session.session_id, session.persisted)
+        if fetched is None:
+            if session.persisted == 0:
+                # 尚未写入过的新会话
+                return session
+            self._entries.pop(session.session_id, None)
+            return None
+        updated_at, title, messages = fetched
+        if messages and not session.dirty:
+            session.messages.extend(messages)
+            session.persisted = len(session.messages)
+            session.updated_at = updated_at
+            session.title = title
+            self.refreshes += 1
+        return session
+
+    async def get_or_create(self, session_id: str, kind: str = "repo", repo: Optional[str] = None) -> Session:
+        """获取会话，不存在时创建（创建的会话在写入第一条消息时才持久化）"""
+        session = await self.get(session_id)
+        if session is None:
+            now = time.time()
+            session = Session(session_id=session_id, kind=kind, repo=repo, created_at=now, updated_at=now)
+            self._remember(session)
+        self._ensure_started()
+        return session
+
+    def append(self, session: Session, role: str, content: str):
+        """追加一条消息，由后台任务批量写入"""
+        now = time.time()
+        session.messages.append(StoredMessage(role, content, now))
+        session.updated_at = now
+        if session.title is None and role == "user":
+            session.title = content.strip().splitlines()[0][:_TITLE_CHARS] if content.strip() else None
+        self._dirty[session.session_id] = session
+        self._ensure_started()
+
+    async def delete(self, session_id: str) -> bool:
+        """删除会话，返回是否存在"""
+        async with self._lock():
+            existed = self._entries.pop(session_id, None) is not None
+            existed = self._dirty.pop(session_id, None) is not None or existed
+            deleted = await to_thread(self._delete, session_id)
+        return existed or deleted
+
+    async def list_sessions(self, limit: int = 50, cursor: Optional[str] = None,
+                            repo: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """按更新时间倒序分页列出未过期的会话摘要，不读取消息内容
+
+        Args:
+            limit: 每页数量
+            cursor: 上一页返回的游标，为空时从最新的会话开始
+            repo: 只列出该仓库（owner/name）的会话
+
+        Returns:
+            (摘要列表, 下一页游标)；没有更多会话时游标为 None
+        """
+        after = decode_cursor(cursor) if cursor else None
+        await self.flush()
+        now = time.time()
+        args = (limit + 1, after, repo,
+                now - self.ttl if self.ttl else 0.0,
+                now - self.idle_ttl if self.idle_ttl else 0.0)
+        if self.persistent:
+            rows = await to_thread(self._page, *args)
+        else:
+            rows = self._page(*args)
+        if len(rows) > limit:
+            return rows[:limit], encode_cursor(rows[limit - 1])
+        return rows, None
+
+    async def flush(self):
+        """把所有未写入的消息写入后端（一个事务）"""
+        async with self._lock():
+            if not self._dirty:
+                return
+            batch = [(s, s.persisted, len(s.messages)) for s in self._dirty.values() if s.dirty]
+            shifted = await to_thread(self._write, batch) if batch else []
+            for session, _, upto in batch:
+                session.persisted = upto
+                if not session.dirty:
+                    self._dirty.pop(session.session_id, None)
+            # 与其他进程交错写入的会话从内存中换出，下次访问时按后端的顺序重新加载
+            for session_id in shifted:
+                self._entries.pop(session_id, None)
+            self.flushes += 1
+            self.flushed_messages += sum(upto - start for _, start, upto in batch)
+
+    async def compact(self):
+        """淘汰过期会话并压缩存储"""
+        now = time.time()
+        purged = 0
+        for session_id, session in list(self._entries.items()):
+            if self._expired(session, now):
+                self._entries.pop(session_id, None)
+                self._dirty.pop(session_id, None)
+                purged += 1
+        async with self._lock():
+            stored = await to_thread(
+                self._expire,
+                now - self.ttl if self.ttl else 0.0,
+                now - self.idle_ttl if self.idle_ttl else 0.0
+            )
+            await to_thread(self._compact)
+        # 持久化后端中的会话包含内存中的会话，以后端的计数为准
+        self.expired += stored if self.persistent else purged
+
+    async def count_stored(self) -> Optional[int]:
+        """存储中的会话总数；结果缓存 _STORED_COUNT_TTL 秒，持久化后端的计数在线程中执行
+
+        计数失败时记入 errors 并沿用上次的结果。
+        """
+        now = time.monotonic()
+        if self._stored is None or now - self._stored_at >= _STORED_COUNT_TTL:
+            try:
+                self._stored = await to_thread(self._count) if self.persistent else self._count()
+                self._stored_at = now
+            except sqlite3.Error as e:
+                self.errors += 1
+                self.last_error = f"统计会话数失败: {e}"
+        return self._stored
+
+    # ---- 后台任务 ----
+
+    def _ensure_started(self):
+        """首次使用时在当前事件循环中启动后台写入与压缩任务"""
+        if self._tasks and not any(task.done() for task in self._tasks):
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._tasks = [asyncio.create_task(self._flush_loop()), asyncio.create_task(self._compact_loop())]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                # 写入失败的会话仍在 _dirty 中，下次重试
+                self.errors += 1
+                self.last_error = f"写入失败: {e}"
+
+    async def _compact_loop(self):
+        while True:
+            await asyncio.sleep(self.compact_interval)
+            try:
+                await self.compact()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"压缩失败: {e}"
+
+    async def aclose(self):
+        """停止后台任务，写入剩余消息并关闭后端"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.flush()
+        await to_thread(self._close)
+
+    def stats(self) -> Dict[str, Any]:
+        """存储统计"""
+        return {
+            "backend": self.backend,
+            "cached": len(self._entries),
+            "max_sessions": self.max_sessions,
+            "dirty": len(self._dirty),
+            "hits": self.hits,
+            "loads": self.loads,
+            "refreshes": self.refreshes,
+            "misses": self.misses,
+            "flushes": self.flushes,
+            "flushed_messages": self.flushed_messages,
+            "expired": self.expired,
+            "stored": self._stored,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+class SqliteSessionStore(SessionStore):
+    """SQLite（WAL 模式）后端的会话存储"""
+
+    backend = "sqlite"
+    persistent = True
+
+    def __init__(self, path: str, **kwargs):
+        """
+        Args:
+            path: 数据库文件路径
+            **kwargs: 见 SessionStore
+        """
+        super().__init__(**kwargs)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn_lock = threading.Lock()
+        with self._conn_lock:
+            # auto_vacuum 必须在建表之前设置才能生效
+            self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            # WAL 下 NORMAL 不会损坏数据库，掉电时最多丢失最近一次检查点之后的事务
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute("PRAGMA busy_timeout = 5000")
+            self._conn.executescript(_SCHEMA)
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        with self._conn_lock:
+            row = self._conn.execute(
+                "SELECT kind, repo, title, created_at, updated_at FROM sessions WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            messages = [StoredMessage(*m) for m in self._conn.execute(
+                "SELECT role, content, created_at FROM messages WHERE session_id = ? ORDER BY seq",
+                (session_id,)
+            )]
+        kind, repo, title, created_at, updated_at = row
+        return Session(session_id=session_id, kind=kind, repo=repo, created_at=created_at,
+                       updated_at=updated_at, title=title, messages=messages, persisted=len(messages))
+
+    def _fetch_since(self, session_id: str, seq: int) -> Optional[Tuple[float, Optional[str], List[StoredMessage]]]:
+        with self._conn_lock:
+            row = self._conn.execute(
+                "SELECT updated_at, title, message_count FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            updated_at, title, count = row
+            messages = []
+            if count > seq:
+                messages = [StoredMessage(*m) for m in self._conn.execute(
+                    "SELECT role, content, created_at FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq",
+                    (session_id, seq)
+                )]
+        return updated_at, title, messages
+
+    def _write(self, batch: List[Tuple[Session, int, int]]) -> List[str]:
+        shifted = []
+        now = time.time()
+        with self._conn_lock:
+            # IMMEDIATE 事务先取得写锁，其他进程的写入在此之前或之后完成，序号不会冲突
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for session, start, upto in batch:
+                    row = self._conn.execute(
+                        "SELECT created_at, updated_at FROM sessions WHERE session_id = ?", (session.session_id,)
+                    ).fetchone()
+                    if row is not None and start == 0 and (
+                            (self.ttl and row[0] < now - self.ttl)
+                            or (self.idle_ttl and row[1] < now - self.idle_ttl)):
+                        # 首次写入的会话复用了已过期会话的 ID，先清掉旧会话
+                        self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session.session_id,))
+                        self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session.session_id,))
+                        row = None
+                    base = self._conn.execute(
+                        "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?",
+                        (session.session_id,)
+                    ).fetchone()[0]
+                    if base != start:
+                        shifted.append(session.session_id)
+                    self._conn.executemany(
+                        "INSERT INTO messages (session_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                        [(session.session_id, base + i, *message)
+                         for i, message in enumerate(session.messages[start:upto])]
+                    )
+                    count = base + upto - start
+                    if row is None:
+                        self._conn.execute(
+                            """INSERT INTO sessions (session_id, kind, repo, title, created_at, updated_at, message_count)
+                               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                            (session.session_id, session.kind, session.repo, session.title,
+                             session.created_at, session.updated_at, count)
+                        )
+                    else:
+                        self._conn.execute(
+                            """UPDATE sessions SET title = COALESCE(title, ?), updated_at = MAX(updated_at, ?),
+                                   message_count = ? WHERE session_id = ?""",
+                            (session.title, session.updated_at, count, session.session_id)
+                        )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return shifted
+
+    def _delete(self, session_id: str) -> bool:
+        with self._conn_lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            deleted = self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount
+            self._conn.execute("COMMIT")
+        return deleted > 0
+
+    def _page(self, limit: int, after: Optional[Cursor], repo: Optional[str],
+              created_after: float, updated_after: float) -> List[Dict[str, Any]]:
+        # 沿 (updated_at, session_id) 索引倒序扫描，从游标位置开始，代价只与 limit 有关
+        conditions = ["updated_at >= ?", "created_at >= ?"]
+        params: List[Any] = [updated_after, created_after]
+        if repo is not None:
+            conditions.append("repo = ?")
+            params.append(repo)
+        if after is not None:
+            conditions.append("(updated_at, session_id) < (?, ?)")
+            params.extend(after)
+        params.append(limit)
+        sql = (f"SELECT {', '.join(_SUMMARY_FIELDS)} FROM sessions "
+               f"WHERE {' AND '.join(conditions)} "
+               f"ORDER BY updated_at DESC, session_id DESC LIMIT ?")
+        with self._conn_lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(_SUMMARY_FIELDS, row)) for row in rows]
+
+    def _expire(self, created_before: float, updated_before: float) -> int:
+        condition = "created_at < ? OR updated_at < ?"
+        with self._conn_lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                f"DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE {condition})",
+                (created_before, updated_before)
+            )
+            expired = self._conn.execute(f"DELETE FROM sessions WHERE {condition}",
+                                         (created_before, updated_before)).rowcount
+            self._conn.execute("COMMIT")
+        return expired
+
+    def _count(self) -> int:
+        with self._conn_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _compact(self):
+        with self._conn_lock:
+            # 归还已删除数据占用的页，并把 WAL 合并回主库后截断
+            self._conn.execute("PRAGMA incremental_vacuum")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _close(self):
+        with self._conn_lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["path"] = self.path
+        return stats
+
+
+def create_session_store(settings) -> SessionStore:
+    """按配置创建会话存储"""
+    kwargs = dict(
+        max_sessions=settings.session_cache_size,
+        ttl=settings.session_ttl,
+        idle_ttl=settings.session_idle_ttl,
+        flush_interval=settings.session_flush_interval,
+        compact_interval=settings.session_compact_interval,
+        write_through=settings.workers > 1
+    )
+    if settings.session_backend == "memory":
+        if settings.workers > 1:
+            raise ValueError("多进程部署需要可共享的会话存储，请使用 sqlite 后端")
+        return SessionStore(**kwargs)
+    if settings.session_backend != "sqlite":
+        raise ValueError(f"未知的会话存储后端: {settings.session_backend}")
+    return SqliteSessionStore(settings.session_db_path, **kwargs)
+
+
+_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """获取进程级会话存储，首次调用时创建"""
+    global _store
+    if _store is None:
+        _store = create_session_store(get_settings())
+    return _store
+
+
+async def close_session_store():
+    """写入剩余消息并关闭进程级会话存储"""
+    global _store
+    if _store is not None:
+        store, _store = _store, None
+        await store.aclose()
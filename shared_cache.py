@@ -0,0 +1,100 @@
+"""
+多进程共享的缓存存储
+
+多个 uvicorn 工作进程各自持有内存缓存，一个进程拉取过的 Gitee 响应
+对其他进程不可见。这里用 WAL 模式的 SQLite 作为各进程内存缓存之下的
+共享层：写入时同时写入共享层，内存未命中时从共享层读取。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+# 每写入这么多次清理一次早已过期的条目
+_PURGE_EVERY = 1000
+# 过期条目保留一段时间，仍可凭 ETag 发送条件请求
+_STALE_GRACE = 24 * 3600
+
+
+class SharedCacheStore:
+    """基于 SQLite 的跨进程键值存储，值带过期时间（墙钟时间）"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 数据库文件路径
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute("PRAGMA busy_timeout = 5000")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID"
+            )
+        self._writes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """读取条目，返回 (值, 过期的墙钟时间)；可能已过期，由调用方判断"""
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bytes(row[0]), row[1]
+
+    def put(self, key: str, value: bytes, expires_at: float):
+        """写入条目；共享层写入失败不影响调用方"""
+        try:
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                                   (key, value, expires_at))
+                self._writes += 1
+                if self._writes % _PURGE_EVERY == 0:
+                    self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time() - _STALE_GRACE,))
+        except sqlite3.Error:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """共享层统计"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {
+            "path": self.path,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def encode_entry(meta: Dict[str, Any], body: bytes) -> bytes:
+    """把元信息与响应体编码为一个值"""
+    return json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\0" + body
+
+
+def decode_entry(value: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """encode_entry 的逆操作"""
+    head, _, body = value.partition(b"\0")
+    return json.loads(head), body
@@ -0,0 +1,77 @@
+"""
+相同请求合并（singleflight）
+
+热门仓库链接被分享后，多个 Agent 会在同一时刻读取同一份 README、
+根目录和仓库信息。同一个键在执行中的调用只向上游发出一次，
+其余调用等待并共享这次调用的结果。
+"""
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Flight:
+    """一次执行中的调用"""
+
+    def __init__(self):
+        self.task: "asyncio.Task" = None
+        self.callers = 1
+
+
+class Singleflight:
+    """按键合并并发的相同调用"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 fn，同一键已有调用在执行时直接等待其结果
+
+        调用在独立任务中执行，发起方被取消不会影响其他等待者。
+        结果被多个调用方共享时，每个调用方拿到各自的深拷贝，互不影响。
+
+        Args:
+            key: 合并键，相同键的调用视为同一请求
+            fn: 无参协程函数
+
+        Returns:
+            fn 的返回值
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            flight.callers += 1
+            self.shared += 1
+        else:
+            flight = self._flights[key] = _Flight()
+            self.leaders += 1
+
+            async def run():
+                try:
+                    return await fn()
+                finally:
+                    # 在任务结束前移除，结束后到达的调用会发起新请求
+                    self._flights.pop(key, None)
+
+            flight.task = asyncio.ensure_future(run())
+
+        result = await asyncio.shield(flight.task)
+        if flight.callers > 1:
+            return copy.deepcopy(result)
+        return result
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计"""
+        total = self.leaders + self.shared
+        return {
+            "in_flight": len(self._flights),
+            "upstream_calls": self.leaders,
+            "coalesced": self.shared,
+            "coalesce_rate": round(self.shared / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,285 @@
+"""
+仓库快照
+
+深度问答时 Agent 会对同一个仓库发起几十次 get_file_content / list_directory。
+快照模式下按解析后的提交 SHA 下载一次仓库归档，转存为不压缩的 zip，
+之后通过 mmap 零拷贝读取成员，文件工具全部在本地完成。
+"""
+import asyncio
+import mmap
+import os
+import struct
+import tempfile
+import zipfile
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from code_search import TrigramIndex
+from compat import to_thread
+
+# zip 本地文件头固定部分长度，文件名长度和扩展字段长度位于偏移 26 处
+_LOCAL_HEADER_SIZE = 30
+_LOCAL_HEADER_LENGTHS = struct.Struct("<HH")
+
+# 同时保持打开（已 mmap）的快照数量
+_MAX_OPEN_SNAPSHOTS = 16
+
+
+class Snapshot:
+    """一个提交的只读仓库快照"""
+
+    def __init__(self, path: str, sha: str):
+        self.path = path
+        self.sha = sha
+        self._code_index: Optional[TrigramIndex] = None
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        with zipfile.ZipFile(self._file) as zf:
+            infos = zf.infolist()
+
+        # 路径 -> (数据起始偏移, 长度)；快照在写入时已去掉归档顶层目录并改为不压缩
+        self._members: Dict[str, Tuple[int, int]] = {}
+        self._dirs: Dict[str, Dict[str, str]] = {"": {}}
+        for info in infos:
+            if info.is_dir():
+                continue
+            name_len, extra_len = _LOCAL_HEADER_LENGTHS.unpack_from(self._mm, info.header_offset + 26)
+            start = info.header_offset + _LOCAL_HEADER_SIZE + name_len + extra_len
+            self._members[info.filename] = (start, info.file_size)
+            self._index_path(info.filename)
+
+    def _index_path(self, path: str):
+        """把文件路径登记到各级父目录"""
+        parts = path.split("/")
+        for depth in range(len(parts)):
+            parent = "/".join(parts[:depth])
+            name = parts[depth]
+            kind = "file" if depth == len(parts) - 1 else "dir"
+            self._dirs.setdefault(parent, {})[name] = kind
+
+    @property
+    def file_count(self) -> int:
+        return len(self._members)
+
+    def paths(self) -> List[str]:
+        """全部文件路径"""
+        return list(self._members)
+
+    def exists(self, path: str) -> bool:
+        path = path.strip("/")
+        return path in self._members or path in self._dirs
+
+    def is_dir(self, path: str) -> bool:
+        return path.strip("/") in self._dirs
+
+    def size(self, path: str) -> Optional[int]:
+        member = self._members.get(path.strip("/"))
+        return member[1] if member else None
+
+    def read(self, path: str) -> Optional[memoryview]:
+        """零拷贝读取文件内容，不存在时返回 None"""
+        member = self._members.get(path.strip("/"))
+        if member is None:
+            return None
+        start, length = member
+        return memoryview(self._mm)[start:start + length]
+
+    def list_dir(self, path: str = "") -> Optional[List[Dict[str, Any]]]:
+        """列出目录，不存在时返回 None"""
+        path = path.strip("/")
+        entries = self._dirs.get(path)
+        if entries is None:
+            return None
+        prefix = f"{path}/" if path else ""
+        items = []
+        for name in sorted(entries):
+            full_path = prefix + name
+            kind = entries[name]
+            items.append({
+                "name": name,
+                "path": full_path,
+                "type": kind,
+                "size": self._members[full_path][1] if kind == "file" else 0
+            })
+        return items
+
+    @property
+    def code_index(self) -> TrigramIndex:
+        """本快照的代码搜索索引，首次访问时创建并在后台增量构建"""
+        if self._code_index is None:
+            self._code_index = TrigramIndex(self)
+        self._code_index.start_background_build()
+        return self._code_index
+
+    def find_readme(self) -> Optional[str]:
+        """查找根目录 README 文件"""
+        candidates = [name for name, kind in self._dirs[""].items()
+                      if kind == "file" and name.lower().startswith("readme")]
+        if not candidates:
+            return None
+        # 优先 README.md，其次按名称排序
+        candidates.sort(key=lambda name: (name.lower() != "readme.md", name.lower()))
+        return candidates[0]
+
+    def close(self):
+        """关闭快照；后台索引构建的线程仍在读取时，等它当前批次结束后再关闭"""
+        task = self._code_index.stop() if self._code_index is not None else None
+        if task is not None:
+            task.add_done_callback(lambda _: self._close())
+        else:
+            self._close()
+
+    def _close(self):
+        try:
+            self._mm.close()
+        except BufferError:
+            # 仍有 memoryview 引用时无法立即关闭，交给垃圾回收
+            pass
+        self._file.close()
+
+
+def _repack(src: str, dest: str):
+    """把下载的归档转存为不压缩的 zip，并去掉顶层目录"""
+    with zipfile.ZipFile(src) as zin:
+        names = [info.filename for info in zin.infolist() if not info.is_dir()]
+        prefix = ""
+        if names:
+            first = names[0].split("/", 1)[0] + "/"
+            if all(name.startswith(first) for name in names):
+                prefix = first
+
+        with zipfile.ZipFile(dest, "w", compression=zipfile.ZIP_STORED) as zout:
+            for info in zin.infolist():
+                if info.is_dir() or not info.filename.startswith(prefix):
+                    continue
+                name = info.filename[len(prefix):]
+                if not name:
+                    continue
+                zout.writestr(zipfile.ZipInfo(name, info.date_time), zin.read(info))
+
+
+class SnapshotStore:
+    """磁盘快照仓库，按总磁盘预算淘汰最久未使用的快照"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        Args:
+            directory: 快照存放目录
+            max_bytes: 全部快照占用的磁盘上限
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._open: "OrderedDict[str, Snapshot]" = OrderedDict()
+        # 路径 -> [下载锁, 等待者数]，无人等待时删除
+        self._locks: Dict[str, List[Any]] = {}
+
+        self.downloads = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, owner: str, repo: str, sha: str) -> str:
+        return os.path.join(self.directory, f"{owner}__{repo}__{sha}.zip")
+
+    async def get(self, client, owner: str, repo: str, sha: str) -> Optional[Snapshot]:
+        """获取快照，本地不存在时通过 client 下载
+
+        Args:
+            client: GiteeClient
+            owner: 仓库所有者
+            repo: 仓库名称
+            sha: 提交 SHA
+
+        Returns:
+            快照；下载失败时返回 None
+        """
+        path = self._path(owner, repo, sha)
+        snapshot = self._open.get(path)
+        if snapshot is not None:
+            self._open.move_to_end(path)
+            return snapshot
+
+        entry = self._locks.get(path)
+        if entry is None:
+            entry = self._locks[path] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._load(client, owner, repo, sha, path)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[path]
+
+    async def _load(self, client, owner: str, repo: str, sha: str, path: str) -> Optional[Snapshot]:
+        """在该快照的下载锁内打开快照，本地不存在时下载"""
+        snapshot = self._open.get(path)
+        if snapshot is not None:
+            return snapshot
+
+        if not os.path.exists(path):
+            fd, download_path = tempfile.mkstemp(dir=self.directory, suffix=".download")
+            os.close(fd)
+            try:
+                result = await client.download_archive(owner, repo, sha, download_path)
+                if result.get("error"):
+                    return None
+                tmp_path = download_path + ".zip"
+                await to_thread(_repack, download_path, tmp_path)
+                os.replace(tmp_path, path)
+            except (OSError, zipfile.BadZipFile):
+                return None
+            finally:
+                for leftover in (download_path, download_path + ".zip"):
+                    if os.path.exists(leftover):
+                        os.unlink(leftover)
+            self.downloads += 1
+            self._evict(keep=path)
+        else:
+            # 更新访问时间，供按 LRU 淘汰
+            os.utime(path)
+
+        snapshot = Snapshot(path, sha)
+        self._open[path] = snapshot
+        while len(self._open) > _MAX_OPEN_SNAPSHOTS:
+            _, closed = self._open.popitem(last=False)
+            closed.close()
+        return snapshot
+
+    def _evict(self, keep: str):
+        """按磁盘预算删除最久未使用的快照"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".zip"):
+                continue
+            full_path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, full_path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, full_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if full_path == keep:
+                continue
+            # 已 mmap 的快照在 POSIX 下删除文件后仍可继续读取，关闭后释放映射
+            evicted = self._open.pop(full_path, None)
+            if evicted is not None:
+                evicted.close()
+            try:
+                os.unlink(full_path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """快照统计"""
+        return {
+            "open": len(self._open),
+            "downloads": self.downloads,
+            "evictions": self.evictions,
+            "max_bytes": self.max_bytes,
+        }
@@ -132,30 +132,22 @@ class ChatApp {
 
         // 显示加载状态
         this.isLoading = true;
-        const loadingId = this.addLoadingMessage();
+        const stream = { loadingId: this.addLoadingMessage(), message: null, answer: '', tools: {} };
 
         try {
-            let response;
-            if (this.currentMode === 'tech') {
-                response = await this.sendTechQuestion(question);
-            } else {
-                response = await this.sendRepoQuestion(question);
-            }
-
-            // 移除加载消息
-            this.removeMessage(loadingId);
+            const request = this.currentMode === 'tech'
+                ? this.buildTechRequest(question)
+                : this.buildRepoRequest(question);
 
-            // 添加助手回复
-            this.addMessage('assistant', response.answer, response.tool_calls);
+            // 通过 SSE 接收工具调用进度和回答文本
+            await this.streamChat(request.url, request.body, (event) => {
+                this.handleStreamEvent(stream, event);
+            });
 
-            // 更新会话ID
-            if (response.session_id) {
-                this.currentSessionId = response.session_id;
-                this.loadSessions();
-            }
+            this.loadSessions();
         } catch (error) {
             // 移除加载消息
-            this.removeMessage(loadingId);
+            this.removeMessage(stream.loadingId);
 
             // 显示错误
             this.addMessage('assistant', `抱歉，处理您的请求时出现错误：${error.message}`);
@@ -165,30 +157,20 @@ class ChatApp {
         }
     }
 
-    async sendTechQuestion(question) {
+    buildTechRequest(question) {
         const language = this.languageSelect.value;
-        
-        const response = await fetch('/api/chat/tech', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
+
+        return {
+            url: '/api/chat/tech/stream',
+            body: {
                 question: question,
                 language: language || undefined,
                 session_id: this.currentSessionId
-            }),
-        });
-
-        if (!response.ok) {
-            const error = await response.json();
-            throw new Error(error.detail || '请求失败');
-        }
-
-        return await response.json();
+            }
+        };
     }
 
-    async sendRepoQuestion(question) {
+    buildRepoRequest(question) {
         const owner = this.repoOwner.value.trim();
         const name = this.repoName.value.trim();
         const ref = this.repoRef.value.trim();
@@ -197,18 +179,26 @@ class ChatApp {
             throw new Error('请填写仓库所有者和仓库名称');
         }
 
-        const response = await fetch('/api/chat/repo', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
+        return {
+            url: '/api/chat/repo/stream',
+            body: {
                 repo_owner: owner,
                 repo_name: name,
                 question: question,
                 ref: ref || undefined,
                 session_id: this.currentSessionId
-            }),
+            }
+        };
+    }
+
+    async streamChat(url, body, onEvent) {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+            },
+            body: JSON.stringify(body),
         });
 
         if (!response.ok) {
@@ -216,7 +206,92 @@ class ChatApp {
             throw new Error(error.detail || '请求失败');
         }
 
-        return await response.json();
+        // 按空行切分 SSE 事件，只关心 data 字段
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const raw = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                const data = raw.split('\n')
+                    .filter(line => line.startsWith('data:'))
+                    .map(line => line.slice(5).trim())
+                    .join('\n');
+                if (data) {
+                    onEvent(JSON.parse(data));
+                }
+            }
+        }
+    }
+
+    handleStreamEvent(stream, event) {
+        switch (event.type) {
+            case 'session':
+                this.currentSessionId = event.session_id;
+                break;
+            case 'tool_start': {
+                const message = this.ensureStreamMessage(stream);
+                // 工具调用之前的文本只是过渡语，最终回答从下一轮开始
+                stream.answer = '';
+                const item = document.createElement('div');
+                item.className = 'tool-call-item';
+                item.textContent = `🔧 ${event.name} …`;
+                message.tools.appendChild(item);
+                stream.tools[event.id] = item;
+                this.scrollToBottom();
+                break;
+            }
+            case 'tool_end': {
+                const item = stream.tools[event.id];
+                if (item) {
+                    const status = event.error ? '✗' : '✓';
+                    item.textContent = `🔧 ${event.name} ${status} ${event.elapsed_ms}ms`;
+                }
+                break;
+            }
+            case 'token':
+                stream.answer += event.content;
+                this.ensureStreamMessage(stream).bubble.innerHTML = this.formatMessage(stream.answer);
+                this.scrollToBottom();
+                break;
+            case 'done':
+                stream.answer = event.answer;
+                this.ensureStreamMessage(stream).bubble.innerHTML = this.formatMessage(event.answer);
+                this.currentSessionId = event.session_id;
+                this.scrollToBottom();
+                break;
+            case 'error':
+                throw new Error(event.message);
+        }
+    }
+
+    ensureStreamMessage(stream) {
+        if (stream.message) {
+            return stream.message;
+        }
+
+        // 收到第一个事件时用正在生成的助手消息替换加载动画
+        this.removeMessage(stream.loadingId);
+        const message = { id: Date.now(), role: 'assistant', content: '', time: new Date() };
+        this.messages.push(message);
+
+        const messageEl = this.createMessageElement(message);
+        const tools = document.createElement('div');
+        tools.className = 'tool-calls';
+        messageEl.querySelector('.message-bubble').after(tools);
+        this.messageList.appendChild(messageEl);
+
+        stream.message = {
+            bubble: messageEl.querySelector('.message-bubble'),
+            tools: tools
+        };
+        return stream.message;
     }
 
     addMessage(role, content, toolCalls = null) {
@@ -363,37 +438,57 @@ class ChatApp {
         }, 100);
     }
 
-    async loadSessions() {
+    async loadSessions(cursor = null) {
         try {
-            const response = await fetch('/api/sessions');
+            // 分页加载，每页只含会话摘要
+            const params = new URLSearchParams({ limit: '30' });
+            if (cursor) params.set('cursor', cursor);
+            const response = await fetch(`/api/sessions?${params}`);
             if (!response.ok) return;
 
             const data = await response.json();
-            this.renderSessions(data.sessions);
+            this.renderSessions(data.sessions, data.next_cursor, Boolean(cursor));
         } catch (error) {
             console.error('加载会话列表失败:', error);
         }
     }
 
-    renderSessions(sessions) {
-        if (!sessions || sessions.length === 0) {
+    renderSessions(sessions, nextCursor = null, append = false) {
+        if (!append && (!sessions || sessions.length === 0)) {
             this.sessionList.innerHTML = '<div style="text-align: center; color: #999; font-size: 12px; padding: 20px;">暂无历史会话</div>';
             return;
         }
 
-        this.sessionList.innerHTML = sessions.map(session => {
+        const items = sessions.map(session => {
             const isActive = session.session_id === this.currentSessionId;
             const date = new Date(session.updated_at);
+            const title = session.title || `对话 - ${session.message_count / 2} 轮`;
+            const meta = session.repo ? `${session.repo} · ${this.formatTime(date)}` : this.formatTime(date);
             return `
                 <div class="session-item ${isActive ? 'active' : ''}" data-session-id="${session.session_id}">
-                    <div class="session-title">对话 - ${session.message_count / 2} 轮</div>
-                    <div class="session-meta">${this.formatTime(date)}</div>
+                    <div class="session-title">${this.escapeHtml(title)}</div>
+                    <div class="session-meta">${this.escapeHtml(meta)}</div>
                 </div>
             `;
         }).join('');
 
-        // 绑定点击事件
-        this.sessionList.querySelectorAll('.session-item').forEach(item => {
+        const more = this.sessionList.querySelector('.session-more');
+        if (more) more.remove();
+        if (append) {
+            this.sessionList.insertAdjacentHTML('beforeend', items);
+        } else {
+            this.sessionList.innerHTML = items;
+        }
+        if (nextCursor) {
+            this.sessionList.insertAdjacentHTML('beforeend',
+                '<div class="session-more" style="text-align: center; color: #999; font-size: 12px; padding: 10px; cursor: pointer;">加载更多</div>');
+            this.sessionList.querySelector('.session-more')
+                .addEventListener('click', () => this.loadSessions(nextCursor));
+        }
+
+        // 绑定点击事件（追加页时跳过已绑定的条目）
+        this.sessionList.querySelectorAll('.session-item:not([data-bound])').forEach(item => {
+            item.dataset.bound = '1';
             item.addEventListener('click', () => {
                 const sessionId = item.dataset.sessionId;
                 this.loadSession(sessionId);
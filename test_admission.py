@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+准入控制测试：按 Key 轮转出队、单 Key 上限、队列已满与排队超时
+"""
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_admission_round_robin_between_keys():
+    """等待队列按 Key 轮转出队，单个调用方的突发不会排在其他调用方之前"""
+    async def run():
+        admission = AdmissionController(max_running=1, max_queue=10, queue_timeout=5)
+        await admission.acquire("a")
+        order = []
+
+        async def request(key: str):
+            await admission.acquire(key)
+            order.append(key)
+            admission.release(key)
+
+        tasks = []
+        for key in ("a", "a", "a", "b", "b"):
+            tasks.append(asyncio.create_task(request(key)))
+            await asyncio.sleep(0)
+        admission.release("a")
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b", "a", "b", "a"]
+        assert admission.stats()["running"] == 0
+
+    asyncio.run(run())
+
+
+def test_admission_per_key_limit_does_not_block_other_keys():
+    """某个 Key 达到单 Key 上限排队时，其他 Key 仍可使用空闲的全局许可"""
+    async def run():
+        admission = AdmissionController(max_running=2, max_queue=10, queue_timeout=5, per_key_limit=1)
+        await admission.acquire("a")
+        blocked = asyncio.create_task(admission.acquire("a"))
+        await asyncio.sleep(0)
+        assert not blocked.done()
+
+        await asyncio.wait_for(admission.acquire("b"), 1)
+        admission.release("a")
+        await asyncio.wait_for(blocked, 1)
+        assert admission.stats()["running"] == 2
+
+    asyncio.run(run())
+
+
+def test_admission_rejects_when_queue_full_or_timed_out():
+    """队列已满时立即拒绝，排队超时时拒绝并移出队列"""
+    async def run():
+        admission = AdmissionController(max_running=1, max_queue=1, queue_timeout=0.05)
+        await admission.acquire("a")
+        waiting = asyncio.create_task(admission.acquire("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await waiting
+        assert rejected.value.reason == "排队超时"
+        stats = admission.stats()
+        assert (stats["rejected_full"], stats["rejected_timeout"], stats["queue_depth"]) == (1, 1, 0)
+
+    asyncio.run(run())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+HTTP 接口测试：在进程内通过 ASGI 调用应用，上游为 mock_upstream 替身服务
+"""
+import asyncio
+import json
+
+import httpx
+
+import main
+from admission import AdmissionController
+from client_pool import get_client_pool
+from session_store import get_session_store
+
+
+def _run(test):
+    """在应用生命周期内执行 test(client)，结束时释放进程级单例"""
+    async def run():
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+                await test(client)
+
+    asyncio.run(run())
+
+
+def test_job_runs_inside_admission_slot():
+    """异步任务执行时占用提交方的运行许可，结束后归还"""
+    async def test(client):
+        admission = get_client_pool().admission
+        admitted = admission.stats()["admitted"]
+        response = await client.post("/api/jobs", headers={"X-API-Key": "jobs"}, json={
+            "kind": "repo", "repo_owner": "mock", "repo_name": "demo", "question": "这个仓库是做什么的？"
+        })
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        while True:
+            job = (await client.get(f"/api/jobs/{job_id}")).json()
+            if job["status"] not in ("queued", "running"):
+                break
+            await asyncio.sleep(0.02)
+        assert job["status"] == "succeeded", job["error"]
+        assert job["result"]["answer"] == "这是一个示例仓库。"
+        assert admission.stats()["admitted"] == admitted + 1
+        assert admission.stats()["running"] == 0
+
+    _run(test)
+
+
+def test_batch_questions_take_admission_slots():
+    """批量问答读取上下文后归还许可，每个问题各自获取许可；单 Key 上限为 1 时逐个回答且不会死锁"""
+    async def test(client):
+        pool = get_client_pool()
+        admission = pool.admission = AdmissionController(max_running=4, max_queue=16, queue_timeout=30,
+                                                         per_key_limit=1)
+        peak = 0
+
+        async def watch():
+            nonlocal peak
+            while True:
+                peak = max(peak, admission.stats()["running"])
+                await asyncio.sleep(0.002)
+
+        watcher = asyncio.create_task(watch())
+        try:
+            response = await client.post("/api/chat/repo/batch", headers={"X-API-Key": "batch"}, json={
+                "repo_owner": "mock", "repo_name": "demo",
+                "questions": ["入口在哪里？", "有哪些模块？", "怎么运行？", "有测试吗？"], "concurrency": 4
+            })
+        finally:
+            watcher.cancel()
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert [event["type"] for event in events][0] == "context"
+        answers = [event for event in events if event["type"] == "answer"]
+        assert sorted(event["index"] for event in answers) == [0, 1, 2, 3]
+        assert all(event["answer"] == "这是一个示例仓库。" for event in answers)
+        assert events[-1] == {**events[-1], "type": "done", "count": 4, "failed": 0}
+        # 上下文一个许可，每个问题一个许可
+        assert admission.stats()["admitted"] == 5
+        assert peak == 1
+        assert admission.stats()["running"] == 0
+
+    _run(test)
+
+
+def test_metrics_and_stats_count_sessions_off_loop():
+    """/metrics 与 /api/stats 的会话总数按 TTL 缓存，不在每次请求时扫描数据库"""
+    async def test(client):
+        store = get_session_store()
+        counts = 0
+        count = store._count
+
+        def counting() -> int:
+            nonlocal counts
+            counts += 1
+            return count()
+
+        store._count = counting
+        session = await store.get_or_create("metrics-session", repo="mock/demo")
+        store.append(session, "user", "入口在哪里？")
+        await store.flush()
+
+        first = await client.get("/metrics")
+        assert first.status_code == 200
+        stored = store.stats()["stored"]
+        assert stored >= 1
+        assert f"chat2repo_sessions_stored {stored}" in first.text
+        assert "# TYPE chat2repo_tool_duration_seconds histogram" in first.text
+
+        stats = (await client.get("/api/stats")).json()
+        assert stats["sessions"]["stored"] == stored
+        await client.get("/metrics")
+        assert counts == 1
+
+    _run(test)
+
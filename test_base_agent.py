@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Agent 循环测试：流式生成期间提前执行工具、非法工具参数的处理
+"""
+import asyncio
+import json
+from types import SimpleNamespace as NS
+
+from agents.base_agent import BaseAgent
+from client_pool import ClientPool
+
+
+def _tool_chunk(index: int, arguments: str, name: str = "", call_id: str = ""):
+    call = NS(index=index, id=call_id or None,
+              function=NS(name=name or None, arguments=arguments))
+    return NS(usage=None, choices=[NS(delta=NS(content=None, tool_calls=[call]))])
+
+
+def _text_chunk(text: str):
+    return NS(usage=None, choices=[NS(delta=NS(content=text, tool_calls=None))])
+
+
+class _ScriptedLLM:
+    """按轮次回放预先编写的流式响应"""
+
+    model = "gpt-4"
+
+    def __init__(self, turns):
+        self.turns = list(turns)
+        self.requests = []
+
+    async def stream_chat(self, messages, tools=None, tool_choice=None):
+        self.requests.append([dict(m) for m in messages])
+        for chunk in self.turns.pop(0):
+            if callable(chunk):
+                await chunk()
+                continue
+            yield chunk
+
+
+def _agent(llm, pool: ClientPool) -> BaseAgent:
+    agent = BaseAgent(pool)
+    agent.llm = llm
+    agent.stream = True
+    return agent
+
+
+def _run(test):
+    """在新建的客户端池中执行测试协程"""
+    async def main():
+        pool = ClientPool()
+        try:
+            await test(pool)
+        finally:
+            await pool.aclose()
+
+    asyncio.run(main())
+
+
+def test_tools_start_while_the_model_is_still_streaming():
+    """第一个工具调用的参数一完整就开始执行，不等后续调用生成完"""
+    async def run(pool: ClientPool):
+        started = []
+        first_started = asyncio.Event()
+
+        async def execute_tool(name, arguments):
+            started.append(arguments["path"])
+            if arguments["path"] == "a.py":
+                first_started.set()
+            return {"content": arguments["path"]}
+
+        async def wait_for_first_tool():
+            # 第二个调用生成之前，第一个调用必须已经开始执行
+            await asyncio.wait_for(first_started.wait(), 1)
+
+        llm = _ScriptedLLM([
+            [
+                _tool_chunk(0, "", name="get_file_content", call_id="c0"),
+                _tool_chunk(0, '{"path": '),
+                _tool_chunk(0, '"a.py"}'),
+                wait_for_first_tool,
+                _tool_chunk(1, "", name="get_file_content", call_id="c1"),
+                _tool_chunk(1, '{"path": "b.py"}'),
+            ],
+            [_text_chunk("完成")],
+        ])
+        agent = _agent(llm, pool)
+        agent.tools.execute_tool = execute_tool
+        result = await agent.run("读取文件")
+        assert result["success"] and result["answer"] == "完成"
+        assert started == ["a.py", "b.py"]
+        tool_messages = [m for m in llm.requests[1] if m["role"] == "tool"]
+        assert [m["tool_call_id"] for m in tool_messages] == ["c0", "c1"]
+
+    _run(run)
+
+
+def test_invalid_tool_arguments_become_tool_errors():
+    """流式与非流式路径下，非法的参数 JSON 都作为工具错误返回给模型"""
+    async def run(pool: ClientPool):
+        llm = _ScriptedLLM([
+            [_tool_chunk(0, "", name="get_file_content", call_id="c0"), _tool_chunk(0, '{"path": ')],
+            [_text_chunk("完成")],
+        ])
+        agent = _agent(llm, pool)
+        result = await agent.run("读取文件")
+        assert result["success"]
+        tool_message = [m for m in llm.requests[1] if m["role"] == "tool"][0]
+        assert "不是合法的 JSON" in json.loads(tool_message["content"])["error"]
+
+        calls = 0
+
+        async def chat(messages, tools=None, tool_choice=None):
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                call = NS(id="c0", type="function", function=NS(name="get_file_content", arguments="{bad"))
+                message = NS(content="", tool_calls=[call])
+            else:
+                assert "不是合法的 JSON" in messages[-1]["content"]
+                message = NS(content="完成", tool_calls=None)
+            return {"success": True, "response": NS(choices=[NS(message=message)]), "usage": None}
+
+        agent = _agent(NS(model="gpt-4", chat=chat), pool)
+        agent.stream = False
+        result = await agent.run("读取文件")
+        assert result["success"] and calls == 2
+
+    _run(run)
+
+
+def test_tool_exceptions_become_tool_errors():
+    """工具抛出异常时该调用返回错误，同一轮的其他调用不受影响"""
+    async def run(pool: ClientPool):
+        async def execute_tool(name, arguments):
+            if arguments["path"] == "bad.py":
+                raise RuntimeError("boom")
+            return {"content": "ok"}
+
+        llm = _ScriptedLLM([
+            [
+                _tool_chunk(0, '{"path": "bad.py"}', name="get_file_content", call_id="c0"),
+                _tool_chunk(1, '{"path": "good.py"}', name="get_file_content", call_id="c1"),
+            ],
+            [_text_chunk("完成")],
+        ])
+        agent = _agent(llm, pool)
+        agent.tools.execute_tool = execute_tool
+        result = await agent.run("读取文件")
+        assert result["success"]
+        contents = [json.loads(m["content"]) for m in llm.requests[1] if m["role"] == "tool"]
+        assert "boom" in contents[0]["error"] and contents[1] == {"content": "ok"}
+
+    _run(run)
@@ -4,6 +4,7 @@ Chat2Repo 测试客户端
 """
 import os
 import sys
+import time
 import requests
 import json
 from typing import Optional
@@ -114,6 +115,41 @@ class Chat2RepoTestClient:
             print(f"错误: {e}")
             return False, None
     
+    def test_job(self, owner: str, repo: str, question: str, timeout: float = 600):
+        """测试异步任务：提交后轮询状态与进度"""
+        print(f"\n=== 测试异步任务 ===")
+        print(f"仓库: {owner}/{repo}")
+        print(f"问题: {question}")
+        
+        try:
+            response = requests.post(
+                f"{self.base_url}/api/jobs",
+                json={"kind": "repo", "repo_owner": owner, "repo_name": repo, "question": question},
+                timeout=30
+            )
+            print(f"状态码: {response.status_code}")
+            if response.status_code != 202:
+                print(f"错误: {response.text}")
+                return False
+            job = response.json()
+            print(f"任务ID: {job['job_id']}")
+            
+            deadline = time.time() + timeout
+            while job["status"] in ("queued", "running") and time.time() < deadline:
+                time.sleep(1)
+                job = requests.get(f"{self.base_url}/api/jobs/{job['job_id']}", timeout=30).json()
+                print(f"  状态: {job['status']}，工具调用进度: {len(job['progress'])} 条")
+            
+            if job["status"] != "succeeded":
+                print(f"错误: {job.get('error') or job['status']}")
+                return False
+            print(f"\n答案:\n{job['result']['answer']}")
+            return True
+                
+        except Exception as e:
+            print(f"错误: {e}")
+            return False
+    
     def test_get_session(self, session_id: str):
         """测试获取会话历史"""
         print(f"\n=== 测试获取会话历史 ===")
@@ -192,6 +228,13 @@ def main():
         language="Java"
     )
     
+    # 测试 3: 异步任务
+    client.test_job(
+        owner="dromara",
+        repo="hutool",
+        question="这个项目的目录结构是怎样的？"
+    )
+    
     print("\n" + "=" * 50)
     print("测试完成！")
 
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+本地代码搜索测试：trigram 候选、增量构建期间的结果完整性与正则限制
+"""
+import threading
+
+from code_search import TrigramIndex
+
+
+class _Files:
+    """内存中的文件源，提供 paths() 和 read(path)"""
+
+    def __init__(self, files):
+        self.files = {path: content.encode("utf-8") for path, content in files.items()}
+
+    def paths(self):
+        return list(self.files)
+
+    def read(self, path):
+        data = self.files.get(path)
+        return memoryview(data) if data is not None else None
+
+
+def _repo(count: int = 200) -> _Files:
+    files = {f"src/mod_{i}.py": f"def handler_{i}():\n    return parse_config({i})\n" for i in range(count)}
+    files["README.md"] = "Привет, école\n"
+    return _Files(files)
+
+
+def test_search_finds_all_files_during_incremental_build():
+    """构建到一半时，已建索引和待索引的文件都能搜到"""
+    index = TrigramIndex(_repo())
+    index.build_step(max_files=50)
+    result = index.search("parse_config", max_results=1000, max_per_file=1)
+    assert result["files_matched"] == 200
+
+    index.build()
+    result = index.search("handler_7\\d", regex=True, max_results=1000)
+    assert sorted(m["path"] for m in result["matches"]) == [f"src/mod_{i}.py" for i in range(70, 80)]
+
+
+def test_search_is_consistent_with_a_concurrent_builder():
+    """后台线程构建索引时并发搜索，每次都能找到全部文件"""
+    index = TrigramIndex(_repo(2000))
+    results = []
+
+    def build():
+        while not index.build_step(max_files=7):
+            pass
+
+    builder = threading.Thread(target=build)
+    builder.start()
+    while builder.is_alive():
+        results.append(index.search("parse_config", max_results=10000, max_per_file=1)["files_matched"])
+    builder.join()
+    assert results and set(results) == {2000}
+
+
+def test_ignore_case_handles_non_ascii_literals():
+    """非 ASCII 字面量忽略大小写时不会因 trigram 折叠方式不同而漏掉文件"""
+    index = TrigramIndex(_repo(3))
+    index.build()
+    assert index.search("привет")["count"] == 1
+    assert index.search("ÉCOLE")["count"] == 1
+    assert index.search("ÉCOLE", ignore_case=False)["count"] == 0
+
+
+def test_dangerous_or_oversized_patterns_are_rejected():
+    """嵌套的无界重复和过长的正则直接返回错误，不在工作线程上执行"""
+    index = TrigramIndex(_repo(3))
+    index.build()
+    for pattern in ("(a+)+$", "(\\w+\\s?)*x", "(?:a|b*)+c", "x" * 300):
+        assert "error" in index.search(pattern, regex=True)
+    assert index.search("(handler_1|handler_2)\\(", regex=True)["count"] == 2
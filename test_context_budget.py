@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+上下文 token 预算测试：首尾窗口截断与按预算压缩消息列表
+"""
+from context_budget import ContextBudget, TokenCounter, _OMITTED_TOOL_OUTPUT
+
+
+def _lines(prefix: str, count: int) -> str:
+    return "\n".join(f"{prefix} line {i}: some file content here" for i in range(count))
+
+
+def test_window_keeps_head_and_tail_with_marker():
+    """超出上限时保留首部约 2/3 和尾部，中间替换为截断标记"""
+    counter = TokenCounter("gpt-4")
+    short = "hello world"
+    assert counter.window(short, 100) == short
+
+    text = _lines("x", 500)
+    windowed = counter.window(text, 200)
+    head, marker_and_tail = windowed.split("\n...[已截断 ", 1)
+    tail = marker_and_tail.split("]...\n", 1)[1]
+    assert text.startswith(head) and text.endswith(tail)
+    assert head and tail
+    assert counter.count(head) > counter.count(tail)
+    assert counter.count(head) + counter.count(tail) <= 210
+    assert f"{counter.count(text) - 200} tokens" in marker_and_tail
+
+
+def _conversation():
+    return [
+        {"role": "system", "content": "你是代码助手"},
+        {"role": "user", "content": _lines("history question", 20)},
+        {"role": "assistant", "content": _lines("history answer", 20)},
+        {"role": "user", "content": "入口在哪里？"},
+        {"role": "assistant", "content": "", "tool_calls": [
+            {"id": "c0", "type": "function", "function": {"name": "get_file_content", "arguments": "{}"}}]},
+        {"role": "tool", "tool_call_id": "c0", "content": _lines("old tool", 200)},
+        {"role": "assistant", "content": "", "tool_calls": [
+            {"id": "c1", "type": "function", "function": {"name": "get_file_content", "arguments": "{}"}}]},
+        {"role": "tool", "tool_call_id": "c1", "content": _lines("new tool", 50)},
+    ]
+
+
+def test_fit_windows_old_tool_outputs_first():
+    """略超预算时只压缩较早的工具输出，最近一轮的工具输出不动"""
+    messages = _conversation()
+    latest = messages[-1]["content"]
+    probe = ContextBudget("gpt-4", 10 ** 6, reserve_tokens=0)
+    total = probe.count(messages)
+    old_tokens = probe.counter.count(messages[5]["content"])
+
+    budget = ContextBudget("gpt-4", total - old_tokens // 2, reserve_tokens=0, old_tool_output_tokens=100)
+    usage = budget.fit(messages)
+    assert usage["windowed"] == 1 and usage["omitted"] == 0 and usage["history_dropped"] == 0
+    assert "[已截断" in messages[5]["content"]
+    assert messages[-1]["content"] == latest
+    assert usage["prompt_tokens"] <= usage["budget"]
+    assert usage["trimmed_tokens"] == total - usage["prompt_tokens"]
+
+
+def test_fit_omits_tool_outputs_then_drops_early_history():
+    """预算更紧时省略较早的工具输出，最后裁剪早期对话历史，当前问题和 system 保留"""
+    messages = _conversation()
+    probe = ContextBudget("gpt-4", 10 ** 6, reserve_tokens=0)
+    history = probe.counter.count_message(messages[1]) + probe.counter.count_message(messages[2])
+    kept = probe.count([m for i, m in enumerate(messages) if i not in (1, 2, 5)])
+
+    budget = ContextBudget("gpt-4", kept + history // 2 + 20, reserve_tokens=0, old_tool_output_tokens=100)
+    usage = budget.fit(messages)
+    assert usage["omitted"] == 1
+    assert usage["history_dropped"] >= 1
+    assert messages[0]["role"] == "system"
+    assert any(m.get("content") == "入口在哪里？" for m in messages)
+    assert any(m.get("content") == _OMITTED_TOOL_OUTPUT for m in messages)
+    assert "new tool line 49" in messages[-1]["content"]
+    assert usage["prompt_tokens"] <= usage["budget"]
+
+
+def test_for_model_uses_longest_prefix():
+    """模型窗口按 context_budgets 中最长的前缀匹配"""
+    class Settings:
+        context_budgets = {"gpt-4": 8192, "gpt-4-turbo": 128000}
+        context_budget_default = 4096
+        context_reserve_tokens = 1024
+        tool_output_max_tokens = 2000
+        old_tool_output_tokens = 300
+
+    assert ContextBudget.for_model("gpt-4-turbo-preview", Settings).max_tokens == 128000
+    assert ContextBudget.for_model("gpt-4-0613", Settings).max_tokens == 8192
+    assert ContextBudget.for_model("qwen-max", Settings).max_tokens == 4096
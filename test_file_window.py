@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+按行窗口读取测试：分页按 token 计量，逐页读取能完整拿到每一行
+"""
+import asyncio
+import json
+
+from config import get_settings
+from context_budget import ContextBudget
+from gitee_client import GiteeClient
+from tools import GiteeTools
+from tools.file_window import DecodedFile
+
+
+class _LocalFileTools(GiteeTools):
+    """直接返回内存中文件的工具集，不访问上游"""
+
+    def __init__(self, client, text: str):
+        super().__init__(client=client)
+        self.decoded = DecodedFile(text)
+
+    async def _load_file(self, owner, repo, path, ref):
+        meta = {"path": path, "name": path, "size": self.decoded.byte_size,
+                "type": "file", "sha": None, "url": None}
+        return meta, self.decoded
+
+
+def _big_file() -> str:
+    # 每行长度不一，含中文和需要 JSON 转义的字符
+    return "".join(
+        f'line {i}: {"值" * (i % 7)} "quoted"\t{"x" * (i % 90)}\n' for i in range(1, 3001)
+    )
+
+
+def test_paging_through_file_returns_every_line():
+    """按 next_start_line 逐页读取，工具输出经过上限裁剪后仍不丢行"""
+    async def run():
+        client = GiteeClient()
+        try:
+            text = _big_file()
+            tools = _LocalFileTools(client, text)
+            clip = ContextBudget.for_model(tools.counter.model, get_settings()).clip_tool_output
+
+            pages = []
+            start = None
+            while True:
+                result = await tools.get_file_content("mock", "demo", "big.txt", start_line=start)
+                serialized = json.dumps(result, ensure_ascii=False)
+                assert clip(serialized) == serialized
+                pages.append(result["content"])
+                start = result.get("next_start_line")
+                if start is None:
+                    break
+                assert f"start_line={start}" in result["header"]
+            assert len(pages) > 1
+            assert "".join(pages) == text
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_around_stays_within_tool_output_limit():
+    """around 模式的多个片段合计同样不超过工具输出上限"""
+    async def run():
+        client = GiteeClient()
+        try:
+            tools = _LocalFileTools(client, _big_file())
+            result = await tools.get_file_content("mock", "demo", "big.txt", around="quoted", context=200)
+            serialized = json.dumps(result, ensure_ascii=False)
+            assert tools.counter.count(serialized) <= tools.tool_output_max_tokens
+            assert result["truncated"]
+            assert result["segments"][0]["start_line"] == 1
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_window_without_token_limit_uses_lines_and_chars():
+    """不传 token 上限时仍按行数和字符数分页"""
+    decoded = DecodedFile("".join(f"{i}\n" for i in range(1, 101)))
+    page = decoded.window(None, None, page_lines=30, max_chars=10000)
+    assert (page["start_line"], page["end_line"], page["next_start_line"]) == (1, 30, 31)
+    page = decoded.window(95, None, page_lines=30, max_chars=10000)
+    assert page["end_line"] == 100 and "next_start_line" not in page and not page["truncated"]
+
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+GiteeClient 测试：响应缓存与 ETag 条件请求
+"""
+import asyncio
+
+from gitee_client import GiteeClient
+
+
+def test_expired_cache_entry_is_revalidated_with_etag(gitee):
+    """缓存条目过期后带 If-None-Match 重新验证，304 时沿用缓存的响应体"""
+    async def run():
+        client = GiteeClient()
+        try:
+            first = await client.get_repo_info("mock", "etag")
+            requests, sent = gitee.request_count, gitee.bytes_sent
+
+            cached = await client.get_repo_info("mock", "etag")
+            assert gitee.request_count == requests
+            assert client.http_cache.stats()["hits"] == 1
+
+            for entry in client.http_cache._entries.values():
+                entry.expires_at = 0
+            revalidated = await client.get_repo_info("mock", "etag")
+            assert gitee.request_count == requests + 1
+            assert gitee.bytes_sent == sent
+            assert client.http_cache.stats()["revalidated"] == 1
+            assert first == cached == revalidated
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
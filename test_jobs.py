@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+异步任务测试：任务生命周期，任务与聊天接口共用准入许可
+"""
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+from jobs import JobManager
+
+
+async def _wait_finished(manager: JobManager, job_id: str):
+    while (await manager.get(job_id)).finished_at is None:
+        await asyncio.sleep(0.01)
+    return await manager.get(job_id)
+
+
+def test_job_lifecycle_records_progress_and_result():
+    """任务排队、执行、结束；只记录工具调用进度，失败的任务带错误信息"""
+    async def run():
+        manager = JobManager(workers=2, max_queue=5, ttl=60)
+        try:
+            async def ok(emit):
+                await emit({"type": "tool_start", "name": "get_readme"})
+                await emit({"type": "delta", "content": "这是"})
+                await emit({"type": "tool_end", "name": "get_readme"})
+                return {"answer": "这是一个示例仓库。"}
+
+            async def broken(emit):
+                raise RuntimeError("LLM 不可用")
+
+            job = await manager.submit("repo", "s1", ok)
+            assert job.status == "queued"
+            failed = await manager.submit("repo", "s2", broken)
+
+            job = await _wait_finished(manager, job.job_id)
+            assert job.status == "succeeded"
+            assert job.result == {"answer": "这是一个示例仓库。"}
+            assert [event["type"] for event in job.progress] == ["tool_start", "tool_end"]
+            assert job.started_at <= job.finished_at
+
+            failed = await _wait_finished(manager, failed.job_id)
+            assert failed.status == "failed" and "LLM 不可用" in failed.error
+            stats = manager.stats()
+            assert (stats["succeeded"], stats["failed"], stats["running"]) == (1, 1, 0)
+        finally:
+            await manager.aclose()
+
+    asyncio.run(run())
+
+
+def test_job_queue_full_and_shutdown():
+    """排队任务已满时拒绝提交；关闭时中止执行中和排队的任务"""
+    async def run():
+        manager = JobManager(workers=1, max_queue=1, ttl=60)
+
+        async def blocked(emit):
+            await asyncio.Event().wait()
+
+        running = await manager.submit("repo", "s1", blocked)
+        await asyncio.sleep(0)
+        queued = await manager.submit("repo", "s2", blocked)
+        with pytest.raises(AdmissionRejected):
+            await manager.submit("repo", "s3", blocked)
+        assert manager.stats()["rejected"] == 1
+
+        # 服务关闭：执行中的任务中止，排队的任务取消
+        await manager.aclose()
+        assert running.status == queued.status == "cancelled"
+        assert running.error == queued.error == "服务关闭，任务中止"
+
+    asyncio.run(run())
+
+
+def test_jobs_share_admission_with_chat():
+    """任务在准入许可内执行：许可被聊天请求占满时任务保持排队，许可归还后才开始"""
+    async def run():
+        admission = AdmissionController(max_running=1, max_queue=10, queue_timeout=5)
+        manager = JobManager(workers=2, max_queue=5, ttl=60)
+        seen_running = []
+
+        async def work(emit):
+            seen_running.append(admission.stats()["running"])
+            return {"answer": "ok"}
+
+        try:
+            await admission.acquire("chat")
+            job = await manager.submit("repo", "s1", work, slot=lambda: admission.slot("jobs"))
+            await asyncio.sleep(0.05)
+            assert job.status == "queued" and job.started_at is None
+            assert manager.stats()["waiting_admission"] == 1
+            assert admission.stats()["queue_depth"] == 1
+
+            admission.release("chat")
+            job = await _wait_finished(manager, job.job_id)
+            assert job.status == "succeeded"
+            assert seen_running == [1]
+            assert admission.stats()["running"] == 0
+        finally:
+            await manager.aclose()
+
+    asyncio.run(run())
+
+
+def test_cancel_job_waiting_for_admission():
+    """取消等待许可的任务会移出准入队列，不占用许可"""
+    async def run():
+        admission = AdmissionController(max_running=1, max_queue=10, queue_timeout=5)
+        manager = JobManager(workers=1, max_queue=5, ttl=60)
+
+        async def work(emit):
+            return {}
+
+        try:
+            await admission.acquire("chat")
+            job = await manager.submit("repo", "s1", work, slot=lambda: admission.slot("jobs"))
+            await asyncio.sleep(0.05)
+            await manager.cancel(job.job_id)
+            job = await _wait_finished(manager, job.job_id)
+            assert job.status == "cancelled" and job.started_at is None
+            assert admission.stats()["queue_depth"] == 0
+            admission.release("chat")
+            assert admission.stats()["running"] == 0
+        finally:
+            await manager.aclose()
+
+    asyncio.run(run())
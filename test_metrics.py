@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+指标测试：多进程部署时合并各工作进程的快照
+"""
+import asyncio
+import json
+import os
+import threading
+
+import metrics
+
+
+def test_metrics_shared_directory_io_runs_in_thread(tmp_path):
+    """多进程部署时导出合并其他进程的快照，共享目录的读写不在事件循环线程中执行"""
+    async def run():
+        registry = metrics.MetricsRegistry("t")
+        requests = registry.counter("requests_total", "请求数", labels=("code",))
+        registry.enable_shared(str(tmp_path))
+        requests.inc("200")
+        peer = {"t_requests_total": [[["200"], 2]]}
+        # 以当前进程的父进程号冒充另一个存活的工作进程
+        (tmp_path / f"{os.getppid()}.json").write_text(json.dumps(peer))
+
+        loop_thread = threading.get_ident()
+        io_threads = []
+        write = registry._write
+
+        def recording(local):
+            io_threads.append(threading.get_ident())
+            write(local)
+
+        registry._write = recording
+        text = await registry.export()
+        assert 't_requests_total{code="200"} 3' in text
+        await registry.flush()
+        assert len(io_threads) == 2 and loop_thread not in io_threads
+        assert json.loads((tmp_path / f"{os.getpid()}.json").read_text()) == {"t_requests_total": [[["200"], 1]]}
+
+    asyncio.run(run())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+性能剖析测试：单次请求剖析只统计所属任务，常驻采样按区域汇总
+"""
+import asyncio
+import json
+import tempfile
+import time
+
+import profiler
+from profiler import Profiler
+
+
+def _spin(seconds: float):
+    """占用事件循环的 CPU 循环"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def _other_spin(seconds: float):
+    _spin(seconds)
+
+
+async def _profiled_request(instance: Profiler, fmt: str) -> str:
+    """在剖析下执行一次“请求”：请求创建的任务计入剖析，其他任务不计入"""
+    async def unrelated():
+        await asyncio.sleep(0)
+        _other_spin(0.1)
+
+    other = asyncio.create_task(unrelated())
+    session = instance.start(fmt)
+
+    async def child():
+        _spin(0.1)
+
+    await asyncio.gather(asyncio.create_task(child()), other)
+    return await instance.finish(session, "GET /api/test")
+
+
+def test_request_profile_collapsed():
+    """collapsed 格式只包含被剖析请求及其创建的任务的栈"""
+    async def run():
+        instance = Profiler(interval=0.001, continuous_interval=0, directory=tempfile.mkdtemp())
+        instance.attach()
+        try:
+            path = await _profiled_request(instance, "collapsed")
+        finally:
+            instance.close()
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+        assert any("child (test_profiler.py" in line and ";_spin (test_profiler.py" in line for line in lines)
+        assert not any("_other_spin" in line for line in lines)
+        assert instance.find(path.rsplit("/", 1)[1].split(".")[0]) == (path, "collapsed")
+        assert instance.stats()["profiles"] == 1 and instance.stats()["active_profiles"] == 0
+
+    asyncio.run(run())
+
+
+def test_request_profile_speedscope():
+    """speedscope 格式：帧表与按采样间隔加权的样本"""
+    async def run():
+        instance = Profiler(interval=0.001, continuous_interval=0, directory=tempfile.mkdtemp())
+        instance.attach()
+        try:
+            path = await _profiled_request(instance, "speedscope")
+        finally:
+            instance.close()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        frames = data["shared"]["frames"]
+        profile = data["profiles"][0]
+        assert profile["type"] == "sampled" and profile["unit"] == "seconds"
+        assert len(profile["samples"]) == len(profile["weights"]) > 0
+        assert all(0 <= i < len(frames) for sample in profile["samples"] for i in sample)
+        assert any(frame["name"].endswith("_spin") for frame in frames)
+        assert not any(frame["name"].endswith("_other_spin") for frame in frames)
+        assert data["name"].startswith("GET /api/test (")
+
+    asyncio.run(run())
+
+
+def test_continuous_profile_by_region():
+    """常驻采样按注册的区域汇总热点帧；reset 后清空"""
+    async def run():
+        instance = Profiler(interval=0.001, continuous_interval=0.001, directory=tempfile.mkdtemp())
+        instance.add_region("spin", profiler._code_in(_spin))
+        instance.attach()
+        try:
+            _spin(0.15)
+            await asyncio.sleep(0.05)
+            summary = instance.continuous_profile("summary")
+            collapsed = instance.continuous_profile("collapsed", reset=True)
+        finally:
+            instance.close()
+        spin = summary["regions"]["spin"]
+        assert spin["samples"] > 0
+        assert spin["hot_frames"][0]["frame"].startswith("_spin (test_profiler.py:")
+        assert "idle" in summary["regions"]
+        assert ";_spin (test_profiler.py:" in collapsed
+        assert instance.continuous_profile("summary")["samples"] == 0
+
+    asyncio.run(run())
+
+
+def test_authorize_requires_configured_token():
+    """未配置管理员令牌时剖析功能不可用"""
+    assert "ADMIN_TOKEN" in profiler.authorize("anything")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Gitee 请求调度测试：令牌桶限速、优先级通道与 429 退避重试
+"""
+import asyncio
+import time
+
+import httpx
+
+import scheduler
+from gitee_client import GiteeClient
+from scheduler import RequestScheduler
+
+
+def test_token_bucket_limits_rate_after_burst():
+    """突发容量用完后按速率发放令牌"""
+    async def run():
+        bucket = RequestScheduler(rate=50, burst=2)
+        start = time.monotonic()
+        for _ in range(7):
+            await bucket.acquire()
+        # 2 个突发令牌之后还需 5 个令牌，约 0.1 秒
+        assert time.monotonic() - start >= 0.08
+        assert bucket.stats()["throttled"] == 5
+
+    asyncio.run(run())
+
+
+def test_interactive_lane_is_served_before_background():
+    """令牌不足时，交互式请求先于更早排队的后台请求获得令牌"""
+    async def run():
+        bucket = RequestScheduler(rate=100, burst=1)
+        await bucket.acquire()
+        order = []
+
+        async def request(name: str, lane_background: bool):
+            if lane_background:
+                with scheduler.background():
+                    await bucket.acquire()
+            else:
+                await bucket.acquire()
+            order.append(name)
+
+        tasks = [asyncio.create_task(request(f"bg{i}", True)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("fg", False)))
+        await asyncio.gather(*tasks)
+        assert order[0] == "fg"
+
+    asyncio.run(run())
+
+
+def test_rate_limited_request_is_retried_after_pause():
+    """429 时暂停令牌桶并按 Retry-After 退避重试"""
+    async def run():
+        responses = [
+            httpx.Response(429, headers={"Retry-After": "0.05"}, json={"message": "Too Many Requests"}),
+            httpx.Response(200, json={"name": "demo", "default_branch": "master"}),
+        ]
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return responses.pop(0)
+
+        bucket = RequestScheduler(rate=1000, burst=10, backoff_base=0.01)
+        http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        client = GiteeClient(http_client=http, scheduler=bucket)
+        try:
+            start = time.monotonic()
+            result = await client.get_repo_info("mock", "retry")
+            assert result["name"] == "demo"
+            assert time.monotonic() - start >= 0.05
+            stats = bucket.stats()
+            assert (stats["rate_limited"], stats["retries"]) == (1, 1)
+        finally:
+            await http.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+会话存储测试：并发追加的序号分配，会话列表分页
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from session_store import Session, SessionStore, SqliteSessionStore
+
+
+def test_interleaved_appends_keep_every_message():
+    """两个进程基于同一份会话各自追加消息，后写入的一方顺延序号，不覆盖对方的消息"""
+    async def run():
+        path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+        first = SqliteSessionStore(path, write_through=True)
+        second = SqliteSessionStore(path, write_through=True)
+        try:
+            session = await first.get_or_create("s1", repo="mock/demo")
+            first.append(session, "user", "入口在哪里？")
+            await first.flush()
+            other = await second.get("s1")
+
+            first.append(session, "assistant", "main.py")
+            second.append(other, "assistant", "app/core.py")
+            await first.flush()
+            await second.flush()
+
+            expected = ["入口在哪里？", "main.py", "app/core.py"]
+            reloaded = await second.get("s1")
+            assert [m.content for m in reloaded.messages] == expected
+            assert reloaded.persisted == 3
+
+            fresh = SqliteSessionStore(path)
+            try:
+                stored = await fresh.get("s1")
+                assert [m.content for m in stored.messages] == expected
+                rows, _ = await fresh.list_sessions()
+                assert rows[0]["message_count"] == 3
+            finally:
+                await fresh.aclose()
+        finally:
+            await first.aclose()
+            await second.aclose()
+
+    asyncio.run(run())
+
+
+def _fill(store, count: int):
+    """写入 count 个会话，更新时间依次递增，偶数序号属于 mock/a"""
+    for i in range(count):
+        session = Session(session_id=f"s{i}", kind="repo", repo="mock/a" if i % 2 == 0 else "mock/b",
+                          created_at=1000.0 + i, updated_at=1000.0 + i)
+        store._remember(session)
+        store.append(session, "user", f"问题 {i}")
+        session.updated_at = 1000.0 + i
+
+
+def _page_through(store, limit: int, repo=None):
+    async def run():
+        ids, cursor, pages = [], None, 0
+        while True:
+            rows, cursor = await store.list_sessions(limit=limit, cursor=cursor, repo=repo)
+            ids.extend(row["session_id"] for row in rows)
+            pages += 1
+            if cursor is None:
+                return ids, pages
+    return run()
+
+
+def test_list_sessions_pages_by_cursor():
+    """按更新时间倒序分页，逐页读取不重不漏；按仓库过滤"""
+    async def run():
+        stores = [SessionStore(), SqliteSessionStore(os.path.join(tempfile.mkdtemp(), "sessions.db"))]
+        try:
+            for store in stores:
+                _fill(store, 7)
+                ids, pages = await _page_through(store, 3)
+                assert ids == [f"s{i}" for i in range(6, -1, -1)]
+                assert pages == 3
+                repo_ids, _ = await _page_through(store, 2, repo="mock/a")
+                assert repo_ids == ["s6", "s4", "s2", "s0"]
+                rows, cursor = await store.list_sessions(limit=7)
+                assert len(rows) == 7 and cursor is None
+                assert rows[0]["title"] == "问题 6" and rows[0]["message_count"] == 1
+                assert "messages" not in rows[0]
+        finally:
+            for store in stores:
+                await store.aclose()
+
+    asyncio.run(run())
+
+
+def test_list_sessions_skips_expired():
+    """超过空闲保留时间的会话不出现在列表中"""
+    async def run():
+        store = SqliteSessionStore(os.path.join(tempfile.mkdtemp(), "sessions.db"), idle_ttl=60)
+        try:
+            _fill(store, 3)
+            store._entries["s2"].updated_at = time.time()
+            rows, cursor = await store.list_sessions()
+            assert [row["session_id"] for row in rows] == ["s2"] and cursor is None
+        finally:
+            await store.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+多进程共享状态测试：Gitee 响应缓存与会话存储在工作进程之间共享
+"""
+import asyncio
+import os
+import tempfile
+
+from config import get_settings
+from gitee_client import GiteeClient, create_http_cache
+from session_store import SqliteSessionStore
+from shared_cache import SharedCacheStore
+
+
+def test_workers_share_response_cache(gitee):
+    """两个工作进程的响应缓存挂接同一个共享层，一个进程拉取过的响应另一个直接命中"""
+    async def run():
+        path = os.path.join(tempfile.mkdtemp(), "http_cache.db")
+        settings = get_settings()
+        shared = [SharedCacheStore(path), SharedCacheStore(path)]
+        workers = [GiteeClient(http_cache=create_http_cache(settings, shared=store)) for store in shared]
+        try:
+            requests = gitee.request_count
+            first = await workers[0].get_repo_info("mock", "shared")
+            assert gitee.request_count == requests + 1
+
+            second = await workers[1].get_repo_info("mock", "shared")
+            assert gitee.request_count == requests + 1
+            assert workers[1].http_cache.stats()["shared_hits"] == 1
+            assert first == second
+        finally:
+            for worker in workers:
+                await worker.aclose()
+            for store in shared:
+                store.close()
+
+    asyncio.run(run())
+
+
+def test_workers_share_sessions():
+    """两个工作进程共用 SQLite 会话存储，互相能读到对方追加的消息"""
+    async def run():
+        path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+        first = SqliteSessionStore(path, write_through=True)
+        second = SqliteSessionStore(path, write_through=True)
+        try:
+            session = await first.get_or_create("s1", repo="mock/demo")
+            first.append(session, "user", "入口在哪里？")
+            await first.flush()
+
+            other = await second.get("s1")
+            assert [m.content for m in other.messages] == ["入口在哪里？"]
+            second.append(other, "assistant", "main.py")
+            await second.flush()
+
+            refreshed = await first.get("s1")
+            assert [m.content for m in refreshed.messages] == ["入口在哪里？", "main.py"]
+        finally:
+            await first.aclose()
+            await second.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+相同请求合并测试
+"""
+import asyncio
+
+from gitee_client import GiteeClient
+from singleflight import Singleflight
+
+
+def test_concurrent_calls_share_one_execution():
+    """同一键的并发调用只执行一次，每个调用方拿到各自的副本"""
+    async def run():
+        flights = Singleflight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"items": [1, 2]}
+
+        results = await asyncio.gather(*[flights.do("k", fetch) for _ in range(5)])
+        assert calls == 1
+        results[0]["items"].append(3)
+        assert results[1] == {"items": [1, 2]}
+        assert flights.stats()["coalesced"] == 4
+        assert flights.in_flight == 0
+
+        # 执行结束后到达的调用重新执行
+        await flights.do("k", fetch)
+        assert calls == 2
+
+    asyncio.run(run())
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    """发起方被取消时，其他等待者仍拿到结果"""
+    async def run():
+        flights = Singleflight()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        leader = asyncio.create_task(flights.do("k", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("k", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "ok"
+
+    asyncio.run(run())
+
+
+def test_client_coalesces_identical_requests(gitee):
+    """GiteeClient 的并发相同 GET 只向上游发出一次"""
+    async def run():
+        client = GiteeClient()
+        try:
+            requests = gitee.request_count
+            results = await asyncio.gather(*[client.get_repo_info("mock", "coalesce") for _ in range(10)])
+            assert gitee.request_count == requests + 1
+            assert all(result == results[0] for result in results)
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+仓库快照测试：快照读取与 API 读取一致，快照的打开、关闭与淘汰
+"""
+import asyncio
+import os
+import tempfile
+
+from gitee_client import GiteeClient
+from snapshot import SnapshotStore
+from tools import GiteeTools
+
+
+def test_snapshot_reads_match_api_reads(gitee):
+    """快照模式只下载一次归档，之后的读取不再访问上游，内容与 API 读取一致"""
+    async def run():
+        api_client = GiteeClient()
+        snapshot_client = GiteeClient()
+        try:
+            api_tools = GiteeTools(client=api_client)
+            snapshot_tools = GiteeTools(client=snapshot_client,
+                                        snapshots=SnapshotStore(tempfile.mkdtemp(), 64 * 1024 * 1024))
+            snapshot_tools.enable_snapshot("mock", "demo")
+
+            via_api = await api_tools.get_file_content("mock", "demo", "app/core.py")
+            archives = gitee.archive_count
+            via_snapshot = await snapshot_tools.get_file_content("mock", "demo", "app/core.py")
+            assert gitee.archive_count == archives + 1
+            assert via_snapshot["content"] == via_api["content"]
+
+            requests = gitee.request_count
+            listing = await snapshot_tools.list_directory("mock", "demo", "app")
+            again = await snapshot_tools.get_file_content("mock", "demo", "main.py")
+            assert gitee.request_count == requests
+            assert {item["name"] for item in listing["items"]} == {"__init__.py", "core.py"}
+            assert "app.run()" in again["content"]
+        finally:
+            await api_client.aclose()
+            await snapshot_client.aclose()
+
+    asyncio.run(run())
+
+
+def test_unresolved_ref_falls_back_to_api(gitee):
+    """分支无法解析为提交 SHA 时不创建快照，回退到 API 读取"""
+    async def run():
+        client = GiteeClient()
+        try:
+            directory = tempfile.mkdtemp()
+            tools = GiteeTools(client=client, snapshots=SnapshotStore(directory, 64 * 1024 * 1024))
+            tools.enable_snapshot("mock", "demo")
+
+            archives = gitee.archive_count
+            result = await tools.get_file_content("mock", "demo", "app/core.py", ref="missing-branch")
+            assert "print('hello')" in result["content"]
+            assert gitee.archive_count == archives
+            assert os.listdir(directory) == []
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_concurrent_gets_share_one_download_and_release_locks(gitee):
+    """并发获取同一快照只下载一次，结束后不保留下载锁；关闭时等待后台索引构建停止"""
+    async def run():
+        client = GiteeClient()
+        try:
+            store = SnapshotStore(tempfile.mkdtemp(), 64 * 1024 * 1024)
+            sha = await client.resolve_ref("mock", "demo", None)
+            archives = gitee.archive_count
+            snapshots = await asyncio.gather(*[store.get(client, "mock", "demo", sha) for _ in range(5)])
+            assert gitee.archive_count == archives + 1
+            assert len({id(snapshot) for snapshot in snapshots}) == 1
+            assert store._locks == {}
+
+            snapshot = snapshots[0]
+            index = snapshot.code_index
+            snapshot.close()
+            if index._build_task is not None:
+                await index._build_task
+            await asyncio.sleep(0)
+            assert snapshot._mm.closed
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+链路追踪测试：采样决策、span 父子关系、JSONL 与 OTLP 导出
+"""
+import asyncio
+import json
+import os
+import tempfile
+
+import tracing
+from mock_upstream import start_mock_collector
+
+
+def _with_tracer(tracer: tracing.Tracer, test):
+    """把 tracer 设为进程级追踪器执行 test()，结束时导出剩余 span 并恢复"""
+    async def run():
+        previous, tracing._tracer = tracing._tracer, tracer
+        try:
+            await test()
+        finally:
+            await tracer.aclose()
+            tracing._tracer = previous
+
+    asyncio.run(run())
+
+
+def test_sampling_decision():
+    """按采样率决定根 span；traceparent 标记为未采样时不记录，标记为采样时沿用其 trace ID"""
+    exporter = tracing.JsonlExporter(os.path.join(tempfile.mkdtemp(), "traces.jsonl"))
+    assert tracing.Tracer(0.0, exporter).start_trace("GET /api/x") is None
+    assert tracing.Tracer(1.0, None).start_trace("GET /api/x") is None
+    assert tracing.span("orphan") is tracing.NOOP_SPAN
+
+    partial = tracing.Tracer(0.5, exporter)
+    trace_id, parent_id = "ab" * 16, "cd" * 8
+    assert partial.start_trace("GET /api/x", f"00-{trace_id}-{parent_id}-00") is None
+    root = partial.start_trace("GET /api/x", f"00-{trace_id}-{parent_id}-01")
+    assert (root.trace_id, root.parent_id) == (trace_id, parent_id)
+    sampled = sum(partial.start_trace("GET /api/x") is not None for _ in range(2000))
+    assert 800 < sampled < 1200
+
+
+def test_spans_exported_to_jsonl():
+    """子 span 记录父子关系，并发任务继承父 span；异常标记为失败；start_span 不改变当前 span"""
+    path = os.path.join(tempfile.mkdtemp(), "traces.jsonl")
+
+    async def test():
+        async def tool(name: str):
+            with tracing.span("tool", tool=name):
+                await asyncio.sleep(0)
+
+        with tracing.root_span("job.repo", job_id="j1") as root:
+            with tracing.span("agent.run") as run:
+                await asyncio.gather(tool("get_readme"), tool("list_directory"))
+                try:
+                    with tracing.span("llm.chat"):
+                        raise RuntimeError("超时")
+                except RuntimeError:
+                    pass
+                pending = tracing.start_span("llm.stream", mode="stream")
+                assert tracing.current_span() is run
+                with tracing.activate(pending):
+                    with tracing.span("llm.chunk"):
+                        pass
+                pending.set(chunks=1)
+                pending.end()
+        assert tracing.current_span() is None
+        assert root.end_ns > 0
+
+    _with_tracer(tracing.Tracer(1.0, tracing.JsonlExporter(path)), test)
+    with open(path, encoding="utf-8") as f:
+        spans = {s["name"] + (s["attributes"].get("tool") or ""): s for s in map(json.loads, f)}
+    assert len(spans) == 7
+    root, run = spans["job.repo"], spans["agent.run"]
+    assert root["parent_id"] is None and root["attributes"] == {"job_id": "j1"}
+    assert {s["trace_id"] for s in spans.values()} == {root["trace_id"]}
+    assert run["parent_id"] == root["span_id"]
+    assert spans["toolget_readme"]["parent_id"] == spans["toollist_directory"]["parent_id"] == run["span_id"]
+    assert spans["llm.chat"]["error"] == "RuntimeError: 超时"
+    assert spans["llm.stream"]["parent_id"] == run["span_id"]
+    assert spans["llm.stream"]["attributes"] == {"mode": "stream", "chunks": 1}
+    assert spans["llm.chunk"]["parent_id"] == spans["llm.stream"]["span_id"]
+
+
+def test_spans_exported_to_otlp_collector():
+    """OTLP/HTTP JSON 导出：trace / span ID、父 span 与失败状态"""
+    collector, endpoint = start_mock_collector()
+    try:
+        async def test():
+            with tracing.root_span("GET /api/stats"):
+                with tracing.span("gitee.request", status=200, cached=False):
+                    pass
+                try:
+                    with tracing.span("llm.chat"):
+                        raise ValueError("bad")
+                except ValueError:
+                    pass
+
+        tracer = tracing.Tracer(1.0, tracing.OtlpExporter(endpoint))
+        _with_tracer(tracer, test)
+        assert tracer.stats()["exported"] == 3 and tracer.stats()["errors"] == 0
+        spans = {s["name"]: s for s in collector.spans}
+        root = spans["GET /api/stats"]
+        assert root["parentSpanId"] == "" and root["kind"] == 2
+        assert spans["gitee.request"]["parentSpanId"] == root["spanId"]
+        assert spans["gitee.request"]["attributes"] == [
+            {"key": "status", "value": {"intValue": "200"}},
+            {"key": "cached", "value": {"boolValue": False}},
+        ]
+        assert spans["llm.chat"]["status"] == {"code": 2, "message": "ValueError: bad"}
+        assert {s["traceId"] for s in spans.values()} == {root["traceId"]}
+    finally:
+        collector.shutdown()
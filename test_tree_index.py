@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+目录树索引测试：目录列表与 glob 查找
+"""
+from tree_index import TreeIndex
+
+
+def _index() -> TreeIndex:
+    paths = [
+        "README.md",
+        "setup.py",
+        "src/test_top.py",
+        "src/app.py",
+        "src/pkg/test_mod.py",
+        "src/pkg/deep/test_deep.py",
+        "src/pkg/helper.py",
+        "tests/test_src.py",
+        "docs/index.md",
+    ]
+    return TreeIndex([(path, False, 1, "") for path in paths])
+
+
+def test_glob_star_stays_within_one_segment():
+    """* 不跨越 "/"，** 匹配零或多级目录"""
+    index = _index()
+    assert index.glob("src/*.py") == ["src/app.py", "src/test_top.py"]
+    assert index.glob("src/**/test_*.py") == [
+        "src/pkg/deep/test_deep.py", "src/pkg/test_mod.py", "src/test_top.py"
+    ]
+    assert index.glob("src/*/test_*.py") == ["src/pkg/test_mod.py"]
+    assert index.glob("**/test_*.py") == [
+        "src/pkg/deep/test_deep.py", "src/pkg/test_mod.py", "src/test_top.py", "tests/test_src.py"
+    ]
+    assert index.glob("src/**") == [
+        "src/app.py", "src/pkg/deep/test_deep.py", "src/pkg/helper.py",
+        "src/pkg/test_mod.py", "src/test_top.py"
+    ]
+
+
+def test_glob_without_slash_matches_file_names_anywhere():
+    """不含 "/" 的模式按文件名匹配任意目录"""
+    index = _index()
+    assert index.glob("*.md") == ["README.md", "docs/index.md"]
+    assert index.glob("helper.py") == ["src/pkg/helper.py"]
+    assert index.glob("[!t]*.py") == ["setup.py", "src/app.py", "src/pkg/helper.py"]
+
+
+def test_list_dir_includes_implicit_directories():
+    """上游未显式列出的中间目录也能列出"""
+    index = _index()
+    assert [item["name"] for item in index.list_dir("src")] == ["app.py", "pkg", "test_top.py"]
+    assert index.is_dir("src/pkg/deep")
@@ -0,0 +1,110 @@
+"""
+文件内容解码
+
+仓库中并非都是 UTF-8 文本：二进制文件不应解码后交给 LLM，
+GBK / GB18030 等编码的中文源码也很常见。这里负责识别二进制文件、
+给出大小和类型摘要，并对文本做编码探测后解码。
+"""
+import codecs
+import mimetypes
+from typing import Dict, Any, Optional, Tuple
+
+try:
+    from charset_normalizer import from_bytes as _detect_charset
+except ImportError:  # 可选依赖，缺失时无法识别 UTF-8 / GB18030 以外的编码
+    _detect_charset = None
+
+# 只检查开头这么多字节来判断是否为二进制
+_SNIFF_BYTES = 8192
+# 编码探测只分析开头这么多字节，整份分析大文件要数百毫秒
+_DETECT_BYTES = 64 * 1024
+
+# 常见二进制格式的文件头
+_MAGIC = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"%PDF-", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),
+    (b"\x1f\x8b", "application/gzip"),
+    (b"\x7fELF", "application/x-elf"),
+    (b"MZ", "application/x-msdownload"),
+    (b"\xca\xfe\xba\xbe", "application/java-vm"),
+    (b"\x00asm", "application/wasm"),
+    (b"SQLite format 3\x00", "application/vnd.sqlite3"),
+]
+
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+def sniff_mime(data: bytes, path: str = "") -> Optional[str]:
+    """按文件头或扩展名猜测 MIME 类型"""
+    head = bytes(data[:32])
+    for magic, mime in _MAGIC:
+        if head.startswith(magic):
+            return mime
+    return mimetypes.guess_type(path)[0] if path else None
+
+
+def is_binary(data: bytes) -> bool:
+    """判断内容是否为二进制"""
+    head = bytes(data[:_SNIFF_BYTES])
+    if any(head.startswith(bom) for bom, _ in _BOMS):
+        return False
+    if any(head.startswith(magic) for magic, _ in _MAGIC):
+        return True
+    if b"\0" in head:
+        return True
+    if not head:
+        return False
+    # 控制字符（除常见空白）占比过高也视为二进制
+    control = sum(1 for b in head if b < 32 and b not in (9, 10, 12, 13, 27))
+    return control / len(head) > 0.3
+
+
+def decode_text(data: bytes) -> Tuple[str, str]:
+    """探测编码并解码文本
+
+    Returns:
+        (文本, 编码名)
+    """
+    data = bytes(data)
+    for bom, encoding in _BOMS:
+        if data.startswith(bom):
+            return data.decode(encoding, "replace"), encoding
+    try:
+        return data.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        pass
+    # Gitee 仓库中非 UTF-8 文本多为 GBK / GB18030；短文本的统计探测并不可靠，先严格按 GB18030 尝试
+    try:
+        return data.decode("gb18030"), "gb18030"
+    except UnicodeDecodeError:
+        pass
+
+    if _detect_charset is not None:
+        best = _detect_charset(data[:_DETECT_BYTES]).best()
+        if best is not None and best.encoding:
+            try:
+                return data.decode(best.encoding), best.encoding
+            except (UnicodeDecodeError, LookupError):
+                pass
+    return data.decode("utf-8", "replace"), "utf-8"
+
+
+def binary_summary(data: bytes, path: str = "", size: Optional[int] = None) -> Dict[str, Any]:
+    """二进制文件的摘要，代替文件内容返回给 LLM"""
+    size = len(data) if size is None else size
+    mime = sniff_mime(data, path) or "application/octet-stream"
+    return {
+        "binary": True,
+        "mime": mime,
+        "summary": f"二进制文件（{mime}，{size} 字节），未解码内容"
+    }
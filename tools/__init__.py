@@ -2,5 +2,7 @@
 Agent 工具模块
 """
 from .gitee_tools import GiteeTools
+from .limiter import ToolLimiter
+from .file_window import DecodedFile, DecodedFileCache
 
-__all__ = ['GiteeTools']
+__all__ = ['GiteeTools', 'ToolLimiter', 'DecodedFile', 'DecodedFileCache']
@@ -0,0 +1,214 @@
+"""
+按行窗口读取文件
+
+大文件整份交给 LLM 会消耗数万 token。这里缓存解码后的文本及行偏移，
+按行号区间或匹配位置截取片段，超长内容自动分页；同一文件的多次窗口读取
+只解码一次，也不会产生额外的上游请求。
+"""
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+# around 模式最多返回的匹配片段数
+_MAX_AROUND_MATCHES = 10
+
+
+class DecodedFile:
+    """解码后的文本及每行起始偏移"""
+
+    def __init__(self, text: str, byte_size: Optional[int] = None):
+        """
+        Args:
+            text: 解码后的文本
+            byte_size: 原始字节数，不传时按 UTF-8 编码计算
+        """
+        self.text = text
+        self.byte_size = byte_size if byte_size is not None else len(text.encode("utf-8"))
+        starts = array("q", [0])
+        find = text.find
+        pos = find("\n")
+        while pos >= 0:
+            starts.append(pos + 1)
+            pos = find("\n", pos + 1)
+        if starts[-1] != len(text):
+            starts.append(len(text))
+        # starts[i] 为第 i + 1 行的起始偏移，最后一项为文本末尾
+        self.starts = starts
+
+    @property
+    def line_count(self) -> int:
+        return len(self.starts) - 1
+
+    @property
+    def size(self) -> int:
+        """近似内存占用"""
+        return sys.getsizeof(self.text) + self.starts.itemsize * len(self.starts)
+
+    def line_of(self, offset: int) -> int:
+        """偏移所在的行号（从 1 开始）"""
+        return bisect_right(self.starts, offset)
+
+    def lines(self, start: int, end: int) -> str:
+        """第 start 至 end 行（含两端，从 1 开始）"""
+        return self.text[self.starts[start - 1]:self.starts[end]]
+
+    def fit_end(self, start: int, end: int, max_chars: int) -> int:
+        """从 start 行开始、字符数不超过 max_chars 时最多能读到的行"""
+        limit = self.starts[start - 1] + max_chars
+        return max(start, min(end, bisect_right(self.starts, limit) - 1))
+
+    def fit_tokens(self, start: int, end: int, max_tokens: int, count: Callable[[str], int]) -> int:
+        """从 start 行开始、token 数不超过 max_tokens 时最多能读到的行（至少一行）"""
+        if count(self.lines(start, end)) <= max_tokens:
+            return end
+        lo, hi = start, end - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if count(self.lines(start, mid)) <= max_tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def window(self, start_line: Optional[int], end_line: Optional[int],
+               page_lines: int, max_chars: int, max_tokens: int = 0,
+               count: Optional[Callable[[str], int]] = None) -> Dict[str, Any]:
+        """按行号区间读取，超出 page_lines 行、max_chars 字符或 max_tokens 时截断并给出下一页起点
+
+        max_tokens 大于 0 时用 count 统计内容的 token 数；分页按整行进行，
+        保证逐页读取时每一行都完整返回一次（单行超长时除外）。
+        """
+        total = self.line_count
+        start = min(max(1, start_line or 1), max(total, 1))
+        end = min(total, end_line or total)
+        if end < start:
+            return {"start_line": start, "end_line": start - 1, "content": "", "truncated": False}
+
+        truncated = False
+        if end - start + 1 > page_lines:
+            end = start + page_lines - 1
+            truncated = True
+        fitted = self.fit_end(start, end, max_chars)
+        if fitted < end:
+            end = fitted
+            truncated = True
+        if max_tokens > 0 and count is not None:
+            fitted = self.fit_tokens(start, end, max_tokens, count)
+            if fitted < end:
+                end = fitted
+                truncated = True
+        content = self.lines(start, end)
+        if len(content) > max_chars:
+            # 单行超长（如压缩后的代码）
+            content = content[:max_chars]
+            truncated = True
+        if max_tokens > 0 and count is not None:
+            tokens = count(content)
+            while tokens > max_tokens and content:
+                content = content[:len(content) * max_tokens // tokens]
+                tokens = count(content)
+                truncated = True
+
+        result = {"start_line": start, "end_line": end, "content": content, "truncated": truncated}
+        if end < total:
+            result["next_start_line"] = end + 1
+        return result
+
+    def around(self, keyword: str, context: int, page_lines: int, max_chars: int,
+               max_tokens: int = 0, count: Optional[Callable[[str], int]] = None) -> Dict[str, Any]:
+        """读取包含 keyword 的行及其前后 context 行，相邻片段合并；限额含义同 window
+
+        keyword 按字面量匹配：它来自模型输出，在事件循环上编译执行任意正则
+        可能因回溯耗尽 CPU。
+        """
+        match_lines: List[int] = []
+        find = self.text.find
+        pos = find(keyword) if keyword else -1
+        while pos >= 0 and len(match_lines) < _MAX_AROUND_MATCHES:
+            line = self.line_of(pos)
+            match_lines.append(line)
+            # 同一行只记一次，从下一行开始继续查找
+            pos = find(keyword, self.starts[line]) if line < self.line_count else -1
+
+        ranges: List[Tuple[int, int]] = []
+        for line in match_lines:
+            start = max(1, line - context)
+            end = min(self.line_count, line + context)
+            if ranges and start <= ranges[-1][1] + 1:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+            else:
+                ranges.append((start, end))
+
+        segments = []
+        lines_left = page_lines
+        chars_left = max_chars
+        tokens_left = max_tokens
+        truncated = False
+        for start, end in ranges:
+            if lines_left <= 0 or chars_left <= 0 or (max_tokens > 0 and tokens_left <= 0):
+                truncated = True
+                break
+            segment = self.window(start, end, lines_left, chars_left, tokens_left, count)
+            segment.pop("next_start_line", None)
+            truncated = truncated or segment.pop("truncated")
+            segments.append(segment)
+            lines_left -= segment["end_line"] - segment["start_line"] + 1
+            chars_left -= len(segment["content"])
+            if max_tokens > 0 and count is not None:
+                tokens_left -= count(segment["content"])
+
+        return {"match_lines": match_lines, "segments": segments, "truncated": truncated}
+
+
+class DecodedFileCache:
+    """按字节数限额的解码文本 LRU 缓存
+
+    键为 blob SHA；快照中的文件使用 (快照提交 SHA, 路径)。
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Any, DecodedFile]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[DecodedFile]:
+        with self._lock:
+            decoded = self._entries.get(key)
+            if decoded is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return decoded
+
+    def put(self, key, decoded: DecodedFile):
+        size = decoded.size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.size
+            self._entries[key] = decoded
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
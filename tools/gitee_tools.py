@@ -1,15 +1,86 @@
 """
 Gitee 工具集，供 Agent 使用
 """
-from typing import Dict, Any, List
-from gitee_client import GiteeClient
+import json
+import time
+from typing import Dict, Any, List, Optional, Set, Tuple
+from config import get_settings
+import metrics
+import tracing
+from gitee_client import GiteeClient, is_commit_sha
+from compat import to_thread
+from context_budget import TokenCounter
+from snapshot import Snapshot, SnapshotStore
+from text_decode import is_binary, decode_text, binary_summary
+from .file_window import DecodedFile, DecodedFileCache
+
+# 工具输出中为分页说明、行号等字段预留的 token 数；单页内容至少可用的 token 数
+_PAGE_RESERVE_TOKENS = 300
+_MIN_PAGE_TOKENS = 200
 
 
 class GiteeTools:
     """Gitee 工具集，提供给 Agent 使用的工具函数"""
     
-    def __init__(self):
-        self.client = GiteeClient()
+    def __init__(self, client: Optional[GiteeClient] = None,
+                 snapshots: Optional[SnapshotStore] = None,
+                 decoded_files: Optional[DecodedFileCache] = None):
+        """
+        Args:
+            client: Gitee 客户端
+            snapshots: 快照仓库，启用快照模式的仓库从本地快照读取文件
+            decoded_files: 共享的解码文本缓存；不传时按配置创建私有缓存
+        """
+        settings = get_settings()
+        self.client = client or GiteeClient()
+        self.snapshots = snapshots
+        self.decoded_files = decoded_files or DecodedFileCache(settings.decoded_cache_max_bytes)
+        self.page_lines = settings.file_page_lines
+        self.page_max_chars = settings.file_page_max_chars
+        # 单页按 token 计量，与 Agent 对单条工具输出的上限一致，避免分页内容再被首尾截断
+        self.counter = TokenCounter(settings.openai_model)
+        self.tool_output_max_tokens = settings.tool_output_max_tokens
+        self._snapshot_repos: Set[Tuple[str, str]] = set()
+    
+    def enable_snapshot(self, owner: str, repo: str):
+        """对指定仓库启用快照模式"""
+        if self.snapshots is not None:
+            self._snapshot_repos.add((owner, repo))
+    
+    async def _get_snapshot(self, owner: str, repo: str, ref: Optional[str]) -> Optional[Snapshot]:
+        """获取仓库快照；未启用快照模式或下载失败时返回 None（回退到 API）"""
+        if (owner, repo) not in self._snapshot_repos:
+            return None
+        sha = await self.client.resolve_ref(owner, repo, ref)
+        if not is_commit_sha(sha):
+            # 解析失败时 resolve_ref 返回原分支名，按分支名保存的快照会一直过期
+            return None
+        return await self.snapshots.get(self.client, owner, repo, sha)
+    
+    @staticmethod
+    def _snapshot_file(snapshot: Snapshot, path: str) -> Dict[str, Any]:
+        """从快照读取文件，返回与 API 相同结构的结果"""
+        path = path.strip("/")
+        data = snapshot.read(path)
+        if data is None:
+            if snapshot.is_dir(path):
+                return {"error": f"{path} 是目录，请使用 list_directory"}
+            return {"error": f"文件不存在: {path}"}
+        
+        result = {
+            "path": path,
+            "name": path.rsplit("/", 1)[-1],
+            "size": len(data),
+            "type": "file",
+            "content": "",
+            "sha": None,
+            "url": None
+        }
+        if is_binary(data):
+            result.update(binary_summary(data, path))
+        else:
+            result["content"], result["charset"] = decode_text(data)
+        return result
     
     @staticmethod
     def get_tools_definition() -> List[Dict[str, Any]]:
@@ -40,7 +111,9 @@ class GiteeTools:
                 "type": "function",
                 "function": {
                     "name": "get_file_content",
-                    "description": "读取仓库中指定文件的内容",
+                    "description": "读取仓库中指定文件的内容。返回的 header 包含总行数和大小；"
+                                   "大文件会自动分页，可用 start_line / end_line 读取指定行，"
+                                   "或用 around 只读取匹配位置附近的代码",
                     "parameters": {
                         "type": "object",
                         "properties": {
@@ -58,8 +131,23 @@ class GiteeTools:
                             },
                             "ref": {
                                 "type": "string",
-                                "description": "分支名称，默认为 master",
-                                "default": "master"
+                                "description": "分支名、标签或提交 SHA，不填则使用仓库默认分支"
+                            },
+                            "start_line": {
+                                "type": "integer",
+                                "description": "起始行号（从 1 开始，含）"
+                            },
+                            "end_line": {
+                                "type": "integer",
+                                "description": "结束行号（含）"
+                            },
+                            "around": {
+                                "type": "string",
+                                "description": "关键词（按字面量匹配），只返回包含它的行及其上下文，例如 'def parse_config'"
+                            },
+                            "context": {
+                                "type": "integer",
+                                "description": "around 模式下每个匹配前后附带的行数，默认 20"
                             }
                         },
                         "required": ["owner", "repo", "path"]
@@ -89,14 +177,72 @@ class GiteeTools:
                             },
                             "ref": {
                                 "type": "string",
-                                "description": "分支名称，默认为 master",
-                                "default": "master"
+                                "description": "分支名、标签或提交 SHA，不填则使用仓库默认分支"
+                            }
+                        },
+                        "required": ["owner", "repo"]
+                    }
+                }
+            },
+            {
+                "type": "function",
+                "function": {
+                    "name": "get_repo_outline",
+                    "description": "一次性获取整个仓库的压缩目录概览（各目录的文件数和主要文件类型），用于快速了解仓库结构",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "owner": {
+                                "type": "string",
+                                "description": "仓库所有者用户名"
+                            },
+                            "repo": {
+                                "type": "string",
+                                "description": "仓库名称"
+                            },
+                            "ref": {
+                                "type": "string",
+                                "description": "分支名、标签或提交 SHA，不填则使用仓库默认分支"
+                            },
+                            "max_depth": {
+                                "type": "integer",
+                                "description": "展开的目录层数，默认 3",
+                                "default": 3
                             }
                         },
                         "required": ["owner", "repo"]
                     }
                 }
             },
+            {
+                "type": "function",
+                "function": {
+                    "name": "find_files",
+                    "description": "按 glob 模式查找仓库中的文件路径，例如 '*.py'、'pom.xml'、'src/**/test_*.py'",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "owner": {
+                                "type": "string",
+                                "description": "仓库所有者用户名"
+                            },
+                            "repo": {
+                                "type": "string",
+                                "description": "仓库名称"
+                            },
+                            "pattern": {
+                                "type": "string",
+                                "description": "glob 模式：* 和 ? 不跨越目录，** 匹配零或多级目录；不含 '/' 时按文件名匹配任意目录"
+                            },
+                            "ref": {
+                                "type": "string",
+                                "description": "分支名、标签或提交 SHA，不填则使用仓库默认分支"
+                            }
+                        },
+                        "required": ["owner", "repo", "pattern"]
+                    }
+                }
+            },
             {
                 "type": "function",
                 "function": {
@@ -115,8 +261,7 @@ class GiteeTools:
                             },
                             "ref": {
                                 "type": "string",
-                                "description": "分支名称，默认为 master",
-                                "default": "master"
+                                "description": "分支名、标签或提交 SHA，不填则使用仓库默认分支"
                             }
                         },
                         "required": ["owner", "repo"]
@@ -127,7 +272,7 @@ class GiteeTools:
                 "type": "function",
                 "function": {
                     "name": "search_code",
-                    "description": "在仓库中搜索代码片段或关键词",
+                    "description": "在仓库中搜索代码片段或关键词，快照模式下返回文件、行号和上下文",
                     "parameters": {
                         "type": "object",
                         "properties": {
@@ -142,6 +287,15 @@ class GiteeTools:
                             "repo": {
                                 "type": "string",
                                 "description": "仓库名称"
+                            },
+                            "regex": {
+                                "type": "boolean",
+                                "description": "query 是否为正则表达式（仅快照模式支持），默认 false",
+                                "default": False
+                            },
+                            "ref": {
+                                "type": "string",
+                                "description": "分支名、标签或提交 SHA，不填则使用仓库默认分支"
                             }
                         },
                         "required": ["query", "owner", "repo"]
@@ -207,7 +361,7 @@ class GiteeTools:
             }
         ]
     
-    def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    async def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """执行工具函数
         
         Args:
@@ -217,26 +371,49 @@ class GiteeTools:
         Returns:
             工具执行结果
         """
+        start = time.perf_counter()
+        outcome = "exception"
+        # 模型臆造的工具名归为 unknown，避免标签无限增长
+        label = tool_name if tool_name in _TOOL_NAMES else "unknown"
+        with tracing.span("tool.execute", tool=label) as span:
+            try:
+                result = await self._dispatch(tool_name, arguments)
+                if isinstance(result, dict) and result.get("error"):
+                    outcome = "error"
+                    span.fail(str(result["error"]))
+                else:
+                    outcome = "ok"
+                return result
+            finally:
+                metrics.tool_duration.observe(time.perf_counter() - start, label, outcome)
+                span.set(outcome=outcome)
+    
+    async def _dispatch(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """按名称调用工具函数"""
         if tool_name == "get_repo_info":
-            return self.get_repo_info(**arguments)
+            return await self.get_repo_info(**arguments)
         elif tool_name == "get_file_content":
-            return self.get_file_content(**arguments)
+            return await self.get_file_content(**arguments)
         elif tool_name == "list_directory":
-            return self.list_directory(**arguments)
+            return await self.list_directory(**arguments)
+        elif tool_name == "get_repo_outline":
+            return await self.get_repo_outline(**arguments)
+        elif tool_name == "find_files":
+            return await self.find_files(**arguments)
         elif tool_name == "get_readme":
-            return self.get_readme(**arguments)
+            return await self.get_readme(**arguments)
         elif tool_name == "search_code":
-            return self.search_code(**arguments)
+            return await self.search_code(**arguments)
         elif tool_name == "get_commits":
-            return self.get_commits(**arguments)
+            return await self.get_commits(**arguments)
         elif tool_name == "search_repositories":
-            return self.search_repositories(**arguments)
+            return await self.search_repositories(**arguments)
         else:
             return {"error": f"Unknown tool: {tool_name}"}
     
-    def get_repo_info(self, owner: str, repo: str) -> Dict[str, Any]:
+    async def get_repo_info(self, owner: str, repo: str) -> Dict[str, Any]:
         """获取仓库信息"""
-        result = self.client.get_repo_info(owner, repo)
+        result = await self.client.get_repo_info(owner, repo)
         if result.get("error"):
             return result
         
@@ -256,25 +433,118 @@ class GiteeTools:
             "html_url": result.get("html_url")
         }
     
-    def get_file_content(self, owner: str, repo: str, path: str, ref: str = "master") -> Dict[str, Any]:
-        """读取文件内容"""
-        result = self.client.get_file_content(owner, repo, path, ref)
+    async def _load_file(self, owner: str, repo: str, path: str,
+                         ref: Optional[str]) -> Tuple[Dict[str, Any], Optional[DecodedFile]]:
+        """读取文件元信息及解码后的文本，优先使用解码缓存
+        
+        Returns:
+            (元信息, 解码文本)；出错或不是文本文件时解码文本为 None，元信息中带 error 或 binary / summary 等摘要
+        """
+        path = path.strip("/")
+        snapshot = await self._get_snapshot(owner, repo, ref)
+        if snapshot is not None:
+            key = (snapshot.sha, path)
+            decoded = self.decoded_files.get(key)
+            if decoded is None:
+                result = self._snapshot_file(snapshot, path)
+                if result.get("error") or result.get("binary"):
+                    return result, None
+                decoded = DecodedFile(result.pop("content"), byte_size=result["size"])
+                self.decoded_files.put(key, decoded)
+            meta = {"path": path, "name": path.rsplit("/", 1)[-1], "size": decoded.byte_size,
+                    "type": "file", "sha": None, "url": None}
+            return meta, decoded
+        
+        # 已知 blob SHA 且解码缓存命中时不访问上游
+        ref = await self.client.resolve_ref(owner, repo, ref)
+        sha = self.client.lookup_blob_sha(owner, repo, ref, path)
+        decoded = self.decoded_files.get(sha) if sha else None
+        if decoded is not None:
+            meta = {"path": path, "name": path.rsplit("/", 1)[-1], "size": decoded.byte_size,
+                    "type": "file", "sha": sha, "url": None}
+            return meta, decoded
+        
+        result = await self.client.get_file_content(owner, repo, path, ref)
         if result.get("error"):
-            return result
+            return result, None
         
-        return {
+        meta = {
             "path": result.get("path"),
             "name": result.get("name"),
             "size": result.get("size"),
             "type": result.get("type"),
-            "content": result.get("decoded_content", ""),
             "sha": result.get("sha"),
             "url": result.get("url")
         }
+        if "decoded_content" not in result:
+            # 二进制、过大或无法解码的文件只返回摘要
+            meta["content"] = ""
+            for field in ("binary", "mime", "too_large", "summary", "decode_error"):
+                if field in result:
+                    meta[field] = result[field]
+            return meta, None
+        decoded = DecodedFile(result["decoded_content"], byte_size=result.get("size"))
+        if meta["sha"]:
+            self.decoded_files.put(meta["sha"], decoded)
+        return meta, decoded
     
-    def list_directory(self, owner: str, repo: str, path: str = "", ref: str = "master") -> Dict[str, Any]:
+    def _content_tokens(self, text: str) -> int:
+        """内容序列化为 JSON 字符串后的 token 数（与 Agent 计量工具输出的方式一致）"""
+        return self.counter.count(json.dumps(text, ensure_ascii=False))
+    
+    def _page_tokens(self, result: Dict[str, Any]) -> int:
+        """单页内容可用的 token 数：工具输出上限减去元数据和分页说明占用的部分"""
+        overhead = self.counter.count(json.dumps(result, ensure_ascii=False)) + _PAGE_RESERVE_TOKENS
+        return max(_MIN_PAGE_TOKENS, self.tool_output_max_tokens - overhead)
+    
+    async def get_file_content(self, owner: str, repo: str, path: str, ref: Optional[str] = None,
+                               start_line: Optional[int] = None, end_line: Optional[int] = None,
+                               around: Optional[str] = None, context: int = 20) -> Dict[str, Any]:
+        """读取文件内容
+        
+        默认从第一行开始读取，超过单页上限时自动分页并在结果中给出 next_start_line；
+        指定 around 时只返回匹配行及其上下文。
+        """
+        meta, decoded = await self._load_file(owner, repo, path, ref)
+        if decoded is None:
+            return meta
+        
+        total = decoded.line_count
+        header = f"{meta['path']}：共 {total} 行，{meta['size']} 字节"
+        result = {**meta, "total_lines": total, "header": header}
+        page_tokens = self._page_tokens(result)
+        if around:
+            page_tokens = max(_MIN_PAGE_TOKENS, page_tokens - self.counter.count(around))
+            try:
+                context = max(0, int(context))
+            except (TypeError, ValueError):
+                return {"error": f"context 必须是整数: {context!r}"}
+            window = decoded.around(around, context, self.page_lines, self.page_max_chars,
+                                    page_tokens, self._content_tokens)
+            header += f"；匹配 '{around}' 的行：{window['match_lines'] or '无'}"
+            if window["truncated"]:
+                header += "（片段过多已截断，可用 start_line / end_line 继续读取）"
+            result.update(window)
+        else:
+            window = decoded.window(start_line, end_line, self.page_lines, self.page_max_chars,
+                                    page_tokens, self._content_tokens)
+            header += f"；当前为第 {window['start_line']}-{window['end_line']} 行"
+            if window["truncated"] and window.get("next_start_line"):
+                header += f"，内容较长已分页，继续读取请传 start_line={window['next_start_line']}"
+            result.update(window)
+        result["header"] = header
+        return result
+    
+    async def list_directory(self, owner: str, repo: str, path: str = "", ref: Optional[str] = None) -> Dict[str, Any]:
         """列出目录内容"""
-        result = self.client.list_directory(owner, repo, path, ref)
+        snapshot = await self._get_snapshot(owner, repo, ref)
+        index = None if snapshot is not None else await self.client.get_tree_index(owner, repo, ref)
+        if snapshot is not None:
+            result = snapshot.list_dir(path) or []
+        elif index is not None and (index.is_dir(path) or not index.truncated):
+            result = index.list_dir(path) or []
+        else:
+            result = await self.client.list_directory(owner, repo, path, ref)
         
         items = []
         for item in result:
@@ -292,9 +562,48 @@ class GiteeTools:
             "count": len(items)
         }
     
-    def get_readme(self, owner: str, repo: str, ref: str = "master") -> Dict[str, Any]:
+    async def get_repo_outline(self, owner: str, repo: str, ref: Optional[str] = None,
+                               max_depth: int = 3) -> Dict[str, Any]:
+        """获取整仓目录概览"""
+        index = await self.client.get_tree_index(owner, repo, ref)
+        if index is None:
+            return {"error": "无法获取仓库目录树"}
+        
+        return {
+            "outline": index.outline(max_depth=max_depth),
+            "file_count": index.file_count,
+            "truncated": index.truncated
+        }
+    
+    async def find_files(self, owner: str, repo: str, pattern: str, ref: Optional[str] = None) -> Dict[str, Any]:
+        """按 glob 模式查找文件"""
+        index = await self.client.get_tree_index(owner, repo, ref)
+        if index is None:
+            return {"error": "无法获取仓库目录树"}
+        
+        paths = index.glob(pattern)
+        return {
+            "pattern": pattern,
+            "paths": paths,
+            "count": len(paths)
+        }
+    
+    async def get_readme(self, owner: str, repo: str, ref: Optional[str] = None) -> Dict[str, Any]:
         """获取 README"""
-        result = self.client.get_repo_readme(owner, repo, ref)
+        snapshot = await self._get_snapshot(owner, repo, ref)
+        if snapshot is not None:
+            readme = snapshot.find_readme()
+            if readme is None:
+                return {"error": "仓库中没有 README 文件"}
+            result = self._snapshot_file(snapshot, readme)
+            return {
+                "name": result["name"],
+                "path": result["path"],
+                "content": result["content"],
+                "html_url": None
+            }
+        
+        result = await self.client.get_repo_readme(owner, repo, ref)
         if result.get("error"):
             return result
         
@@ -305,9 +614,15 @@ class GiteeTools:
             "html_url": result.get("html_url")
         }
     
-    def search_code(self, query: str, owner: str, repo: str) -> Dict[str, Any]:
+    async def search_code(self, query: str, owner: str, repo: str, regex: bool = False,
+                          ref: Optional[str] = None) -> Dict[str, Any]:
         """搜索代码"""
-        result = self.client.search_code(query, owner, repo)
+        # 快照模式下使用本地 trigram 索引，不受远程搜索的速率限制
+        snapshot = await self._get_snapshot(owner, repo, ref)
+        if snapshot is not None:
+            return await to_thread(snapshot.code_index.search, query, regex)
+        
+        result = await self.client.search_code(query, owner, repo)
         if result.get("error"):
             return result
         
@@ -325,9 +640,9 @@ class GiteeTools:
             "items": items
         }
     
-    def get_commits(self, owner: str, repo: str, per_page: int = 10) -> Dict[str, Any]:
+    async def get_commits(self, owner: str, repo: str, per_page: int = 10) -> Dict[str, Any]:
         """获取提交历史"""
-        result = self.client.get_repo_commits(owner, repo, per_page=per_page)
+        result = await self.client.get_repo_commits(owner, repo, per_page=per_page)
         
         commits = []
         for commit in result[:per_page]:
@@ -345,10 +660,10 @@ class GiteeTools:
             "count": len(commits)
         }
     
-    def search_repositories(self, query: str, language: str = None, 
+    async def search_repositories(self, query: str, language: str = None, 
                           sort: str = "best_match", per_page: int = 10) -> Dict[str, Any]:
         """搜索仓库"""
-        result = self.client.search_repositories(query, per_page=per_page, language=language, sort=sort)
+        result = await self.client.search_repositories(query, per_page=per_page, language=language, sort=sort)
         if result.get("error"):
             return result
         
@@ -370,3 +685,6 @@ class GiteeTools:
             "repositories": repos,
             "count": len(repos)
         }
+
+
+_TOOL_NAMES = frozenset(tool["function"]["name"] for tool in GiteeTools.get_tools_definition())
@@ -0,0 +1,33 @@
+"""
+工具调用并发限制
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+
+class ToolLimiter:
+    """进程级工具并发限制：全局上限 + 按工具上限"""
+    
+    def __init__(self, max_concurrency: int, per_tool: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            max_concurrency: 全部工具同时执行的上限
+            per_tool: 单个工具同时执行的上限，例如 {"search_code": 2}
+        """
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._per_tool = {
+            name: asyncio.Semaphore(limit) for name, limit in (per_tool or {}).items()
+        }
+    
+    @asynccontextmanager
+    async def slot(self, tool_name: str):
+        """占用一个执行槽位"""
+        tool_semaphore = self._per_tool.get(tool_name)
+        if tool_semaphore is not None:
+            async with tool_semaphore:
+                async with self._global:
+                    yield
+        else:
+            async with self._global:
+                yield
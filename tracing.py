@@ -0,0 +1,450 @@
+"""
+请求级链路追踪
+
+一个请求耗时 90 秒时，/metrics 的分布看不出这次的时间花在了 LLM、Gitee 还是
+Agent 循环本身。这里为被采样的请求记录一棵 span 树：
+1. 每个 HTTP 请求一个根 span（中间件），异步任务执行时另起一个根 span
+2. Agent 运行、每轮迭代、每次 LLM 调用、工具执行和上游 HTTP 请求各为子 span，带工具名、
+   token 数、返回字节数等属性
+3. 当前 span 保存在 contextvar 中，并发执行的工具任务自动继承父 span
+4. 结束的 span 先放入缓冲区，后台按批导出到本地 JSONL 文件或 OTLP/HTTP（JSON）收集器
+5. 按 TRACE_SAMPLE_RATE 在根 span 处决定是否采样；未采样的请求只多一次 contextvar 读取。
+   请求带 W3C traceparent 头且标记为采样时沿用其 trace ID
+"""
+import asyncio
+import contextvars
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Union
+import httpx
+from compat import to_thread
+from config import get_settings
+
+_SERVICE_NAME = "chat2repo"
+# 只追踪 API 请求，静态文件与 /metrics 抓取不记录
+_TRACED_PREFIX = "/api/"
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return f"{random.getrandbits(nbytes * 8):0{nbytes * 2}x}"
+
+
+class Span:
+    """一个计时区间"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error", "_token")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self._token = None
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.fail(exc)
+        _current.reset(self._token)
+        self.end()
+        return False
+
+    def set(self, **attributes):
+        """设置属性，值为 None 的忽略"""
+        for key, value in attributes.items():
+            if value is not None:
+                self.attributes[key] = value
+
+    def fail(self, error: Union[BaseException, str]):
+        """标记为失败"""
+        self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+    def end(self):
+        """结束并交给追踪器导出"""
+        if not self.end_ns:
+            self.end_ns = time.time_ns()
+            tracer = _tracer
+            if tracer is not None:
+                tracer.finish(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """未采样时使用，所有操作为空"""
+
+    trace_id = None
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def fail(self, error):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def current_span() -> Optional[Span]:
+    """当前 span，未采样时为 None"""
+    return _current.get()
+
+
+@contextmanager
+def activate(target: Union[Span, _NoopSpan]) -> Iterator[None]:
+    """在代码块内把已创建的 span 设为当前 span（不结束它）"""
+    if not isinstance(target, Span):
+        yield
+        return
+    token = _current.set(target)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def span(name: str, **attributes) -> Union[Span, _NoopSpan]:
+    """在当前 span 下创建子 span，用作 with 语句时在代码块内设为当前 span，退出时结束"""
+    parent = _current.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace_id, parent.span_id, name, attributes)
+
+
+def start_span(name: str, **attributes) -> Union[Span, _NoopSpan]:
+    """span() 的包装，用于不以 with 语句使用的场景（如跨 yield 的异步生成器）
+
+    创建时不设为当前 span，需要时用 activate()；调用方负责 end()。
+    """
+    return span(name, **attributes)
+
+
+@contextmanager
+def root_span(name: str, traceparent: Optional[str] = None, **attributes) -> Iterator[Union[Span, _NoopSpan]]:
+    """开始一条新的链路（按采样率决定是否记录），代码块内设为当前 span"""
+    root = get_tracer().start_trace(name, traceparent, **attributes)
+    if root is None:
+        token = _current.set(None)
+        try:
+            yield NOOP_SPAN
+        finally:
+            _current.reset(token)
+        return
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        root.end()
+
+
+def _parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """解析 W3C traceparent：返回 (trace_id, parent_id, sampled)"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+# ---- 导出 ----
+
+class JsonlExporter:
+    """每个 span 一行 JSON，追加写入本地文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: List[Dict[str, Any]]):
+        data = "".join(json.dumps(s, ensure_ascii=False, default=str) + "\n" for s in spans)
+        # 一次写入整批，多个工作进程追加同一文件时行不会交错
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpExporter:
+    """以 OTLP/HTTP JSON 格式发送到收集器的 /v1/traces"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self._client = httpx.Client(timeout=timeout)
+
+    @staticmethod
+    def encode(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": _SERVICE_NAME}},
+                {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "chat2repo.tracing"},
+                "spans": [{
+                    "traceId": s["trace_id"],
+                    "spanId": s["span_id"],
+                    "parentSpanId": s["parent_id"] or "",
+                    "name": s["name"],
+                    # SPAN_KIND_SERVER / SPAN_KIND_INTERNAL
+                    "kind": 2 if s["parent_id"] is None else 1,
+                    "startTimeUnixNano": str(s["start_ns"]),
+                    "endTimeUnixNano": str(s["end_ns"]),
+                    "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s["attributes"].items()],
+                    # STATUS_CODE_OK / STATUS_CODE_ERROR
+                    "status": {"code": 2, "message": s["error"]} if s["error"] else {"code": 1},
+                } for s in spans],
+            }],
+        }]}
+
+    def export(self, spans: List[Dict[str, Any]]):
+        response = self._client.post(self.url, json=self.encode(spans))
+        response.raise_for_status()
+
+    def close(self):
+        self._client.close()
+
+
+class Tracer:
+    """采样决策、span 缓冲与后台导出"""
+
+    def __init__(self, sample_rate: float, exporter=None, flush_interval: float = 1.0,
+                 max_buffer: int = 10000):
+        """
+        Args:
+            sample_rate: 根 span 的采样率（0 ~ 1），0 表示关闭
+            exporter: 导出器，提供 export(spans) 和 close()
+            flush_interval: 后台导出的间隔（秒）
+            max_buffer: 缓冲区上限，导出跟不上时丢弃新的 span
+        """
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[Span] = []
+        self._task: Optional[asyncio.Task] = None
+
+        self.traces = 0
+        self.spans = 0
+        self.exported = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None and self.sample_rate > 0
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **attributes) -> Optional[Span]:
+        """按采样率创建根 span，未采样时返回 None"""
+        if self.exporter is None:
+            return None
+        parent = _parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+            if not sampled and self.sample_rate < 1:
+                return None
+        else:
+            if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+                return None
+            trace_id, parent_id = _new_id(16), None
+        self.traces += 1
+        return Span(trace_id, parent_id, name, attributes)
+
+    def finish(self, span: Span):
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        # 序列化推迟到导出线程中进行
+        self._buffer.append(span)
+        self.spans += 1
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # 在空白上下文中创建，不继承启动它的请求的 span（create_task 的 context 参数需要 Python 3.11）
+        self._task = contextvars.Context().run(loop.create_task, self._flush_loop())
+
+    def _export(self, batch: List[Span]):
+        self.exporter.export([span.to_dict() for span in batch])
+
+    async def flush(self):
+        """导出缓冲区中的 span；失败的批次丢弃并计数"""
+        if not self._buffer or self.exporter is None:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            await to_thread(self._export, batch)
+            self.exported += len(batch)
+        except Exception as e:
+            self.errors += 1
+            self.dropped += len(batch)
+            self.last_error = f"导出失败: {e}"
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def aclose(self):
+        """停止后台导出，导出剩余的 span"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        if self.exporter is not None:
+            await to_thread(self.exporter.close)
+
+    def stats(self) -> Dict[str, Any]:
+        """追踪统计"""
+        return {
+            "sample_rate": self.sample_rate,
+            "exporter": type(self.exporter).__name__ if self.exporter is not None else None,
+            "traces": self.traces,
+            "spans": self.spans,
+            "buffered": len(self._buffer),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+class TracingMiddleware:
+    """ASGI 中间件：为每个 API 请求创建根 span
+
+    覆盖整个响应（包括流式响应的发送过程），被采样的请求在响应头中返回 X-Trace-Id。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(_TRACED_PREFIX):
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent")
+        root = get_tracer().start_trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent.decode("latin-1") if traceparent else None,
+            **{"http.method": scope["method"], "http.target": scope["path"]}
+        )
+        if root is None:
+            return await self.app(scope, receive, send)
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                root.set(**{"http.status_code": message["status"]})
+                message = {**message, "headers": list(message.get("headers") or []) + [
+                    (b"x-trace-id", root.trace_id.encode("ascii"))
+                ]}
+            await send(message)
+
+        token = _current.set(root)
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as e:
+            root.fail(e)
+            raise
+        finally:
+            _current.reset(token)
+            endpoint = scope.get("endpoint")
+            if endpoint is not None:
+                root.set(endpoint=getattr(endpoint, "__name__", str(endpoint)))
+                # 路径参数还原为模板（/api/jobs/{job_id}），同一接口的链路同名
+                route = scope["path"]
+                for key, value in (scope.get("path_params") or {}).items():
+                    route = route.replace(f"/{value}", f"/{{{key}}}")
+                root.name = f"{scope['method']} {route}"
+            root.end()
+
+
+def create_tracer(settings) -> Tracer:
+    """按配置创建追踪器"""
+    exporter = None
+    if settings.trace_sample_rate > 0:
+        if settings.trace_exporter == "jsonl":
+            exporter = JsonlExporter(settings.trace_file)
+        elif settings.trace_exporter == "otlp":
+            exporter = OtlpExporter(settings.trace_otlp_endpoint)
+        elif settings.trace_exporter != "none":
+            raise ValueError(f"未知的追踪导出方式: {settings.trace_exporter}")
+    return Tracer(settings.trace_sample_rate, exporter, settings.trace_flush_interval)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """获取进程级追踪器，首次调用时创建"""
+    global _tracer
+    if _tracer is None:
+        _tracer = create_tracer(get_settings())
+    return _tracer
+
+
+async def close_tracer():
+    """导出剩余 span 并关闭进程级追踪器"""
+    global _tracer
+    if _tracer is not None:
+        tracer, _tracer = _tracer, None
+        await tracer.aclose()
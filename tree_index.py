@@ -0,0 +1,268 @@
+"""
+仓库目录树索引
+
+每个 (仓库, 提交) 只递归拉取一次目录树，存为按路径排序的紧凑数组。
+目录列表、存在性检查和 glob 查找都通过二分定位，不再逐级调用 list_directory。
+"""
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple, Pattern
+
+_BLOB = ord("f")
+_TREE = ord("d")
+
+# 路径中 "/" 之后的下一个字符，用于定位某目录全部后代的区间末尾
+_AFTER_SLASH = chr(ord("/") + 1)
+
+
+def _segment_regex(segment: str) -> str:
+    """把单个路径段的 glob 转为正则：* 和 ? 不跨越 "/"，支持 [seq] 与 [!seq]"""
+    out = []
+    i, n = 0, len(segment)
+    while i < n:
+        ch = segment[i]
+        i += 1
+        if ch == "*":
+            while i < n and segment[i] == "*":
+                i += 1
+            out.append("[^/]*")
+        elif ch == "?":
+            out.append("[^/]")
+        elif ch == "[":
+            j = i
+            if j < n and segment[j] == "!":
+                j += 1
+            if j < n and segment[j] == "]":
+                j += 1
+            while j < n and segment[j] != "]":
+                j += 1
+            if j >= n:
+                out.append("\\[")
+                continue
+            body = segment[i:j].replace("\\", "\\\\")
+            if body.startswith("!"):
+                # 取反的字符集同样不匹配 "/"
+                body = "^/" + body[1:]
+            elif body.startswith("^"):
+                body = "\\" + body
+            out.append(f"[{body}]")
+            i = j + 1
+        else:
+            out.append(re.escape(ch))
+    return "".join(out)
+
+
+@lru_cache(maxsize=256)
+def _compile_glob(pattern: str) -> Pattern:
+    """编译 glob 模式：* 只匹配一个路径段内的字符，** 作为完整路径段时匹配零或多级目录"""
+    parts = pattern.split("/")
+    regex = []
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        if part == "**":
+            regex.append(".*" if last else "(?:[^/]+/)*")
+        else:
+            regex.append(_segment_regex(part) + ("" if last else "/"))
+    return re.compile("".join(regex) + r"\Z")
+
+
+class TreeIndex:
+    """按路径排序的目录树索引"""
+
+    def __init__(self, entries: List[Tuple[str, bool, int, str]], truncated: bool = False):
+        """
+        Args:
+            entries: (路径, 是否目录, 大小, blob SHA) 列表
+            truncated: 上游返回的目录树是否被截断
+        """
+        # 补齐上游未显式列出的中间目录
+        known = {path for path, _, _, _ in entries}
+        extra = []
+        for path, _, _, _ in entries:
+            parts = path.split("/")
+            for depth in range(1, len(parts)):
+                parent = "/".join(parts[:depth])
+                if parent not in known:
+                    known.add(parent)
+                    extra.append((parent, True, 0, ""))
+        entries = sorted(entries + extra, key=lambda e: e[0])
+
+        self.paths: List[str] = [e[0] for e in entries]
+        self.kinds = bytearray(_TREE if e[1] else _BLOB for e in entries)
+        self.sizes = array("q", (e[2] for e in entries))
+        # 每个 SHA 以 20 字节存储，目录或未知 SHA 为全零
+        self.shas = bytearray(b"".join(
+            bytes.fromhex(e[3]) if len(e[3]) == 40 else bytes(20) for e in entries
+        ))
+        self.truncated = truncated
+
+    @classmethod
+    def from_tree(cls, tree: Dict[str, Any]) -> "TreeIndex":
+        """从 Gitee git/trees 递归结果构建"""
+        entries = []
+        for item in tree.get("tree", []):
+            path = item.get("path")
+            if not path:
+                continue
+            is_dir = item.get("type") == "tree"
+            entries.append((path, is_dir, item.get("size") or 0, item.get("sha") or ""))
+        return cls(entries, truncated=bool(tree.get("truncated")))
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    @property
+    def file_count(self) -> int:
+        return self.kinds.count(_BLOB)
+
+    def _find(self, path: str) -> int:
+        i = bisect_left(self.paths, path)
+        if i < len(self.paths) and self.paths[i] == path:
+            return i
+        return -1
+
+    def _entry(self, i: int) -> Dict[str, Any]:
+        path = self.paths[i]
+        is_dir = self.kinds[i] == _TREE
+        sha = self.shas[i * 20:(i + 1) * 20]
+        return {
+            "name": path.rsplit("/", 1)[-1],
+            "path": path,
+            "type": "dir" if is_dir else "file",
+            "size": self.sizes[i],
+            "sha": sha.hex() if any(sha) else None
+        }
+
+    def _descendant_range(self, path: str) -> Tuple[int, int]:
+        """目录 path 的全部后代在数组中的区间"""
+        if not path:
+            return 0, len(self.paths)
+        lo = bisect_left(self.paths, path + "/")
+        hi = bisect_left(self.paths, path + _AFTER_SLASH, lo)
+        return lo, hi
+
+    def exists(self, path: str) -> bool:
+        path = path.strip("/")
+        return not path or self._find(path) >= 0
+
+    def is_dir(self, path: str) -> bool:
+        path = path.strip("/")
+        if not path:
+            return True
+        i = self._find(path)
+        return i >= 0 and self.kinds[i] == _TREE
+
+    def blob_sha(self, path: str) -> Optional[str]:
+        """文件的 blob SHA"""
+        i = self._find(path.strip("/"))
+        if i < 0 or self.kinds[i] != _BLOB:
+            return None
+        sha = self.shas[i * 20:(i + 1) * 20]
+        return sha.hex() if any(sha) else None
+
+    def list_dir(self, path: str = "") -> Optional[List[Dict[str, Any]]]:
+        """列出目录的直接子项，目录不存在时返回 None"""
+        path = path.strip("/")
+        if not self.is_dir(path):
+            return None
+        lo, hi = self._descendant_range(path)
+        prefix = f"{path}/" if path else ""
+        items = []
+        i = lo
+        while i < hi:
+            rest = self.paths[i][len(prefix):]
+            slash = rest.find("/")
+            if slash >= 0:
+                # 更深层的后代：直接跳过该子目录的整个区间
+                i = bisect_left(self.paths, prefix + rest[:slash] + _AFTER_SLASH, i, hi)
+                continue
+            items.append(self._entry(i))
+            i += 1
+        return items
+
+    def glob(self, pattern: str, limit: int = 100) -> List[str]:
+        """按 glob 模式查找文件路径
+
+        * 和 ? 只匹配一个路径段内的字符，** 匹配零或多级目录，例如 "src/**/test_*.py"
+        同时匹配 src/test_a.py 和 src/pkg/test_b.py。
+        模式中第一个通配符之前的目录部分用于二分缩小扫描区间。
+        不含 "/" 的模式按文件名匹配任意目录，例如 "*.py"、"pom.xml"。
+        """
+        pattern = pattern.strip("/")
+        matcher = _compile_glob(pattern).match
+        if "/" not in pattern:
+            lo, hi = 0, len(self.paths)
+            match_name = True
+        else:
+            literal = pattern
+            for ch in "*?[":
+                literal = literal.split(ch, 1)[0]
+            prefix = literal.rsplit("/", 1)[0] if "/" in literal else ""
+            lo, hi = self._descendant_range(prefix)
+            match_name = False
+
+        results = []
+        for i in range(lo, hi):
+            if self.kinds[i] != _BLOB:
+                continue
+            path = self.paths[i]
+            target = path.rsplit("/", 1)[-1] if match_name else path
+            if matcher(target):
+                results.append(path)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def outline(self, max_depth: int = 3, max_files_per_dir: int = 8, max_lines: int = 300) -> str:
+        """生成压缩的整仓目录概览
+
+        深度超过 max_depth 的目录只显示文件数和主要扩展名；
+        单个目录文件过多时只列出前 max_files_per_dir 个。
+        """
+        # 每个目录（递归）的文件数和扩展名统计
+        file_counts: Counter = Counter()
+        ext_counts: Dict[str, Counter] = {}
+        for i, path in enumerate(self.paths):
+            if self.kinds[i] != _BLOB:
+                continue
+            name = path.rsplit("/", 1)[-1]
+            ext = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+            parts = path.split("/")
+            for depth in range(len(parts)):
+                directory = "/".join(parts[:depth])
+                file_counts[directory] += 1
+                if ext:
+                    ext_counts.setdefault(directory, Counter())[ext] += 1
+
+        def describe(directory: str) -> str:
+            exts = ext_counts.get(directory)
+            top = ", ".join(f".{ext} {n}" for ext, n in exts.most_common(3)) if exts else ""
+            return f"{file_counts[directory]} 个文件" + (f": {top}" if top else "")
+
+        lines = [f"/ ({describe('')})"]
+
+        def render(directory: str, depth: int):
+            children = self.list_dir(directory) or []
+            files = [c for c in children if c["type"] == "file"]
+            dirs = [c for c in children if c["type"] == "dir"]
+            indent = "  " * depth
+            for child in dirs:
+                if len(lines) >= max_lines:
+                    return
+                lines.append(f"{indent}{child['name']}/ ({describe(child['path'])})")
+                if depth + 1 < max_depth:
+                    render(child["path"], depth + 1)
+            for child in files[:max_files_per_dir]:
+                if len(lines) >= max_lines:
+                    return
+                lines.append(f"{indent}{child['name']}")
+            if len(files) > max_files_per_dir and len(lines) < max_lines:
+                lines.append(f"{indent}... 另有 {len(files) - max_files_per_dir} 个文件")
+
+        render("", 0)
+        if len(lines) >= max_lines:
+            lines.append("... (概览已截断，可用 list_directory 查看具体目录)")
+        return "\n".join(lines)